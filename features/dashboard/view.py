@@ -16,6 +16,14 @@ except Exception:
         # fallback simple en caso extremo (sin TZ)
         from datetime import datetime
         return datetime.now().replace(second=0, microsecond=0)
+try:
+    from shared import seed_new_tasks, ensure_unique_ids
+except Exception:
+    seed_new_tasks = None
+    ensure_unique_ids = None
+
+from utils.css_registry import inject_css
+from utils.fragments import fragment
 
 # 🔐 ACL (para marcar modo editor / solo lectura en tabs específicas)
 try:
@@ -138,7 +146,9 @@ def pull_user_slice_from_sheet(replace_df_main: bool = True):
             df_user = pd.DataFrame()
 
         if replace_df_main:
-            st.session_state["df_main"] = df_user.copy()
+            st.session_state["df_main"] = (
+                ensure_unique_ids(df_user, "Google Sheets") if ensure_unique_ids is not None else df_user.copy()
+            )
 
         st.success("✅ Sincronizado desde Sheet (Sheet → App).")
         st.rerun()
@@ -159,7 +169,7 @@ def _find_hero_asset() -> str | None:
 
 # ---------- Portada opcional (no usada si ya entras logueado) ----------
 def render_bienvenida(on_login=None):
-    st.markdown("""
+    inject_css("bienvenida", """
     <style>
       .hero-wrap{margin-top:8px;padding:16px 18px 6px;border-radius:16px;
                  background:linear-gradient(180deg,rgba(187,146,255,.10) 0%,rgba(187,146,255,.02) 100%);
@@ -170,7 +180,7 @@ def render_bienvenida(on_login=None):
       .hero-btn .stButton>button{height:42px;border-radius:10px;width:100%;}
       .hero-note{font-size:12px;color:#8a8fa0;margin-top:6px;}
     </style>
-    """, unsafe_allow_html=True)
+    """)
 
     st.markdown('<div class="hero-wrap">', unsafe_allow_html=True)
     st.markdown('<div class="hero-title">👋 Bienvenidos — ENI2025</div>', unsafe_allow_html=True)
@@ -231,7 +241,7 @@ def _call_view(mod_path: str, candidates: tuple[str, ...], **kwargs):
 # ---------- Semillas para "Nueva tarea" (se aplican después de la subvista) ----------
 def _apply_new_task_seeds(prev_ids: set[str]):
     """
-    Detecta filas nuevas por Id y aplica:
+    Detecta filas nuevas por Id y les aplica las semillas de alta (shared.seed_new_tasks):
     - Estado = "No iniciado"
     - Fase: si es "Otros" y hay texto en 'Detalle', usa ese texto
     - Fecha/Hora Registro en hora Lima (minutos)
@@ -242,81 +252,15 @@ def _apply_new_task_seeds(prev_ids: set[str]):
     if not isinstance(df, pd.DataFrame) or df.empty:
         return
 
-    if "Id" not in df.columns:
+    if "Id" not in df.columns or seed_new_tasks is None:
         return
 
-    cur_ids = df["Id"].astype(str).fillna("")
-    new_mask = ~cur_ids.isin(prev_ids)
+    new_mask = ~df["Id"].astype(str).isin(prev_ids)
     if not new_mask.any():
         return
 
-    ts = now_lima_trimmed()
-    fecha_reg = ts.date()
-    hora_reg = ts.strftime("%H:%M")
-
-    # Column helpers
-    def _ensure_col(name, default):
-        if name not in df.columns:
-            df[name] = default
-        df[name] = df[name].fillna(default)
-
-    _ensure_col("Estado", "No iniciado")
-    _ensure_col("Prioridad", "Media")
-    _ensure_col("Evaluación", "Sin evaluar")
-    if "Calificación" not in df.columns:
-        df["Calificación"] = 0
-    df["Calificación"] = pd.to_numeric(df["Calificación"], errors="coerce").fillna(0).astype(int)
-
-    if "Fecha Registro" not in df.columns:
-        df["Fecha Registro"] = ""
-    if "Hora Registro" not in df.columns:
-        df["Hora Registro"] = ""
-    if "Fecha inicio" not in df.columns:
-        df["Fecha inicio"] = ""
-
-    if "Fase" not in df.columns:
-        df["Fase"] = ""
-
-    # Posibles nombres de detalle capturados por la subvista
-    detalle_cols = [c for c in ("Detalle", "Detalle de tarea", "Detalle tarea") if c in df.columns]
-
-    for idx in df.index[new_mask]:
-        # Estado
-        if str(df.at[idx, "Estado"]).strip() == "" or str(df.at[idx, "Estado"]).lower() == "nan":
-            df.at[idx, "Estado"] = "No iniciado"
-
-        # Fase (si vino "Otros" y hay detalle)
-        fase_val = str(df.at[idx, "Fase"]).strip()
-        if fase_val.lower() == "otros":
-            detalle_txt = ""
-            for dc in detalle_cols:
-                val = str(df.at[idx, dc]).strip()
-                if val and val.lower() != "nan":
-                    detalle_txt = val
-                    break
-            if detalle_txt:
-                df.at[idx, "Fase"] = detalle_txt  # reemplaza "Otros" por el texto específico
-
-        # Huella de creación
-        if not str(df.at[idx, "Fecha Registro"]).strip():
-            df.at[idx, "Fecha Registro"] = fecha_reg
-        if not str(df.at[idx, "Hora Registro"]).strip():
-            df.at[idx, "Hora Registro"] = hora_reg
-        if not str(df.at[idx, "Fecha inicio"]).strip():
-            df.at[idx, "Fecha inicio"] = df.at[idx, "Fecha Registro"]
-
-        # Defaults útiles
-        if not str(df.at[idx, "Prioridad"]).strip():
-            df.at[idx, "Prioridad"] = "Media"
-        if not str(df.at[idx, "Evaluación"]).strip():
-            df.at[idx, "Evaluación"] = "Sin evaluar"
-        try:
-            df.at[idx, "Calificación"] = int(df.at[idx, "Calificación"])
-        except Exception:
-            df.at[idx, "Calificación"] = 0
-
-    # Persistimos en sesión (misma referencia, pero explícito para claridad)
-    st.session_state["df_main"] = df
+    # Df nuevo (no mutación in-place) → las cachés por versión de df_main se invalidan
+    st.session_state["df_main"] = seed_new_tasks(df, new_mask.to_numpy(), ts=now_lima_trimmed())
 
 # ---------- Preparar "Tareas recientes": asegurar columnas visibles y defaults ----------
 def _prepare_historial_for_display():
@@ -340,6 +284,29 @@ def _prepare_historial_for_display():
     st.session_state["hist_force_cols"] = ["Id", "Responsable", "Tarea", "Fase", "Estado", "Fecha Registro", "Hora Registro"]
 
 # ---------- Vista principal: arma las 6 secciones en pestañas ----------
+# ---------- Pestañas del dashboard (modo perezoso) ----------
+_DASH_TABS = [
+    ("nueva_tarea", "➕ Nueva tarea"),
+    ("editar_estado", "🛠️ Editar estado"),
+    ("nueva_alerta", "🚨 Nueva alerta"),
+    ("prioridad", "🧭 Prioridad"),
+    ("evaluacion", "📝 Evaluación"),
+    ("historial", "🕑 Tareas recientes"),
+]
+_DASH_TAB_KEY = "dash_tab"
+
+def _active_tab() -> str:
+    """
+    Pestaña activa del dashboard (persistida en sesión). st.tabs no informa cuál está
+    visible, así que el selector es un radio horizontal y solo esa subvista se ejecuta.
+    """
+    keys = [key for key, _ in _DASH_TABS]
+    cur = st.session_state.get(_DASH_TAB_KEY)
+    if cur not in keys:
+        cur = keys[0]
+        st.session_state[_DASH_TAB_KEY] = cur
+    return cur
+
 def render_all(user: dict | None = None):
     # ✅ Rehidratar df_main antes de pintar cualquier pestaña
     _ensure_df_main()
@@ -369,17 +336,8 @@ def render_all(user: dict | None = None):
             unsafe_allow_html=True
         )
 
-    tabs = st.tabs([
-        "➕ Nueva tarea",
-        "🛠️ Editar estado",
-        "🚨 Nueva alerta",
-        "🧭 Prioridad",
-        "📝 Evaluación",
-        "🕑 Tareas recientes",
-    ])
-
     # 1) Nueva tarea
-    with tabs[0]:
+    def _tab_nueva_tarea():
         with st.spinner("Cargando 'Nueva tarea'..."):
             # snapshot de Ids antes de que la subvista agregue filas
             df_before = st.session_state.get("df_main", pd.DataFrame())
@@ -395,7 +353,7 @@ def render_all(user: dict | None = None):
             _apply_new_task_seeds(ids_before)
 
     # 2) Editar estado
-    with tabs[1]:
+    def _tab_editar_estado():
         with st.spinner("Cargando 'Editar estado'..."):
             _call_view(
                 "features.editar_estado.view",
@@ -404,7 +362,7 @@ def render_all(user: dict | None = None):
             )
 
     # 3) Nueva alerta
-    with tabs[2]:
+    def _tab_nueva_alerta():
         with st.spinner("Cargando 'Nueva alerta'..."):
             _call_view(
                 "features.nueva_alerta.view",
@@ -413,7 +371,7 @@ def render_all(user: dict | None = None):
             )
 
     # 4) Prioridad (solo lectura para no-editores, pero con filtros)
-    with tabs[3]:
+    def _tab_prioridad():
         if not IS_EDITOR:
             _badge_readonly("🔒 Solo lectura en 'Prioridad'. Puedes filtrar, pero no editar ni guardar.")
         with st.spinner("Cargando 'Prioridad'..."):
@@ -424,7 +382,7 @@ def render_all(user: dict | None = None):
             )
 
     # 5) Evaluación (solo lectura para no-editores, pero con filtros)
-    with tabs[4]:
+    def _tab_evaluacion():
         if not IS_EDITOR:
             _badge_readonly("🔒 Solo lectura en 'Evaluación'. Puedes filtrar, pero no editar ni guardar.")
         with st.spinner("Cargando 'Evaluación'..."):
@@ -435,7 +393,7 @@ def render_all(user: dict | None = None):
             )
 
     # 6) Tareas recientes — sub-vista
-    with tabs[5]:
+    def _tab_historial():
         with st.spinner("Cargando 'Tareas recientes'..."):
             # ✅ asegurar columnas y defaults solicitados antes de pintar la subvista
             _prepare_historial_for_display()
@@ -444,3 +402,34 @@ def render_all(user: dict | None = None):
                 ("render", "render_recientes", "render_tabla", "render_view", "main", "app", "ui"),
                 user=user
             )
+
+    renderers = {
+        "nueva_tarea": _tab_nueva_tarea,
+        "editar_estado": _tab_editar_estado,
+        "nueva_alerta": _tab_nueva_alerta,
+        "prioridad": _tab_prioridad,
+        "evaluacion": _tab_evaluacion,
+        "historial": _tab_historial,
+    }
+
+    # Modo clásico (todas las pestañas se ejecutan en cada rerun)
+    if not st.session_state.get("dash_lazy_tabs", True):
+        tabs = st.tabs([label for _, label in _DASH_TABS])
+        for tab, (key, _) in zip(tabs, _DASH_TABS):
+            with tab:
+                renderers[key]()
+        return
+
+    # ⚡ Modo perezoso: solo se ejecuta la pestaña activa (guardada en sesión)
+    active = _active_tab()
+    labels = dict(_DASH_TABS)
+    st.radio(
+        "Sección",
+        [key for key, _ in _DASH_TABS],
+        format_func=lambda k: labels[k],
+        key=_DASH_TAB_KEY,
+        horizontal=True,
+        label_visibility="collapsed",
+    )
+    # La subvista corre como fragmento: editar su grid no re-ejecuta el resto del script
+    fragment(renderers[active])()
@@ -3,17 +3,24 @@ from __future__ import annotations
 import os
 import re
 import random
-import base64
 import pandas as pd
 import streamlit as st
 from st_aggrid import (
     AgGrid,
     GridOptionsBuilder,
     DataReturnMode,
-    GridUpdateMode,
     JsCode,
 )
 
+from utils.css_registry import inject_css
+from utils.grid_edits import (
+    COMMIT_UPDATE_MODE, commit_button_css, commit_requested, edited_rows, grid_key, render_pending,
+    reset_grid, track_edits,
+)
+from utils.indices import get_facet_index, date_range_mask
+from utils.pages import go_home
+from utils.static_assets import banner_url
+
 # ======= Toggle: Upsert a Google Sheets =======
 DO_SHEETS_UPSERT = bool(st.secrets.get("edit_estado_upsert_to_sheets", True))
 
@@ -29,6 +36,17 @@ except Exception:  # fallback local
     def apply_scope(df, user=None, resp_col="Responsable"):
         return df
 
+# Invariante de Id único en df_main (duplicados resueltos al ingerir)
+try:
+    from shared import ensure_unique_ids, valid_id_mask
+except Exception:
+    def ensure_unique_ids(df, source="", id_col="Id"):
+        return _dedup_keep_last_with_id(df)
+
+    def valid_id_mask(df, id_col="Id"):
+        ids = df[id_col].astype(str).str.strip().str.lower()
+        return ~ids.isin({"", "-", "nan", "none", "null"})
+
 # ========= Utilidades mínimas para zonas horarias =========
 try:
     from zoneinfo import ZoneInfo
@@ -99,6 +117,13 @@ def _canon_str(x) -> str:
     return "" if _is_blank_str(x) else str(x).strip()
 
 
+def _canon_series(s: pd.Series) -> pd.Series:
+    """_canon_str vectorizado; con índice por Id sin duplicados (se conserva el último)."""
+    t = s.astype(str).str.strip()
+    t = t.mask(t.str.lower().isin({"", "-", "nan", "nat", "none", "null"}), "")
+    return t[~t.index.duplicated(keep="last")]
+
+
 def _dedup_keep_last_with_id(df: pd.DataFrame) -> pd.DataFrame:
     """Filtra filas sin Id y quita duplicados por Id (conserva la última)."""
     if df is None or df.empty or "Id" not in df.columns:
@@ -188,9 +213,6 @@ def _sheet_upsert_estado_by_id(df_base: pd.DataFrame, changed_ids: list[str]):
     try:
         if df_base is None or df_base.empty or "Id" not in df_base.columns:
             return
-        df_base = _dedup_keep_last_with_id(df_base.copy())
-        if df_base.empty:
-            return
 
         push_cols_base = [
             "Estado", "Estado actual",
@@ -241,14 +263,13 @@ def render(user: dict | None = None):
     ):
         df_local = _load_local_if_exists()
         if isinstance(df_local, pd.DataFrame) and not df_local.empty:
-            st.session_state["df_main"] = df_local.copy()
+            st.session_state["df_main"] = ensure_unique_ids(df_local, "el archivo local")
 
     # 👉 Div envoltorio de la sección
     st.markdown('<div id="est-section">', unsafe_allow_html=True)
 
     # ====== CSS de la sección Editar estado ======
-    st.markdown(
-        """
+    inject_css("editar_estado", """
     <style>
       #est-section {
         margin-top: 0 !important;
@@ -386,9 +407,7 @@ def render(user: dict | None = None):
         vertical-align: middle !important;
       }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """)
 
 
     # ==== Contenedor principal de la sección ====
@@ -397,13 +416,11 @@ def render(user: dict | None = None):
     # ==== Encabezado azul-lila con imagen a la derecha ====
     img_block = ""
     try:
-        img_path = os.path.join("assets", "NUEVA_TAREA.png")
-        if os.path.exists(img_path):
-            with open(img_path, "rb") as f:
-                img_b64 = base64.b64encode(f.read()).decode("utf-8")
+        img_url = banner_url("nueva_tarea")
+        if img_url:
             img_block = f"""
             <div style="flex:0 0 auto; text-align:right;">
-              <img src="data:image/png;base64,{img_b64}" style="max-height:90px; width:auto;" />
+              <img src="{img_url}" style="max-height:90px; width:auto;" />
             </div>
             """
     except Exception:
@@ -443,9 +460,9 @@ def render(user: dict | None = None):
                 unsafe_allow_html=True,
             )
 
-    # ================== Base global (LIMPIA y sin duplicados) ==================
+    # ================== Base global (Ids únicos por invariante de df_main) ==================
     df_all = st.session_state.get("df_main", pd.DataFrame()).copy()
-    df_all = _dedup_keep_last_with_id(df_all)
+    _n_cols_before = len(df_all.columns)
 
     # Alias...
     if "Tipo de tarea" not in df_all.columns and "Tipo" in df_all.columns:
@@ -464,7 +481,11 @@ def render(user: dict | None = None):
         if need not in df_all.columns:
             df_all[need] = ""
 
-    st.session_state["df_main"] = df_all.copy()
+    # Solo se reescribe df_main si se agregaron columnas (no en cada rerun)
+    if len(df_all.columns) != _n_cols_before:
+        st.session_state["df_main"] = df_all.copy()
+    if "Id" in df_all.columns:
+        df_all = df_all[valid_id_mask(df_all).to_numpy()]
 
     # 🔐 ACL
     me = _display_name().strip()
@@ -513,36 +534,17 @@ def render(user: dict | None = None):
         unsafe_allow_html=True,
     )
 
+    fx = get_facet_index(
+        df_all, ["Responsable", "Fase", "Tipo de tarea"], key=f"editar_estado:{is_super}:{me}"
+    )
+
     if is_super:
         r1_c1, r1_c2, r1_c3, r1_c4 = st.columns(4, gap="medium")
         r2_c1, r2_c2, r2_c3, r2_c4 = st.columns(4, gap="medium")
 
-        resp_all = sorted(
-            [
-                x
-                for x in df_all.get("Responsable", pd.Series([], dtype=str)).astype(str).unique()
-                if x and x != "nan"
-            ]
-        )
-        est_resp = r1_c1.selectbox("Responsable", ["Todos"] + resp_all, index=0, key="est_resp_v4")
-
-        fases_all = sorted(
-            [
-                x
-                for x in df_all.get("Fase", pd.Series([], dtype=str)).astype(str).unique()
-                if x and x != "nan"
-            ]
-        )
-        est_fase = r1_c2.selectbox("Fase", ["Todas"] + fases_all, index=0, key="est_fase_v4")
-
-        tipos_all = sorted(
-            [
-                x
-                for x in df_all.get("Tipo de tarea", pd.Series([], dtype=str)).astype(str).unique()
-                if x and x != "nan"
-            ]
-        )
-        est_tipo = r1_c3.selectbox("Tipo de tarea", ["Todos"] + tipos_all, index=0, key="est_tipo_v4")
+        est_resp = r1_c1.selectbox("Responsable", ["Todos"] + fx.options("Responsable"), index=0, key="est_resp_v4")
+        est_fase = r1_c2.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0, key="est_fase_v4")
+        est_tipo = r1_c3.selectbox("Tipo de tarea", ["Todos"] + fx.options("Tipo de tarea"), index=0, key="est_tipo_v4")
 
         estado_opts_labels = ["Todos"] + [estado_labels[e] for e in estados_catalogo]
         sel_label = r1_c4.selectbox("Estado actual", estado_opts_labels, index=0, key="est_estado_v4")
@@ -573,23 +575,8 @@ def render(user: dict | None = None):
 
         est_resp = "Todos"
 
-        fases_all = sorted(
-            [
-                x
-                for x in df_all.get("Fase", pd.Series([], dtype=str)).astype(str).unique()
-                if x and x != "nan"
-            ]
-        )
-        est_fase = r1_c1.selectbox("Fase", ["Todas"] + fases_all, index=0, key="est_fase_v4_nosuper")
-
-        tipos_all = sorted(
-            [
-                x
-                for x in df_all.get("Tipo de tarea", pd.Series([], dtype=str)).astype(str).unique()
-                if x and x != "nan"
-            ]
-        )
-        est_tipo = r1_c2.selectbox("Tipo de tarea", ["Todos"] + tipos_all, index=0, key="est_tipo_v4_nosuper")
+        est_fase = r1_c1.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0, key="est_fase_v4_nosuper")
+        est_tipo = r1_c2.selectbox("Tipo de tarea", ["Todos"] + fx.options("Tipo de tarea"), index=0, key="est_tipo_v4_nosuper")
 
         estado_opts_labels = ["Todos"] + [estado_labels[e] for e in estados_catalogo]
         sel_label = r1_c3.selectbox("Estado actual", estado_opts_labels, index=0, key="est_estado_v4_nosuper")
@@ -656,7 +643,7 @@ def render(user: dict | None = None):
             except Exception:
                 st.experimental_set_query_params(**clean_params)
 
-            st.rerun()
+            go_home()
 
     with col_buscar:
         st.button("🔍 Buscar", use_container_width=True, key="est_buscar_v4")
@@ -677,29 +664,20 @@ def render(user: dict | None = None):
         estado_calc = saved.where(~saved.isin(["", "nan", "NaN", "None"]), estado_calc)
     df_tasks["_ESTADO_EFECTIVO_"] = estado_calc
 
-    # Siempre filtramos según los valores actuales
-    if is_super and est_resp != "Todos" and "Responsable" in df_tasks.columns:
-        df_tasks = df_tasks[df_tasks["Responsable"].astype(str) == est_resp]
-
-    if est_fase != "Todas" and "Fase" in df_tasks.columns:
-        df_tasks = df_tasks[df_tasks["Fase"].astype(str) == est_fase]
-
-    if est_tipo != "Todos" and "Tipo de tarea" in df_tasks.columns:
-        df_tasks = df_tasks[df_tasks["Tipo de tarea"].astype(str) == est_tipo]
+    # Siempre filtramos según los valores actuales (df_tasks sigue alineado con df_all aquí)
+    df_tasks = df_tasks[fx.mask({
+        "Responsable": est_resp if is_super else "Todos",
+        "Fase": est_fase,
+        "Tipo de tarea": est_tipo,
+    })]
 
     if est_estado != "Todos":
         df_tasks = df_tasks[df_tasks["_ESTADO_EFECTIVO_"].astype(str) == est_estado]
 
-    fcol = pd.to_datetime(df_tasks.get("Fecha Registro", pd.Series([], dtype=object)), errors="coerce")
-    if est_desde:
-        df_tasks = df_tasks[fcol >= pd.to_datetime(est_desde)]
-    if est_hasta:
-        df_tasks = df_tasks[
-            fcol <= (pd.to_datetime(est_hasta) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
-        ]
-
-    # Solo con Id válida
-    df_tasks = _dedup_keep_last_with_id(df_tasks)
+    # Rango por Fecha Registro vía índice ordenado compartido (sin fecha = fuera del rango)
+    df_tasks = df_tasks[
+        date_range_mask(df_tasks, "Fecha Registro", est_desde or None, est_hasta or None, include_nat=False)
+    ]
 
     # ===== Tabla "Resultados" =====
     st.markdown("**Resultados**")
@@ -1045,26 +1023,32 @@ def render(user: dict | None = None):
 
     grid_opts = gob.build()
     grid_opts["onCellValueChanged"] = on_cell_changed.js_code
+    df_view, grid_opts = track_edits(df_view, grid_opts)
 
     grid = AgGrid(
         df_view,
         gridOptions=grid_opts,
         data_return_mode=DataReturnMode.AS_INPUT,
-        update_mode=GridUpdateMode.VALUE_CHANGED,
+        update_mode=COMMIT_UPDATE_MODE,  # sesión de edición: sin rerun por celda
         fit_columns_on_grid_load=False,
         enable_enterprise_modules=False,
         reload_data=False,
         height=430,
         allow_unsafe_jscode=True,
         theme="balham",
+        custom_css=commit_button_css("💾 Guardar"),
+        key=grid_key("grid_editar_estado"),
     )
 
-    # ===== Guardar cambios =====
-    _, u2 = st.columns([A + Fw + T_width + D + R, C], gap="medium")
+    # ===== Guardar cambios: el botón del grid envía y guarda en un solo clic =====
+    u1, u2 = st.columns([A + Fw + T_width + D + R, C], gap="medium")
+    with u1:
+        render_pending(grid, "💾 Guardar")
     with u2:
-        if st.button("💾 Guardar", use_container_width=True, key="est_guardar_inline_v4"):
+        if commit_requested(grid, "grid_editar_estado"):
             try:
-                grid_data = pd.DataFrame(grid.get("data", []))
+                # Solo filas con celdas editadas en el cliente
+                grid_data = edited_rows(grid)
                 if grid_data.empty or "Id" not in grid_data.columns:
                     st.info("No hay cambios para guardar.")
                     return
@@ -1112,7 +1096,7 @@ def render(user: dict | None = None):
                 if full_before.empty or "Id" not in full_before.columns:
                     st.warning("No hay base para actualizar.")
                     return
-                full_before["Id"] = full_before["Id"].astype(str)
+                full_before["Id"] = full_before["Id"].where(full_before["Id"].isna(), full_before["Id"].astype(str))
 
                 base = full_before.copy()
                 me = _display_name().strip()
@@ -1150,47 +1134,34 @@ def render(user: dict | None = None):
                                     base.at[idx_base, "Id"] = nid
                                     new_ids.append(nid)
 
-                base = _dedup_keep_last_with_id(base)
-                ids_ok = [i for i in ids_view if i in set(base["Id"].astype(str))]
+                # df_main ya trae Ids únicos; base solo se usa como consulta (base_idx) y
+                # las filas sin Id se conservan en df_main (full_before).
+                ids_ok = [i for i in ids_view if i in set(base["Id"].dropna().astype(str))]
 
                 if not is_super_local:
-                    cur_start = base.groupby("Id", as_index=True)["Fecha inicio"].last().map(_canon_str)
-                    cur_start_alias = base.groupby("Id", as_index=True)["Fecha de inicio"].last().map(_canon_str)
-
-                    def _has_start(i):
-                        return bool(
-                            _canon_str(cur_start.get(i, ""))
-                            or _canon_str(cur_start_alias.get(i, ""))
-                            or _canon_str(fi_new_vis.get(i, ""))
-                        )
+                    # Validaciones como máscaras sobre ids_ok (base ya deduplicada por Id)
+                    ids_ok_idx = pd.Index(ids_ok)
+                    b_i = base.set_index("Id")
 
-                    bad_term = [
-                        i for i in ids_ok if (_canon_str(ft_new_vis.get(i, "")) and not _has_start(i))
-                    ]
-                    if bad_term:
+                    def _cur(col: str) -> pd.Series:
+                        return _canon_series(b_i[col]).reindex(ids_ok_idx, fill_value="")
+
+                    def _new(s: pd.Series) -> pd.Series:
+                        return _canon_series(s).reindex(ids_ok_idx, fill_value="")
+
+                    has_start = (_cur("Fecha inicio") != "") | (_cur("Fecha de inicio") != "") | (_new(fi_new_vis) != "")
+                    bad_term = ids_ok_idx[((_new(ft_new_vis) != "") & ~has_start).to_numpy()]
+                    if len(bad_term):
                         st.warning("No puedes registrar 'Fecha terminada' sin 'Fecha de inicio' en algunas tareas.")
-                        for i in bad_term:
-                            ft_new_vis[i] = ""
-                            ht_new[i] = ""
-
-                    cur_end = base.groupby("Id", as_index=True)["Fecha terminada"].last().map(_canon_str)
-                    cur_end_alias = base.groupby("Id", as_index=True)["Fecha Terminado"].last().map(_canon_str)
-
-                    def _has_end(i):
-                        return bool(
-                            _canon_str(cur_end.get(i, ""))
-                            or _canon_str(cur_end_alias.get(i, ""))
-                            or _canon_str(ft_new_vis.get(i, ""))
-                        )
+                        ft_new_vis[ft_new_vis.index.isin(bad_term)] = ""
+                        ht_new[ht_new.index.isin(bad_term)] = ""
 
-                    bad_del = [
-                        i for i in ids_ok if (_canon_str(fe_new_vis.get(i, "")) and not _has_end(i))
-                    ]
-                    if bad_del:
+                    has_end = (_cur("Fecha terminada") != "") | (_cur("Fecha Terminado") != "") | (_new(ft_new_vis) != "")
+                    bad_del = ids_ok_idx[((_new(fe_new_vis) != "") & ~has_end).to_numpy()]
+                    if len(bad_del):
                         st.warning("No puedes registrar 'Fecha eliminada' sin 'Fecha terminada' en algunas tareas.")
-                        for i in bad_del:
-                            fe_new_vis[i] = ""
-                            he_new[i] = ""
+                        fe_new_vis[fe_new_vis.index.isin(bad_del)] = ""
+                        he_new[he_new.index.isin(bad_del)] = ""
 
                 h_now = _now_lima_trimmed_local().strftime("%H:%M")
 
@@ -1391,12 +1362,12 @@ def render(user: dict | None = None):
                     for col in cols_apply:
                         if col not in full_updated.columns:
                             full_updated[col] = ""
-                    for i in changed_ids:
-                        if i in base_idx.index:
-                            for col in cols_apply:
-                                val = base_idx.at[i, col]
-                                full_updated.loc[full_updated["Id"].astype(str) == i, col] = val
-                    full_updated = _dedup_keep_last_with_id(full_updated)
+                    # Merge por Id: todo el lote de cambios en un solo update (Ids ya únicos)
+                    col_order = list(full_updated.columns)
+                    upd = base_idx.loc[base_idx.index.intersection(list(changed_ids)), cols_apply]
+                    fu = full_updated.set_index("Id")
+                    fu.update(upd)
+                    full_updated = fu.reset_index()[col_order]
 
                 st.session_state["df_main"] = full_updated.copy()
 
@@ -1419,6 +1390,7 @@ def render(user: dict | None = None):
 
                 if res.get("ok", False):
                     st.success(res.get("msg", "Cambios guardados."))
+                    reset_grid("grid_editar_estado")
                     st.rerun()
                 else:
                     st.info(res.get("msg", "Guardado deshabilitado."))
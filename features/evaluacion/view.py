@@ -4,6 +4,13 @@ import pandas as pd
 import streamlit as st
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode, JsCode
 
+from utils.css_registry import inject_css
+from utils.grid_edits import (
+    COMMIT_UPDATE_MODE, commit_button_css, commit_requested, edited_cells, grid_key, render_pending,
+    reset_grid, track_edits,
+)
+from utils.indices import get_facet_index, date_range_mask
+
 # ✅ Google Sheets helpers (solo Sheets: leer/escribir)
 try:
     from utils.gsheets import (
@@ -23,6 +30,13 @@ except Exception:
     def apply_scope(df, user=None):
         return df  # fallback no-op
 
+# Invariante de Id único: duplicados de la hoja se resuelven al ingerir
+try:
+    from shared import ensure_unique_ids  # type: ignore
+except Exception:
+    def ensure_unique_ids(df, source="", id_col="Id"):
+        return df
+
 
 def _get_display_name() -> str:
     acl_user = st.session_state.get("acl_user", {}) or {}
@@ -129,8 +143,7 @@ def render(user: dict | None = None):
 
         # --- contenedor local + css (botón, headers 600, colores y estrellas) ---
         st.markdown('<div id="eva-section">', unsafe_allow_html=True)
-        st.markdown(
-            """
+        inject_css("evaluacion", """
         <style>
           #eva-section .stButton > button { width: 100% !important; }
           .section-eva .help-strip-eval + .form-card{ margin-top: 6px !important; }
@@ -198,14 +211,12 @@ def render(user: dict | None = None):
             background-color:transparent;
           }
         </style>
-        """,
-            unsafe_allow_html=True,
-        )
+        """)
 
         # ====== DATA BASE (solo Sheets). Si no hay df_main, cargo de Sheets. ======
         df_main = st.session_state.get("df_main")
         if df_main is None or not isinstance(df_main, pd.DataFrame) or df_main.empty:
-            st.session_state["df_main"] = _load_from_sheets()
+            st.session_state["df_main"] = ensure_unique_ids(_load_from_sheets(), "Google Sheets")
 
         df_all = st.session_state.get("df_main", pd.DataFrame()).copy()
         if df_all.empty:
@@ -229,6 +240,7 @@ def render(user: dict | None = None):
         # 🔒 VISIBILIDAD por usuario: solo Vivi/Enrique ven todo; el resto solo lo suyo.
         IS_SUPER_VIEWER = _is_super_viewer(user=user)
         me = _get_display_name().strip()
+        ver_todas = False
         if not IS_SUPER_VIEWER:
             df_all = apply_scope(df_all, user=st.session_state.get("acl_user"))
             if "Responsable" in df_all.columns and me:
@@ -345,27 +357,12 @@ def render(user: dict | None = None):
                 )
                 c_resp = None
 
-            fases_all = sorted(
-                [
-                    x
-                    for x in df_all.get("Fase", pd.Series([], dtype=str))
-                    .astype(str)
-                    .unique()
-                    if x and x != "nan"
-                ]
+            fx = get_facet_index(
+                df_all, ["Responsable", "Fase", "Tipo de tarea", "_ESTADO_EVAL_"],
+                key=f"evaluacion:{IS_SUPER_VIEWER}:{ver_todas}:{me}",
             )
-            eva_fase = c_fase.selectbox("Fase", ["Todas"] + fases_all, index=0)
-
-            tipos_all = sorted(
-                [
-                    x
-                    for x in df_all.get("Tipo de tarea", pd.Series([], dtype=str))
-                    .astype(str)
-                    .unique()
-                    if x and x != "nan"
-                ]
-            )
-            eva_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + tipos_all, index=0)
+            eva_fase = c_fase.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0)
+            eva_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + fx.options("Tipo de tarea"), index=0)
 
             estado_labels = {
                 "No iniciado": "⏳ No iniciado",
@@ -384,25 +381,8 @@ def render(user: dict | None = None):
             )
 
             if IS_SUPER_VIEWER:
-                df_resp_src = df_all.copy()
-                if eva_fase != "Todas" and "Fase" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[
-                        df_resp_src["Fase"].astype(str) == eva_fase
-                    ]
-                if eva_tipo != "Todos" and "Tipo de tarea" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[
-                        df_resp_src["Tipo de tarea"].astype(str) == eva_tipo
-                    ]
-                responsables_all = sorted(
-                    [
-                        x
-                        for x in df_resp_src.get(
-                            "Responsable", pd.Series([], dtype=str)
-                        )
-                        .astype(str)
-                        .unique()
-                        if x and x != "nan"
-                    ]
+                responsables_all = fx.options(
+                    "Responsable", {"Fase": eva_fase, "Tipo de tarea": eva_tipo}
                 )
                 eva_resp = c_resp.selectbox(
                     "Responsable", ["Todos"] + responsables_all, index=0
@@ -434,51 +414,30 @@ def render(user: dict | None = None):
         # ===== Filtrado para tabla =====
         df_filtrado = df_all.copy()
         if eva_do_buscar:
-            if IS_SUPER_VIEWER and eva_resp != "Todos" and "Responsable" in df_filtrado.columns:
-                df_filtrado = df_filtrado[
-                    df_filtrado["Responsable"].astype(str) == eva_resp
-                ]
-            if eva_fase != "Todas" and "Fase" in df_filtrado.columns:
-                df_filtrado = df_filtrado[
-                    df_filtrado["Fase"].astype(str) == eva_fase
-                ]
-            if eva_tipo != "Todos" and "Tipo de tarea" in df_filtrado.columns:
-                df_filtrado = df_filtrado[
-                    df_filtrado["Tipo de tarea"].astype(str) == eva_tipo
-                ]
-            if eva_estado != "Todos" and "_ESTADO_EVAL_" in df_filtrado.columns:
-                df_filtrado = df_filtrado[
-                    df_filtrado["_ESTADO_EVAL_"].astype(str) == eva_estado
-                ]
-
-            # Fecha base
-            if "Fecha inicio" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha inicio"], errors="coerce")
-            elif "Fecha de inicio" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha de inicio"], errors="coerce")
-            elif "Fecha Vencimiento" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha Vencimiento"], errors="coerce")
-            elif "Fecha Registro" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha Registro"], errors="coerce")
-            else:
-                fcol = pd.to_datetime(
-                    df_filtrado.get("Fecha", pd.Series([], dtype=str)),
-                    errors="coerce",
-                )
-
-            if eva_desde is not None:
-                df_filtrado = df_filtrado[
-                    fcol.isna() | (fcol >= pd.to_datetime(eva_desde))
-                ]
-            if eva_hasta is not None:
-                limite = (
-                    pd.to_datetime(eva_hasta)
-                    + pd.Timedelta(days=1)
-                    - pd.Timedelta(seconds=1)
+            df_filtrado = fx.filter(
+                df_all,
+                {
+                    "Responsable": eva_resp if IS_SUPER_VIEWER else "Todos",
+                    "Fase": eva_fase,
+                    "Tipo de tarea": eva_tipo,
+                    "_ESTADO_EVAL_": eva_estado,
+                },
+            ).copy()
+
+            # Fecha base (índice ordenado compartido; sin fecha = se conserva)
+            fcol_name = next(
+                (
+                    c
+                    for c in ["Fecha inicio", "Fecha de inicio", "Fecha Vencimiento", "Fecha Registro"]
+                    if c in df_filtrado.columns
+                ),
+                "Fecha",
+            )
+            df_filtrado = df_filtrado[
+                date_range_mask(
+                    df_filtrado, fcol_name, eva_desde, eva_hasta, include_nat=True
                 )
-                df_filtrado = df_filtrado[
-                    fcol.isna() | (fcol <= limite)
-                ]
+            ]
 
         # ===== Tabla de Evaluación =====
         st.markdown("**Resultados**")
@@ -661,33 +620,35 @@ def render(user: dict | None = None):
             ".ag-cell": {"white-space": "nowrap !important"},
         }
 
+        df_view, grid_opts_eval = track_edits(df_view, gob.build())
         grid_eval = AgGrid(
             df_view,
-            gridOptions=gob.build(),
+            gridOptions=grid_opts_eval,
             data_return_mode=DataReturnMode.FILTERED_AND_SORTED,
-            update_mode=GridUpdateMode.VALUE_CHANGED,
+            update_mode=COMMIT_UPDATE_MODE if IS_EDITOR else GridUpdateMode.NO_UPDATE,
             fit_columns_on_grid_load=False,
             enable_enterprise_modules=False,
             allow_unsafe_jscode=True,
             reload_data=False,
             theme="alpine",
             height=380,
-            custom_css=custom_css_eval,
-            key="grid_evaluacion",
+            custom_css={**custom_css_eval, **commit_button_css("✅ Evaluar")},
+            key=grid_key("grid_evaluacion"),
         )
 
-        # ===== 🔐 Acción: solo botón Evaluar (persistir SOLO en Sheets) =====
+        # ===== 🔐 Acción: el botón «Evaluar» del grid envía y guarda (persistir SOLO en Sheets) =====
         _sp_eva, _btns_eva = st.columns([A + Fw + T_width + D + R, C], gap="medium")
+        if IS_EDITOR:
+            with _sp_eva:
+                render_pending(grid_eval, "✅ Evaluar")
         with _btns_eva:
-            if IS_EDITOR:
-                click_eval = st.button("✅ Evaluar", use_container_width=True, key="eva_guardar_v1")
-            else:
-                click_eval = False
+            click_eval = IS_EDITOR and commit_requested(grid_eval, "grid_evaluacion")
 
         if IS_EDITOR and click_eval:
             try:
-                edited = pd.DataFrame(grid_eval.get("data", []))
-                if edited.empty or "Id" not in edited.columns:
+                # Solo celdas editadas en el cliente: {Id: {col: valor}}
+                deltas = edited_cells(grid_eval, cols={"Evaluación", "Calificación", "Comentarios"})
+                if not deltas:
                     st.info("No hay filas para actualizar.")
                 else:
                     df_base = st.session_state.get("df_main", pd.DataFrame()).copy()
@@ -712,48 +673,34 @@ def render(user: dict | None = None):
                             "Sin evaluar": "Sin evaluar",
                             "": "Sin evaluar",
                         }
+                        normalizers = {
+                            "Evaluación": lambda s: s.astype(str).str.strip().map(EVA_TO_TEXT).fillna("Sin evaluar"),
+                            "Calificación": lambda s: pd.to_numeric(s, errors="coerce").fillna(0).clip(0, 5).astype(int),
+                            "Comentarios": lambda s: s.fillna("").astype(str).str.strip(),
+                        }
 
-                        cambios = 0
-                        changed_ids: set[str] = set()
-
-                        for _, row in edited.iterrows():
-                            id_row = str(row.get("Id", "")).strip()
-                            if not id_row:
-                                continue
-                            m = df_base["Id"].astype(str).str.strip() == id_row
-                            if not m.any():
-                                continue
+                        base_ids = df_base["Id"].astype(str).str.strip()
+                        known_ids = set(base_ids)
 
-                            eva_ui = str(row.get("Evaluación", "Sin evaluar")).strip()
-                            eva_new = EVA_TO_TEXT.get(eva_ui, "Sin evaluar")
+                        # Valores previos = primera fila de cada Id en la base (mismo normalizador)
+                        prev = df_base[list(normalizers)].set_axis(base_ids.to_numpy(), axis=0)
+                        prev = prev[~prev.index.duplicated(keep="first")]
 
-                            cal_new = row.get("Calificación", 0)
-                            try:
-                                cal_new = int(cal_new)
-                            except Exception:
-                                cal_new = 0
-                            cal_new = max(0, min(5, cal_new))
-
-                            com_new = str(row.get("Comentarios", "") or "").strip()
-
-                            prev_eva = df_base.loc[m, "Evaluación"].iloc[0] if m.any() else None
-                            prev_cal = df_base.loc[m, "Calificación"].iloc[0] if m.any() else None
-                            prev_com = str(df_base.loc[m, "Comentarios"].iloc[0]) if m.any() else ""
-
-                            any_change = False
-                            if eva_new != prev_eva:
-                                df_base.loc[m, "Evaluación"] = eva_new
-                                any_change = True
-                            if cal_new != prev_cal:
-                                df_base.loc[m, "Calificación"] = cal_new
-                                any_change = True
-                            if com_new != prev_com:
-                                df_base.loc[m, "Comentarios"] = com_new
-                                any_change = True
-
-                            if any_change:
-                                cambios += 1
-                                changed_ids.add(id_row)
+                        # Aplicar: una asignación por columna, solo en Ids cuyo valor cambió.
+                        # "Tocada" = la columna está en los deltas del Id (un valor nulo es una celda vaciada).
+                        changed_ids: set[str] = set()
+                        for c, norm in normalizers.items():
+                            touched = {rid: d[c] for rid, d in deltas.items() if c in d and rid in known_ids}
+                            if not touched:
+                                continue
+                            new_c = norm(pd.Series(touched, dtype=object))
+                            old_c = norm(prev[c].reindex(new_c.index))
+                            upd = new_c[new_c.to_numpy(dtype=object) != old_c.to_numpy(dtype=object)]
+                            if len(upd):
+                                m = base_ids.isin(upd.index).to_numpy()
+                                df_base.loc[m, c] = base_ids[m].map(upd).to_numpy()
+                                changed_ids |= set(upd.index)
+                        cambios = len(changed_ids)
 
                         if cambios > 0:
                             new_df = df_base.copy()
@@ -781,6 +728,7 @@ def render(user: dict | None = None):
                             except Exception as e:
                                 st.warning(f"Falló la subida a Sheets: {e}")
 
+                            reset_grid("grid_evaluacion")
                             st.rerun()
                         else:
                             st.info("No se detectaron cambios para guardar.")
@@ -5,6 +5,9 @@ from datetime import datetime, timedelta, date
 import pandas as pd
 import streamlit as st
 
+from utils.css_registry import inject_css
+from utils.indices import get_facet_index
+
 # ============================== #
 # GANTT – Vista base sin librerías externas
 # ============================== #
@@ -72,13 +75,112 @@ def _first_notna(*vals):
             return t
     return pd.NaT
 
+# ---------- Render virtualizado (páginas + ventana de fechas) ----------
+GANTT_PAGE_SIZES = [25, 50, 100, 200]
+# días por tramo visible; 0 = todo el rango
+GANTT_WINDOWS = {31: "1 mes", 14: "2 semanas", 62: "2 meses", 92: "3 meses", 0: "Todo el rango"}
+# escala → (frecuencia de Period, ancho de celda en px)
+GANTT_SCALES = {"Día": ("D", 34), "Semana": ("W", 44), "Mes": ("M", 64), "Trimestre": ("Q", 84)}
+# Tope de columnas por tramo: "Todo el rango" en escala Día se parte en tramos de este tamaño
+GANTT_MAX_COLS = 120
+_BUCKET_DAYS = {"D": 1, "W": 7, "M": 31, "Q": 92}
+
+def _date_windows(start: pd.Timestamp, end: pd.Timestamp, days: int) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Parte [start, end] en tramos de `days` días (inclusivos). days<=0 → un solo tramo."""
+    if days <= 0:
+        return [(start, end)]
+    out = []
+    cur = start
+    while cur <= end:
+        fin = min(cur + timedelta(days=days - 1), end)
+        out.append((cur, fin))
+        cur = fin + timedelta(days=1)
+    return out or [(start, end)]
+
+def _es_terminado(estado: pd.Series) -> pd.Series:
+    """'Terminado'/'Terminada'/'terminado ✓'… (Editar estado y Prioridad escriben 'Terminada')."""
+    return estado.astype(str).str.strip().str.lower().str.startswith("terminad")
+
+def _summary_lanes(view: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Un carril por grupo (Área/Responsable): inicio mínimo, fin máximo y conteos."""
+    g = view.assign(
+        __grp__=view[by].astype(str).str.strip(),
+        __term__=_es_terminado(view.get("Estado", pd.Series("", index=view.index))),
+    ).groupby("__grp__", sort=True)
+    lanes = g.agg(ini=("__ini__", "min"), fin=("__fin__", "max"), n=("__ini__", "size"), n_term=("__term__", "sum"))
+    return lanes.reset_index().rename(columns={"__grp__": by})
+
+def _bucket_idx(ts, p0: pd.Period, freq: str) -> int:
+    """Posición (en celdas) del bucket que contiene `ts`, relativa a p0."""
+    return pd.Timestamp(ts).to_period(freq).ordinal - p0.ordinal
+
+def _row_html(label: str, ini, fin, win_start, win_end, cell_px: int,
+              bg: str, bd: str, estado: str, lane: bool = False,
+              periods: pd.PeriodIndex | None = None, freq: str = "D", bar_text: str | None = None) -> str:
+    """HTML de una fila del Gantt recortada al tramo visible y ajustada a la escala."""
+    ini = max(ini, win_start)
+    fin = min(fin, win_end)
+    if periods is None:
+        periods = pd.period_range(win_start, win_end, freq=freq)
+    start_idx = max(0, _bucket_idx(ini, periods[0], freq))
+    end_idx = min(len(periods) - 1, _bucket_idx(fin, periods[0], freq))
+    span_cells = end_idx - start_idx + 1
+    label_cls = "gantt-label gantt-lane" if lane else "gantt-label"
+    text = bar_text or f"{estado} · {ini.strftime('%Y-%m-%d')} → {fin.strftime('%Y-%m-%d')}"
+    return (
+        f"<div class='gantt-row'><div class='gantt-left'>"
+        f"<div class='{label_cls}' title='{label}'>{label}</div></div><div>"
+        f"<div class='gantt-canvas' style='--cellW:{cell_px}px;'>"
+        f"<div class='gantt-bar' "
+        f"style='left:{start_idx*cell_px}px; width:{max(span_cells,1)*cell_px - 6}px; --bg:{bg}; --bd:{bd};' "
+        f"title='{estado} | {ini.date()} → {fin.date()}'>"
+        f"{text}"
+        f"</div></div></div></div>"
+    )
+
+def _header_html(periods: pd.PeriodIndex, freq: str, cell_px: int) -> str:
+    """Cabecera de dos niveles: grupo superior (mes o año) y una celda por bucket."""
+    cols = " ".join([f"{cell_px}px" for _ in periods])
+    top_fmt = "%b %Y" if freq in ("D", "W") else "%Y"
+    if freq == "D":
+        cell_lbl = lambda p: p.start_time.strftime("%d")
+    elif freq == "W":
+        cell_lbl = lambda p: f"S{p.start_time.isocalendar()[1]:02d}"
+    elif freq == "M":
+        cell_lbl = lambda p: p.start_time.strftime("%b")
+    else:
+        cell_lbl = lambda p: f"T{p.quarter}"
+
+    groups = []
+    last_key = None
+    for p in periods:
+        key = p.start_time.strftime(top_fmt)
+        if key != last_key:
+            groups.append({"label": key, "span": 1})
+            last_key = key
+        else:
+            groups[-1]["span"] += 1
+
+    html = [
+        "<div class='gantt-time'>",
+        f"<div class='gantt-days' style='grid-template-columns:{cols}; margin-left:260px;'>"
+    ]
+    for g in groups:
+        html.append(f"<div class='gantt-month' style='grid-column: span {g['span']};'>{g['label']}</div>")
+    html.append("</div>")
+    html.append(f"<div class='gantt-days' style='grid-template-columns:{cols}; margin-left:260px;'>")
+    for p in periods:
+        html.append(f"<div class='gantt-day'>{cell_lbl(p)}</div>")
+    html.append("</div></div>")
+    return "".join(html)
+
 def render(user: dict | None = None):
     # --------- Título ----------
     st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
     st.subheader("📅 Gantt")
 
     # --------- CSS ----------
-    st.markdown("""
+    inject_css("gantt", """
     <style>
       .gantt-wrap{ border:1px solid #E5E7EB; border-radius:12px; padding:10px 12px; background:#FFF; }
       .gantt-header{ display:grid; grid-template-columns: 260px 1fr; gap:10px; align-items:end; margin-bottom:6px; }
@@ -102,10 +204,11 @@ def render(user: dict | None = None):
                   font-size:12px; color:#111827; border-left:4px solid var(--bd); background: var(--bg);
                   box-shadow: 0 1px 0 rgba(0,0,0,0.04), inset 0 0 0 1px rgba(0,0,0,0.03);
                   white-space:nowrap; overflow:hidden; text-overflow:ellipsis; }
+      .gantt-lane{ background:#EEF2FF; border-color:#C7D2FE; font-weight:600; }
       .gantt-empty{ padding:24px; text-align:center; color:#6B7280; font-size:13px; border:1px dashed #E5E7EB; border-radius:12px; background:#FAFAFA; }
       .filters .stButton>button{ height:38px; }
     </style>
-    """, unsafe_allow_html=True)
+    """)
 
     # --------- Datos base ----------
     df_all = st.session_state.get("df_main", pd.DataFrame()).copy()
@@ -118,20 +221,10 @@ def render(user: dict | None = None):
     # --------- FILTROS ----------
     with st.form("gantt_filters", clear_on_submit=False):
         cA, cF, cR, cD, cH, cB = st.columns([1.8, 2.1, 3.0, 1.6, 1.4, 1.2], gap="medium")
-        area = cA.selectbox(
-            "Área", options=["Todas"] + sorted([x for x in df_all.get("Área", pd.Series(dtype=str)).astype(str).unique() if x and x!="nan"]),
-            index=0
-        )
-        fase = cF.selectbox(
-            "Fase", options=["Todas"] + sorted([x for x in df_all.get("Fase", pd.Series(dtype=str)).astype(str).unique() if x and x!="nan"]),
-            index=0
-        )
-        df_src = df_all.copy()
-        if area != "Todas":
-            df_src = df_src[df_src["Área"].astype(str) == area]
-        if fase != "Todas" and "Fase" in df_src.columns:
-            df_src = df_src[df_src["Fase"].astype(str) == fase]
-        reps = ["Todos"] + sorted([x for x in df_src.get("Responsable", pd.Series(dtype=str)).astype(str).unique() if x and x!="nan"])
+        fx = get_facet_index(df_all, ["Área", "Fase", "Responsable"], key="gantt")
+        area = cA.selectbox("Área", options=["Todas"] + fx.options("Área"), index=0)
+        fase = cF.selectbox("Fase", options=["Todas"] + fx.options("Fase"), index=0)
+        reps = ["Todos"] + fx.options("Responsable", {"Área": area, "Fase": fase})
         resp = cR.selectbox("Responsable", options=reps, index=0)
 
         d_from = cD.date_input("Desde", value=None)
@@ -145,12 +238,7 @@ def render(user: dict | None = None):
     # --------- Filtrado ----------
     df = df_all.copy()
     if do_search:
-        if area != "Todas":
-            df = df[df["Área"].astype(str) == area]
-        if fase != "Todas" and "Fase" in df.columns:
-            df = df[df["Fase"].astype(str) == fase]
-        if resp != "Todos":
-            df = df[df["Responsable"].astype(str) == resp]
+        df = fx.filter(df_all, {"Área": area, "Fase": fase, "Responsable": resp}).copy()
 
     # Derivar fechas inicio/fin (robusto a arrays)
     df["__ini__"] = df.apply(
@@ -177,11 +265,11 @@ def render(user: dict | None = None):
 
     # Rango visible
     if d_from:
-        start_view = pd.Timestamp(d_from)
+        start_view = pd.Timestamp(d_from).normalize()
     else:
         start_view = df["__ini__"].min()
     if d_to:
-        end_view = pd.Timestamp(d_to)
+        end_view = pd.Timestamp(d_to).normalize()
     else:
         end_view = df["__fin__"].max()
 
@@ -191,16 +279,55 @@ def render(user: dict | None = None):
     if end_view < start_view:
         end_view = start_view
 
-    # Inclusivo
-    end_view_inc = end_view + timedelta(days=1)
-    num_days = (end_view_inc - start_view).days
-    days = [start_view + timedelta(days=i) for i in range(num_days)]
-
     # Solo tareas que pisan el rango (ya son Series datetime64[ns] → comparables)
     mask_overlap = (~df["__ini__"].isna()) & (~df["__fin__"].isna()) & \
                    (df["__fin__"] >= start_view) & (df["__ini__"] <= end_view)
     view = df.loc[mask_overlap].copy()
 
+    # --------- Render virtualizado: escala + ventana de fechas + página de filas ----------
+    cS, cP, cV, cW, cL, cC = st.columns([1.2, 1.2, 1.4, 2.4, 1.4, 1.2], gap="medium")
+    scale = cS.selectbox("Escala", options=list(GANTT_SCALES.keys()), key="gantt_scale")
+    freq, cell_px = GANTT_SCALES[scale]
+    page_size = cP.selectbox("Filas por página", options=GANTT_PAGE_SIZES, key="gantt_page_size")
+    window_days = cV.selectbox(
+        "Ventana", options=list(GANTT_WINDOWS.keys()),
+        format_func=lambda k: GANTT_WINDOWS[k], key="gantt_window_days",
+    )
+    # Ninguna ventana (ni "Todo el rango") supera GANTT_MAX_COLS columnas de la escala
+    max_days = GANTT_MAX_COLS * _BUCKET_DAYS.get(freq, 1)
+    span_days = (end_view - start_view).days + 1
+    eff_days = int(window_days) if int(window_days) > 0 else span_days
+    if eff_days > max_days:
+        eff_days = max_days
+        cV.caption(f"Máx. {GANTT_MAX_COLS} columnas por tramo en escala {scale}.")
+    windows = _date_windows(start_view, end_view, eff_days)
+    if st.session_state.get("gantt_window_idx", 0) >= len(windows):
+        st.session_state["gantt_window_idx"] = 0
+    w_idx = cW.selectbox(
+        "Tramo visible", options=list(range(len(windows))),
+        format_func=lambda i: f"{windows[i][0]:%d/%m/%Y} – {windows[i][1]:%d/%m/%Y}",
+        key="gantt_window_idx",
+    )
+    lane_by = cL.selectbox("Resumen por", options=["Área", "Responsable", "Ninguno"], key="gantt_lane_by")
+    with cC:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        collapsed = st.checkbox("Colapsar", key="gantt_collapsed", disabled=(lane_by == "Ninguno"),
+                                help="Una barra por grupo con su número de tareas")
+
+    win_start, win_end = windows[int(w_idx)]
+    in_window = view[(view["__fin__"] >= win_start) & (view["__ini__"] <= win_end)]
+    try:
+        in_window = in_window.sort_values(["Área", "Responsable", "__ini__"], ascending=[True, True, True])
+    except Exception:
+        pass
+
+    # Buckets de la escala elegida (las barras se ajustan a ellos)
+    periods = pd.period_range(win_start, win_end, freq=freq)
+
+    n_pages = max(1, -(-len(in_window) // int(page_size)))
+    if st.session_state.get("gantt_page", 1) > n_pages:
+        st.session_state["gantt_page"] = 1
+
     # Leyenda / header
     st.markdown('<div class="gantt-wrap">', unsafe_allow_html=True)
     col_head_l, col_head_r = st.columns([1, 2], gap="small")
@@ -215,78 +342,56 @@ def render(user: dict | None = None):
     with col_head_r:
         st.markdown(
             f"<div style='text-align:right; color:#6B7280; font-size:12px;'>"
-            f"{len(view)} tareas en rango ({start_view.date()} – {end_view.date()})</div>",
+            f"{len(view)} tareas en rango ({start_view.date()} – {end_view.date()}) · "
+            f"{len(in_window)} en el tramo visible</div>",
             unsafe_allow_html=True
         )
 
-    # Cabeceras de días/meses
-    cell_px = 34
-    days_cols = " ".join([f"{cell_px}px" for _ in days])
-
-    months = []
-    last_key, span = None, 0
-    for d in days:
-        key = (d.year, d.month)
-        if key != last_key:
-            if last_key is not None:
-                months[-1]["span"] = span
-            months.append({"label": pd.Timestamp(d).strftime("%b %Y"), "span": 1})
-            last_key, span = key, 1
-        else:
-            span += 1
-    if months:
-        months[-1]["span"] = span
-
-    header_html = [
-        "<div class='gantt-time'>",
-        f"<div class='gantt-days' style='grid-template-columns:{days_cols}; margin-left:260px;'>"
-    ]
-    for m in months:
-        header_html.append(
-            f"<div class='gantt-month' style='grid-column: span {m['span']};'>{m['label']}</div>"
-        )
-    header_html.append("</div>")
-    header_html.append(
-        f"<div class='gantt-days' style='grid-template-columns:{days_cols}; margin-left:260px;'>"
-    )
-    for d in days:
-        header_html.append(f"<div class='gantt-day'>{d.strftime('%d')}</div>")
-    header_html.append("</div></div>")
-    st.markdown("".join(header_html), unsafe_allow_html=True)
+    # Cabeceras (solo del tramo visible, una celda por bucket)
+    st.markdown(_header_html(periods, freq, cell_px), unsafe_allow_html=True)
 
     # Filas
-    if view.empty:
+    if in_window.empty:
         st.markdown("<div class='gantt-empty'>Sin tareas en el rango seleccionado.</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
         return
 
-    try:
-        view = view.sort_values(["Área", "Responsable", "__ini__"], ascending=[True, True, True])
-    except Exception:
-        pass
+    # Carriles resumen (calculados en servidor sobre todo el tramo, no solo la página)
+    if lane_by != "Ninguno" and lane_by in in_window.columns:
+        lanes = _summary_lanes(in_window, lane_by)
+        lanes_html = ["<div class='gantt-rows' style='margin-bottom:10px;'>"]
+        for _, r in lanes.iterrows():
+            label_left = f"Σ {r[lane_by]} · {int(r['n'])} tareas"
+            tip = f"{int(r['n_term'])} terminadas de {int(r['n'])}"
+            lanes_html.append(_row_html(label_left, r["ini"], r["fin"], win_start, win_end, cell_px,
+                                        "#EEF2FF", "#6366F1", tip, lane=True,
+                                        periods=periods, freq=freq,
+                                        bar_text=f"{int(r['n'])} tareas · {tip}"))
+        lanes_html.append("</div>")
+        st.markdown("".join(lanes_html), unsafe_allow_html=True)
+
+        # Modo colapsado: solo los carriles por grupo
+        if collapsed:
+            st.markdown("</div>", unsafe_allow_html=True)
+            return
+
+    page = 1
+    if n_pages > 1:
+        _, cpg = st.columns([4, 1.2], gap="small")
+        page = cpg.number_input(
+            f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key="gantt_page"
+        )
+    off = (int(page) - 1) * int(page_size)
+    page_rows = in_window.iloc[off: off + int(page_size)]
 
     rows_html = ["<div class='gantt-rows'>"]
-    for _, r in view.iterrows():
+    for _, r in page_rows.iterrows():
         label_left = f"{str(r.get('Responsable','')).strip()} — {str(r.get('Tarea','')).strip()}"
         estado = str(r.get("Estado", "No iniciado")).strip()
         bg = PALETTE.get(estado, "#E5E7EB")
         bd = BORDER.get(estado, "#9CA3AF")
-
-        ini = max(r["__ini__"], start_view)
-        fin = min(r["__fin__"], end_view)
-        start_idx = (ini - start_view).days
-        span_days = (fin - ini).days + 1
-
-        left_html = f"<div class='gantt-label' title='{label_left}'>{label_left}</div>"
-        canvas = (
-            f"<div class='gantt-canvas' style='--cellW:{cell_px}px;'>"
-            f"<div class='gantt-bar' "
-            f"style='left:{start_idx*cell_px}px; width:{max(span_days,1)*cell_px - 6}px; --bg:{bg}; --bd:{bd};' "
-            f"title='{estado} | {ini.date()} → {fin.date()}'>"
-            f"{estado} · {ini.strftime('%Y-%m-%d')} → {fin.strftime('%Y-%m-%d')}"
-            f"</div></div>"
-        )
-        rows_html.append(f"<div class='gantt-row'><div class='gantt-left'>{left_html}</div><div>{canvas}</div></div>")
+        rows_html.append(_row_html(label_left, r["__ini__"], r["__fin__"], win_start, win_end, cell_px,
+                                   bg, bd, estado, periods=periods, freq=freq))
 
     rows_html.append("</div>")
     st.markdown("".join(rows_html), unsafe_allow_html=True)
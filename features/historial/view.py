@@ -9,6 +9,9 @@ import streamlit as st
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode, JsCode
 import time  # ⬅️ Auto-sync debounce
 import uuid  # ⬅️ NUEVO
+from utils.css_registry import inject_css
+from utils.fingerprints import RowSnapshot, derived_cache, row_hashes
+from utils.grid_pages import page_window
 
 # 👇 ACL: para filtrar vista (Vivi/Enrique ven todo, resto solo lo suyo)
 try:
@@ -17,6 +20,14 @@ except Exception:
     def apply_scope(df, user=None):  # fallback no-op
         return df
 
+# 👇 Invariante de Id único en df_main (upsert por Id)
+try:
+    from shared import ensure_unique_ids, upsert_tasks, apply_cell_edits  # type: ignore
+except Exception:
+    ensure_unique_ids = None
+    upsert_tasks = None
+    apply_cell_edits = None
+
 # 👇 Upsert centralizado (utils/gsheets)
 try:
     from utils.gsheets import upsert_rows_by_id  # type: ignore
@@ -291,22 +302,29 @@ def pull_user_slice_from_sheet(replace_df_main: bool = True):
         for c in alerta_cols[1:]:
             df.drop(columns=c, inplace=True, errors="ignore")
 
+    # Duplicados de la hoja: se reportan y resuelven aquí, una sola vez
+    if ensure_unique_ids is not None:
+        df = ensure_unique_ids(df, "Google Sheets")
+
     if "Id" in df.columns and isinstance(st.session_state.get("df_main"), pd.DataFrame) and "Id" in st.session_state["df_main"].columns:
         base = st.session_state["df_main"].copy()
         base["Id"] = base["Id"].astype(str); df["Id"] = df["Id"].astype(str)
         base = _canonicalize_link_column(base)
         all_cols = list(dict.fromkeys(list(base.columns) + list(df.columns)))
         base = base.reindex(columns=all_cols); df = df.reindex(columns=all_cols)
-        base_idx = base.set_index("Id"); upd_idx = df.set_index("Id")
-        base_idx.update(upd_idx)
-        merged = base_idx.combine_first(upd_idx).reset_index()
+        if upsert_tasks is not None:
+            merged = upsert_tasks(base, df, keep_existing_on_na=True)
+        else:
+            base_idx = base.set_index("Id"); upd_idx = df.set_index("Id")
+            base_idx.update(upd_idx)
+            merged = base_idx.combine_first(upd_idx).reset_index()
         st.session_state["df_main"] = merged
     else:
         if replace_df_main:
             st.session_state["df_main"] = df
-    # *** NUEVO: baseline para reconstruir difs si se pierde el snapshot
+    # *** NUEVO: baseline (huellas) para reconstruir difs si se pierde el snapshot
     try:
-        st.session_state["_hist_baseline"] = st.session_state["df_main"].copy()
+        _set_hist_baseline(st.session_state["df_main"])
     except Exception:
         pass
     return df
@@ -523,6 +541,12 @@ def _add_business_days(start_dates: pd.Series, days: pd.Series) -> pd.Series:
         out.loc[ok] = pd.to_datetime(res)
     return out
 
+# Entradas y derivados que forman la huella de una fila
+_DEADLINE_COLS = [
+    "Duración", "Fecha inicio", "Fecha Terminado",
+    "Fecha Vencimiento", "Hora Vencimiento", "Cumplimiento",
+]
+
 # *** NUEVO: asegurar cálculo de Fecha límite/Hora límite y Cumplimiento en un df dado
 def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
@@ -535,6 +559,32 @@ def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
         return _canonicalize_link_column(df)
 
     df = df.copy()
+    if "Hora Vencimiento" not in df.columns:
+        df["Hora Vencimiento"] = ""
+    if "Cumplimiento" not in df.columns:
+        df["Cumplimiento"] = ""
+
+    # Solo se recalculan filas cuya huella (entradas + derivados) no está ya materializada
+    cache = derived_cache("_hist_derived_cache")
+    dirty = cache.dirty(row_hashes(df, _DEADLINE_COLS))
+    if dirty.any():
+        sub = _compute_deadline_and_compliance(df.loc[dirty].copy())
+        for c in ("Fecha Vencimiento", "Hora Vencimiento", "Cumplimiento"):
+            if c in sub.columns:
+                if c not in df.columns:
+                    df[c] = pd.NaT
+                df.loc[dirty, c] = sub[c].to_numpy()
+        done = df.loc[dirty]
+        # sin Fecha Terminado → Cumplimiento depende de hoy (refresco diario)
+        if "Fecha Terminado" in done.columns:
+            daily = to_naive_local_series(done["Fecha Terminado"]).isna().to_numpy()
+        else:
+            daily = np.ones(len(done), dtype=bool)
+        cache.remember(row_hashes(done, _DEADLINE_COLS), daily)
+    return _canonicalize_link_column(df)
+
+def _compute_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
+    """Cálculo completo de Fecha/Hora límite y Cumplimiento sobre `df` (ya copiado)."""
     # Fecha límite (solo con Duración + Fecha inicio)
     if ("Duración" in df.columns) and ("Fecha inicio" in df.columns):
         dur_num = pd.to_numeric(df["Duración"], errors="coerce")
@@ -568,54 +618,24 @@ def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
     out[no_delivered]      = "❌ No entregado"
     out[risk]              = "⚠️ En riesgo de retrasos"
     df["Cumplimiento"] = out
-    return _canonicalize_link_column(df)
+    return df
+
+# *** NUEVO: baseline como huellas por fila/celda (sin copia completa de df_main)
+def _set_hist_baseline(df: pd.DataFrame):
+    st.session_state["_hist_baseline"] = RowSnapshot(_ensure_deadline_and_compliance(df))
 
 # *** NUEVO: baseline diff (reconstrucción si no hay snapshot por edición)
-def _derive_pending_from_baseline(curr: pd.DataFrame, base: pd.DataFrame,
+def _derive_pending_from_baseline(curr: pd.DataFrame, base: RowSnapshot | None,
                                   allowed_cols: set[str] | None = None):
-    pend_ids, cell_diff, new_ids = set(), {}, set()
     if curr is None or curr.empty or "Id" not in curr.columns:
-        return pend_ids, cell_diff, new_ids
-    if base is None or base.empty or "Id" not in base.columns:
+        return set(), {}, set()
+    if not isinstance(base, RowSnapshot) or base.empty:
         # todo es nuevo
         new_ids = set(curr["Id"].astype(str).tolist())
-        pend_ids = set(new_ids)
-        return pend_ids, cell_diff, new_ids
-
-    c = _canonicalize_link_column(curr.copy()); b = _canonicalize_link_column(base.copy())
-    c["Id"] = c["Id"].astype(str); b["Id"] = b["Id"].astype(str)
-    c_idx = c.set_index("Id", drop=False); b_idx = b.set_index("Id", drop=False)
-
-    cols = list(dict.fromkeys([x for x in c.columns if x in b.columns]))
-    if allowed_cols:
-        cols = [x for x in cols if x in allowed_cols or x == "Id"]
-
+        return set(new_ids), {}, new_ids
     # garantizar cálculo de derivados antes de comparar
-    c_idx = _ensure_deadline_and_compliance(c_idx)
-    b_idx = _ensure_deadline_and_compliance(b_idx)
-
-    # nuevos
-    for iid in c_idx.index:
-        if iid not in b_idx.index:
-            new_ids.add(iid)
-            pend_ids.add(iid)
-
-    common = c_idx.index.intersection(b_idx.index)
-    if len(common):
-        a = b_idx.loc[common, cols].fillna("").astype(str)
-        d = c_idx.loc[common, cols].fillna("").astype(str)
-        neq = a.ne(d)
-        changed_any = neq.any(axis=1)
-        ids_changed = changed_any[changed_any].index
-        for rid in ids_changed:
-            pend_ids.add(rid)
-            diff_mask = neq.loc[rid].to_numpy()
-            cols_changed = set(neq.columns[diff_mask].tolist())
-            if allowed_cols:
-                cols_changed = {x for x in cols_changed if x in allowed_cols}
-            if cols_changed:
-                cell_diff[str(rid)] = cols_changed
-    return pend_ids, cell_diff, new_ids
+    c = _ensure_deadline_and_compliance(curr)
+    return base.diff(c, allowed_cols=allowed_cols)
 
 # --- Bootstrap fuerte de df_main (garantiza que "pegue" en todas las pestañas) ---
 def _bootstrap_df_main_hist():
@@ -624,18 +644,21 @@ def _bootstrap_df_main_hist():
             or st.session_state["df_main"].empty)
     if not need:
         # *** NUEVO: baseline si aún no existe
-        st.session_state.setdefault("_hist_baseline", st.session_state["df_main"].copy())
+        if not isinstance(st.session_state.get("_hist_baseline"), RowSnapshot):
+            _set_hist_baseline(st.session_state["df_main"])
         return
     df_local = _load_local_if_exists()
     if isinstance(df_local, pd.DataFrame) and not df_local.empty:
-        st.session_state["df_main"] = df_local.copy()
-        st.session_state["_hist_baseline"] = df_local.copy()  # *** NUEVO
+        st.session_state["df_main"] = (
+            ensure_unique_ids(df_local, "el archivo local") if ensure_unique_ids is not None else df_local.copy()
+        )
+        _set_hist_baseline(df_local)  # *** NUEVO
         return
     try:
         pull_user_slice_from_sheet(replace_df_main=True)
     except Exception:
         st.session_state["df_main"] = pd.DataFrame(columns=DEFAULT_COLS)
-        st.session_state["_hist_baseline"] = st.session_state["df_main"].copy()  # *** NUEVO
+        _set_hist_baseline(st.session_state["df_main"])  # *** NUEVO
 
 # =======================================================
 #                       RENDER
@@ -644,7 +667,7 @@ def render(user: dict | None = None):
     st.markdown("<div style='height:12px'></div>", unsafe_allow_html=True)
 
     # ====== CSS (AJUSTES pedidos) ======
-    st.markdown("""
+    inject_css("historial", """
     <style>
       :root{
         --pill-salmon:#F28B85;
@@ -740,7 +763,7 @@ def render(user: dict | None = None):
       .ag-theme-balham .ag-header-cell.hdr-inicio{   background:var(--hdr-ini)!important; border-radius:8px; }
       .ag-theme-balham .ag-header-cell.hdr-termino{  background:var(--hdr-ter)!important; border-radius:8px; }
     </style>
-    """, unsafe_allow_html=True)
+    """)
 
 
     # ====== DATA BASE (bootstrap fuerte) ======
@@ -1274,9 +1297,15 @@ def render(user: dict | None = None):
     grid_opts["rememberSelection"] = True
     grid_opts["floatingFilter"] = False
 
+    # ⚡ Paginación del lado del servidor: orden + ventana en pandas, al grid solo va la página
+    df_page, page_sig = page_window(
+        df_grid, key="hist_grid", labels=header_map,
+        sort_cols=[c for c in df_grid.columns if c != _LINK_CANON],
+    )
+
     grid_resp = AgGrid(
-        df_grid,
-        key="grid_historial",
+        df_page,
+        key=f"grid_historial_{page_sig}",
         gridOptions=grid_opts,
         theme="balham",
         height=500,
@@ -1318,8 +1347,10 @@ def render(user: dict | None = None):
             prev_map = a.set_index("Id", drop=False)
             curr_map = b.set_index("Id", drop=False)
 
-            for iid, row in curr_map.iterrows():
-                if iid and iid != "nan" and iid not in prev_map.index:
+            # Nuevo = Id que no existe en df_main (con paginación, prev es solo la página anterior)
+            main_ids = set(st.session_state.get("df_main", pd.DataFrame()).get("Id", pd.Series(dtype=str)).astype(str))
+            for iid in curr_map.index:
+                if iid and iid != "nan" and iid not in prev_map.index and iid not in main_ids:
                     new_only_ids_run.add(iid)
                     changed_ids_run.add(iid)
 
@@ -1355,20 +1386,15 @@ def render(user: dict | None = None):
         st.session_state["_hist_cell_diff"]  = {k: sorted(v) for k, v in pend_diff.items()}
         st.session_state["_hist_new_ids"]    = sorted(pend_new)
 
-        if new_df is not None:
-            base = st.session_state.get("df_main", pd.DataFrame()).copy()
-            base = _canonicalize_link_column(base); new_df = _canonicalize_link_column(new_df)
-            if ("Id" in base.columns) and ("Id" in new_df.columns):
-                base["Id"] = base["Id"].astype(str); new_df["Id"] = new_df["Id"].astype(str)
-                base_idx = base.set_index("Id"); new_idx  = new_df.set_index("Id")
-                cols_to_update = [c for c in new_idx.columns if c in base_idx.columns]
-                base_idx.update(new_df[cols_to_update])
-                st.session_state["df_main"] = base_idx.reset_index()
-            else:
-                st.session_state["df_main"] = new_df
+        # La grilla devuelve solo la página: se escriben en df_main únicamente las celdas editadas
+        if new_df is not None and cell_diff_run and apply_cell_edits is not None:
+            base = _canonicalize_link_column(st.session_state.get("df_main", pd.DataFrame()).copy())
+            new_df = _canonicalize_link_column(new_df)
+            st.session_state["df_main"] = apply_cell_edits(base, new_df, cell_diff_run)
             try: _save_local(st.session_state["df_main"].copy())
             except Exception: pass
 
+        if new_df is not None:
             try:
                 st.session_state["_hist_prev"] = new_df.reindex(columns=snap_cols).copy()
             except Exception:
@@ -1489,13 +1515,9 @@ def render(user: dict | None = None):
                                      if "Cumplimiento" in set(cols)}
                         if not ids_cumpl:
                             base_line = st.session_state.get("_hist_baseline")
-                            if isinstance(base_line, pd.DataFrame):
-                                cur = base_full.set_index("Id")
-                                old = _ensure_deadline_and_compliance(base_line).set_index("Id")
-                                common = cur.index.intersection(old.index)
-                                if len(common) and "Cumplimiento" in cur.columns and "Cumplimiento" in old.columns:
-                                    ch = old.loc[common, "Cumplimiento"].astype(str) != cur.loc[common, "Cumplimiento"].astype(str)
-                                    ids_cumpl = set(common[ch])
+                            if isinstance(base_line, RowSnapshot):
+                                _, c_diff, _ = base_line.diff(base_full, allowed_cols={"Cumplimiento"})
+                                ids_cumpl = set(c_diff)
 
                         if ids_cumpl:
                             try:
@@ -1516,7 +1538,7 @@ def render(user: dict | None = None):
                             st.session_state["_hist_new_ids"]    = []
                             # *** NUEVO: baseline = estado actual tras subir
                             try:
-                                st.session_state["_hist_baseline"] = base_full.copy()
+                                _set_hist_baseline(base_full)
                             except Exception:
                                 pass
                             try:
@@ -1,53 +1,85 @@
 # features/kanban/view.py
 from __future__ import annotations
 
-import re
 import math
 from typing import Dict, List
 
 import pandas as pd
 import streamlit as st
 
+from utils.css_registry import inject_css
+from utils.fragments import fragment as _fragment
+from utils.indices import get_facet_index, date_range_mask
+
 
 __all__ = ["render"]
 
+# Tarjetas por página en cada columna ("Cargar más" suma otra página)
+KANBAN_PAGE_SIZE = 20
+
 
 # =========================
 # Utilitarios
 # =========================
-def _to_date(v):
-    if pd.isna(v):
-        return pd.NaT
-    try:
-        return pd.to_datetime(v).normalize()
-    except Exception:
-        try:
-            return pd.to_datetime(str(v), errors="coerce").normalize()
-        except Exception:
-            return pd.NaT
+# Tabla de clasificación (texto normalizado → estado canónico)
+_ESTADO_LOOKUP = {
+    "en curso": "En curso", "en progreso": "En curso", "progreso": "En curso",
+    "terminado": "Terminado", "finalizado": "Terminado", "completado": "Terminado",
+    "pausado": "Pausado",
+    "cancelado": "Cancelado",
+    "eliminado": "Eliminado", "borrado": "Eliminado",
+}
 
 
 def _classify_estado(raw: str) -> str:
     s = (str(raw) or "").strip().lower()
-    if s in {"en curso", "en progreso", "progreso"}:
-        return "En curso"
-    if s in {"terminado", "finalizado", "completado"}:
-        return "Terminado"
-    if s in {"pausado"}:
-        return "Pausado"
-    if s in {"cancelado"}:
-        return "Cancelado"
-    if s in {"eliminado", "borrado"}:
-        return "Eliminado"
-    return "No iniciado"
+    return _ESTADO_LOOKUP.get(s, "No iniciado")
+
+
+def _classify_estado_series(estado: pd.Series) -> pd.Series:
+    """Versión vectorizada de _classify_estado (una sola pasada sobre la columna)."""
+    return (
+        estado.astype(str).str.strip().str.lower()
+        .map(_ESTADO_LOOKUP).fillna("No iniciado")
+    )
+
+
+def _card_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Columnas preformateadas de cada tarjeta: __html__ + __Estado__ (todo con ops vectorizadas)."""
+    def _txt(col: str) -> pd.Series:
+        if col not in df.columns:
+            return pd.Series("", index=df.index, dtype=object)
+        return df[col].fillna("").astype(str).str.strip().replace("nan", "")
+
+    title = _txt("Tarea").replace("", "(sin título)")
+    meta = (
+        _txt("Responsable").str.cat([_txt("Área"), _txt("Fase")], sep=" · ")
+        .str.replace(r"( · )+", " · ", regex=True).str.strip(" ·")
+    )
+
+    if "Fecha Vencimiento" in df.columns:
+        venc = pd.to_datetime(df["Fecha Vencimiento"], errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+    else:
+        venc = pd.Series("", index=df.index, dtype=object)
+    hora = _txt("Hora Vencimiento")
+    hora = hora.where(hora.str.match(r"^\d{1,2}:\d{2}$"), "")
+    venc = venc.str.cat(hora, sep=" · ").str.strip(" ·").replace("", "Sin vencimiento")
+
+    html = (
+        '<div class="kan-card">'
+        '<div style="font-weight:600; color:var(--text-600); margin-bottom:4px;">' + title + '</div>'
+        '<div style="font-size:.82rem; color:#6b7280; margin-bottom:6px;">' + meta + '</div>'
+        '<div class="chip">' + venc + '</div>'
+        '</div>'
+    )
+    return pd.DataFrame({"__Estado__": df["__Estado__"], "__html__": html}, index=df.index)
 
 
 # =========================
 # UI helpers
 # =========================
 def _emit_css():
-    st.markdown(
-        """
+    inject_css("kanban", """
         <style>
         /* ===== Paleta pastel ===== */
         :root{
@@ -103,9 +135,7 @@ def _emit_css():
         .chip{ display:inline-block; padding:3px 8px; border-radius:999px; font-size:.75rem;
                background:#f3f4f6; color:#4b5563; border:1px solid #e5e7eb; }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """)
 
 
 def _column_header(title: str, icon: str, total: int, pct: float):
@@ -123,42 +153,64 @@ def _column_header(title: str, icon: str, total: int, pct: float):
     )
 
 
-def _render_col(title: str, icon: str, color_bg: str, color_ac: str, cards: List[Dict], pct: float):
+def _render_col(title: str, icon: str, color_bg: str, color_ac: str, cards: List[str], pct: float,
+                total: int | None = None):
+    """Columna completa en un solo st.markdown (las tarjetas llegan ya como HTML)."""
     st.markdown(f'<div class="kan-col" style="--col-bg:{color_bg}; --col-ac:{color_ac};">', unsafe_allow_html=True)
-    _column_header(title, icon, len(cards), pct)
+    _column_header(title, icon, len(cards) if total is None else total, pct)
     if not cards:
         st.markdown('<div class="kan-card kan-card--empty">Sin tareas</div>', unsafe_allow_html=True)
     else:
-        for c in cards:
-            title = (c.get("Tarea") or "").strip() or "(sin título)"
-            resp = (c.get("Responsable") or "").strip()
-            area = (c.get("Área") or "").strip()
-            fase = (c.get("Fase") or "").strip()
-            v_f = c.get("Fecha Vencimiento")
-            v_h = c.get("Hora Vencimiento")
-            venc_txt = ""
-            if pd.notna(v_f):
-                try:
-                    venc_txt = f"{pd.to_datetime(v_f).date().isoformat()}"
-                except Exception:
-                    pass
-            if isinstance(v_h, str) and re.match(r"^\\d{{1,2}}:\\d{{2}}$", v_h or ""):
-                venc_txt = (venc_txt + f" · {v_h}").strip(" ·")
-            meta = " · ".join([x for x in [resp, area or None, fase or None] if x])
-
-            st.markdown(
-                f"""
-                <div class="kan-card">
-                  <div style="font-weight:600; color:var(--text-600); margin-bottom:4px;">{title}</div>
-                  <div style="font-size:.82rem; color:#6b7280; margin-bottom:6px;">{meta}</div>
-                  <div class="chip">{venc_txt or "Sin vencimiento"}</div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+        st.markdown("".join(cards), unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+def _render_paged_col(state: str, icon: str, color_bg: str, color_ac: str,
+                      df_state: pd.DataFrame, pct: float):
+    """Columna paginada: solo materializa las primeras N tarjetas (ya ordenadas por vencimiento)."""
+    key = f"kanban_limit_{state}"
+    limit = int(st.session_state.get(key, KANBAN_PAGE_SIZE))
+    total = len(df_state)
+    cards = _card_frame(df_state.head(limit))["__html__"].tolist() if total else []
+    _render_col(state, icon, color_bg, color_ac, cards, pct, total=total)
+    if total > limit:
+        def _more():
+            st.session_state[key] = limit + KANBAN_PAGE_SIZE
+        st.button(
+            f"Cargar más ({total - limit} restantes)",
+            key=f"kanban_more_{state}", on_click=_more, use_container_width=True,
+        )
+
+
+# Cada columna principal se re-ejecuta sola al pulsar su "Cargar más"
+_paged_col_fragment = _fragment(_render_paged_col)
+
+
+@_fragment
+def _extra_cols_fragment(by_state: Dict[str, pd.DataFrame], counts: Dict[str, int], total_all: int):
+    """'Ver más' + columnas secundarias; alternarlas no vuelve a pintar las tres principales."""
+    def _flip():
+        st.session_state["kanban_show_more"] = not st.session_state.get("kanban_show_more", False)
+
+    show_more = st.session_state.get("kanban_show_more", False)
+    st.button("Ver más" if not show_more else "Ocultar", key="kanban_show_more_btn", on_click=_flip)
+
+    if show_more:
+        st.markdown('<div class="kan-row kan-row--more">', unsafe_allow_html=True)
+        cols2 = st.columns(3)
+        extra_colors = {
+            "Pausado": ("var(--yellow-soft)", "var(--yellow-ac)", "⏸️"),
+            "Cancelado": ("var(--orange-soft)", "var(--orange-ac)", "🛑"),
+            "Eliminado": ("var(--red-soft)", "var(--red-ac)", "🗑️"),
+        }
+        for col, k in zip(cols2, extra_colors):
+            with col:
+                bg, ac, ico = extra_colors[k]
+                pct = 100.0 * (counts.get(k, 0) / total_all) if total_all else 0.0
+                _render_paged_col(k, ico, bg, ac, by_state[k], pct)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
 # ===== Donut SVG (sin dependencias) =====
 def _arc_path(cx, cy, r, start_ang, end_ang):
     # ángulos en radianes
@@ -237,27 +289,20 @@ def render(user: dict | None = None):
     # Normalizar estado
     if "Estado" not in df.columns:
         df["Estado"] = ""
-    df["__Estado__"] = df["Estado"].map(_classify_estado)
+    df["__Estado__"] = _classify_estado_series(df["Estado"])
 
     # Columna de fecha para filtros
     date_col = "Fecha inicio" if "Fecha inicio" in df.columns else ("Fecha Registro" if "Fecha Registro" in df.columns else None)
-    if date_col:
-        df[date_col] = df[date_col].map(_to_date)
 
     # ------- Filtros -------
     with st.form("kanban_filters", clear_on_submit=False):
         st.markdown('<div class="kan-filters">', unsafe_allow_html=True)
         cA, cF, cR, cD, cH, cB = st.columns([1.8, 2.1, 3.0, 1.6, 1.4, 1.2], gap="medium", vertical_alignment="bottom")
 
-        area_sel = cA.selectbox("Área", ["Todas"] + sorted([x for x in df.get("Área", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"]), index=0)
-        fase_sel = cF.selectbox("Fase", ["Todas"] + sorted([x for x in df.get("Fase", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"]), index=0)
-
-        df_r = df.copy()
-        if area_sel != "Todas" and "Área" in df_r.columns:
-            df_r = df_r[df_r["Área"] == area_sel]
-        if fase_sel != "Todas" and "Fase" in df_r.columns:
-            df_r = df_r[df_r["Fase"].astype(str) == fase_sel]
-        resp_opts = ["Todos"] + sorted([x for x in df_r.get("Responsable", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"])
+        fx = get_facet_index(df, ["Área", "Fase", "Responsable"], key="kanban")
+        area_sel = cA.selectbox("Área", ["Todas"] + fx.options("Área"), index=0)
+        fase_sel = cF.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0)
+        resp_opts = ["Todos"] + fx.options("Responsable", {"Área": area_sel, "Fase": fase_sel})
         resp_sel = cR.selectbox("Responsable", resp_opts, index=0)
 
         f_desde = cD.date_input("Desde", value=None)
@@ -268,17 +313,11 @@ def render(user: dict | None = None):
 
     df_view = df.copy()
     if do_search:
-        if area_sel != "Todas" and "Área" in df_view.columns:
-            df_view = df_view[df_view["Área"] == area_sel]
-        if fase_sel != "Todas" and "Fase" in df_view.columns:
-            df_view = df_view[df_view["Fase"].astype(str) == fase_sel]
-        if resp_sel != "Todos" and "Responsable" in df_view.columns:
-            df_view = df_view[df_view["Responsable"].astype(str) == resp_sel]
-        if date_col:
-            if f_desde:
-                df_view = df_view[df_view[date_col].dt.date >= f_desde]
-            if f_hasta:
-                df_view = df_view[df_view[date_col].dt.date <= f_hasta]
+        df_view = fx.filter(df, {"Área": area_sel, "Fase": fase_sel, "Responsable": resp_sel})
+        if date_col and (f_desde or f_hasta):
+            df_view = df_view[
+                date_range_mask(df_view, date_col, f_desde or None, f_hasta or None, include_nat=False)
+            ]
 
     # ------- Resumen por estado -------
     main_states = ["No iniciado", "En curso", "Terminado"]
@@ -313,12 +352,13 @@ def render(user: dict | None = None):
     )
     st.markdown("</div>", unsafe_allow_html=True)
 
-    # ------- Construcción de buckets -------
-    buckets = {k: [] for k in main_states + extra_states}
-    for _, row in df_view.iterrows():
-        k = _classify_estado(row.get("Estado", ""))
-        buckets.setdefault(k, [])
-        buckets[k].append(row.to_dict())
+    # ------- Tarjetas por estado (ordenadas por vencimiento; se materializan por página) -------
+    if "Fecha Vencimiento" in df_view.columns and len(df_view):
+        _venc = pd.to_datetime(df_view["Fecha Vencimiento"], errors="coerce")
+        df_view = df_view.assign(__venc__=_venc).sort_values("__venc__", na_position="last", kind="stable")
+    by_state = {k: df_view.iloc[0:0] for k in main_states + extra_states}
+    for k, grp in df_view.groupby("__Estado__", sort=False):
+        by_state[k] = grp
 
     # ------- Kanban: 3 principales -------
     st.markdown('<div class="kan-row">', unsafe_allow_html=True)
@@ -334,28 +374,9 @@ def render(user: dict | None = None):
         with col:
             bg, ac, ico = main_colors[k]
             pct = 100.0 * (counts.get(k, 0) / total_all) if total_all else 0.0
-            _render_col(k, ico, bg, ac, buckets[k], pct)
+            _paged_col_fragment(k, ico, bg, ac, by_state[k], pct)
 
     st.markdown("</div>", unsafe_allow_html=True)
 
     # ------- Ver más -------
-    show_more = st.session_state.get("kanban_show_more", False)
-    if st.button("Ver más" if not show_more else "Ocultar"):
-        st.session_state["kanban_show_more"] = not show_more
-        st.rerun()
-    show_more = st.session_state.get("kanban_show_more", False)
-
-    if show_more:
-        st.markdown('<div class="kan-row kan-row--more">', unsafe_allow_html=True)
-        cols2 = st.columns(3)
-        extra_colors = {
-            "Pausado": ("var(--yellow-soft)", "var(--yellow-ac)", "⏸️"),
-            "Cancelado": ("var(--orange-soft)", "var(--orange-ac)", "🛑"),
-            "Eliminado": ("var(--red-soft)", "var(--red-ac)", "🗑️"),
-        }
-        for col, k in zip(cols2, extra_states):
-            with col:
-                bg, ac, ico = extra_colors[k]
-                pct = 100.0 * (counts.get(k, 0) / total_all) if total_all else 0.0
-                _render_col(k, ico, bg, ac, buckets[k], pct)
-        st.markdown("</div>", unsafe_allow_html=True)
+    _extra_cols_fragment(by_state, counts, total_all)
@@ -2,7 +2,14 @@ from __future__ import annotations
 import os
 import pandas as pd
 import streamlit as st
-from st_aggrid import AgGrid, GridUpdateMode, DataReturnMode, JsCode
+from st_aggrid import AgGrid, DataReturnMode, JsCode
+
+from utils.css_registry import inject_css
+from utils.grid_edits import (
+    COMMIT_UPDATE_MODE, DIRTY_FIELD, commit_button_css, commit_requested, edited_rows, grid_key,
+    render_pending, reset_grid, track_edits,
+)
+from utils.indices import get_facet_index, date_range_mask
 
 SECTION_GAP_DEF = globals().get("SECTION_GAP", 30)
 
@@ -14,6 +21,17 @@ except Exception:
     open_sheet_by_url = None
     read_df_from_worksheet = None
 
+# Invariante de Id único en df_main (duplicados resueltos al ingerir)
+try:
+    from shared import ensure_unique_ids, valid_id_mask
+except Exception:
+    def ensure_unique_ids(df, source="", id_col="Id"):
+        return _dedup_keep_last_with_id(df)
+
+    def valid_id_mask(df, id_col="Id"):
+        ids = df[id_col].astype(str).str.strip().str.lower()
+        return ~ids.isin({"", "-", "nan", "none", "null"})
+
 # Toggle para esta vista (true por defecto si hay secrets)
 DO_SHEETS_UPSERT = bool(st.secrets.get("nueva_alerta_upsert_to_sheets", True))
 
@@ -109,6 +127,77 @@ def _dedup_keep_last_with_id(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
+# Horas que se consideran "sin registrar" al sellar con la hora actual
+_EMPTY_HOURS = {"", "nan", "NaN", "None", "00:00"}
+_EMPTY_DATES = {"", "nan", "NaN", "None", "NaT"}
+# Pares fecha → hora que se sellan con h_now si falta la hora
+_STAMP_PAIRS = [
+    ("Fecha de detección", "Hora de detección"),
+    ("Fecha de corrección", "Hora de corrección"),
+]
+
+
+def _strip_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Texto recortado por celda; nulos → ''."""
+    return df.apply(lambda s: s.where(s.notna(), "").astype(str).str.strip())
+
+
+def _stamp_candidates(df_grid: pd.DataFrame) -> pd.DataFrame:
+    """Filas de la grilla con fecha (detección/corrección) y sin hora: se sellan aunque no se hayan editado."""
+    if not isinstance(df_grid, pd.DataFrame) or df_grid.empty:
+        return pd.DataFrame()
+    m = pd.Series(False, index=df_grid.index)
+    for fcol, hcol in _STAMP_PAIRS:
+        if fcol in df_grid.columns and hcol in df_grid.columns:
+            sub = _strip_frame(df_grid[[fcol, hcol]])
+            m |= ~sub[fcol].isin(_EMPTY_DATES) & sub[hcol].isin(_EMPTY_HOURS)
+    return df_grid[m.to_numpy()]
+
+
+def _apply_alert_edits(
+    df_base: pd.DataFrame, df_edit: pd.DataFrame, cols: list[str], h_now: str
+) -> tuple[pd.DataFrame, dict[str, set[str]], int]:
+    """
+    Aplica por lotes las columnas de alerta de la grilla sobre la base, alineando por Id.
+    - Solo se escriben valores no vacíos que difieren del actual.
+    - Si hay fecha y falta hora (detección/corrección) se sella h_now.
+    Devuelve (base actualizada, mapa Id → columnas cambiadas, n° de celdas escritas).
+    """
+    base_ids = df_base["Id"].astype(str).str.strip()
+
+    new = _strip_frame(df_edit.reindex(columns=cols))
+    new.index = df_edit["Id"].astype(str).str.strip().to_numpy()
+    new = new[(new.index != "") & new.index.isin(base_ids)]
+    new = new[~new.index.duplicated(keep="last")]
+    if new.empty:
+        return df_base, {}, 0
+
+    # Valor actual = primera fila de cada Id
+    old = df_base[cols].set_axis(base_ids.to_numpy(), axis=0)
+    old = _strip_frame(old[~old.index.duplicated(keep="first")].loc[new.index])
+
+    diff = (new != "") & (new != old)
+    cur = old.mask(diff, new)
+
+    for fcol, hcol in _STAMP_PAIRS:
+        if fcol in cur.columns and hcol in cur.columns:
+            stamp = ~cur[fcol].isin(_EMPTY_DATES) & cur[hcol].isin(_EMPTY_HOURS)
+            cur.loc[stamp, hcol] = h_now
+            diff.loc[stamp, hcol] = True
+
+    # Una asignación por columna, solo en los Ids que cambiaron
+    for c in cols:
+        upd = cur.loc[diff[c].to_numpy(), c]
+        if len(upd):
+            m = base_ids.isin(upd.index).to_numpy()
+            df_base.loc[m, c] = base_ids[m].map(upd).to_numpy()
+
+    dm = diff.to_numpy()
+    col_arr = pd.Index(cols)
+    cell_map = {rid: set(col_arr[row]) for rid, row in zip(diff.index, dm) if row.any()}
+    return df_base, cell_map, int(dm.sum())
+
+
 def _bootstrap_df_main():
     """
     Si df_main no existe o está vacío:
@@ -126,7 +215,7 @@ def _bootstrap_df_main():
     # 1) Local
     df_local = _load_local_if_exists()
     if isinstance(df_local, pd.DataFrame) and not df_local.empty:
-        st.session_state["df_main"] = df_local.copy()
+        st.session_state["df_main"] = ensure_unique_ids(df_local, "el archivo local")
         return
 
     # 2) Sheets (ahora usando open_sheet_by_url correctamente)
@@ -138,7 +227,7 @@ def _bootstrap_df_main():
                 sh = open_sheet_by_url(ss_url)
                 df_sh = read_df_from_worksheet(sh, ws_name)
                 if isinstance(df_sh, pd.DataFrame) and not df_sh.empty:
-                    st.session_state["df_main"] = df_sh.fillna("").astype(str)
+                    st.session_state["df_main"] = ensure_unique_ids(df_sh.fillna("").astype(str), "Google Sheets")
                     return
     except Exception:
         pass
@@ -159,8 +248,7 @@ def render(user: dict | None = None):
         _bootstrap_df_main()
 
         st.markdown('<div id="na-section">', unsafe_allow_html=True)
-        st.markdown(
-            """
+        inject_css("nueva_alerta", """
         <style>
           #na-section .stButton > button { width: 100% !important; }
           .section-na .help-strip-na + .form-card{ margin-top: 6px !important; }
@@ -191,9 +279,7 @@ def render(user: dict | None = None):
           }
           .na-pill span{ display:inline-flex; gap:8px; align-items:center; }
         </style>
-        """,
-            unsafe_allow_html=True,
-        )
+        """)
 
         c_pill, _, _, _, _, _ = st.columns([A, Fw, T_width, D, R, C], gap="medium")
         with c_pill:
@@ -212,9 +298,10 @@ def render(user: dict | None = None):
         )
 
         # Base (filtrada por ACL)
-        df_all = st.session_state.get("df_main", pd.DataFrame()).copy()
-        df_all = _dedup_keep_last_with_id(df_all)
-        df_all = apply_scope(df_all, user=user)
+        df_all = st.session_state.get("df_main", pd.DataFrame())
+        if "Id" in df_all.columns:
+            df_all = df_all[valid_id_mask(df_all).to_numpy()]
+        df_all = apply_scope(df_all.copy(), user=user)
 
         # 🔒 Refuerzo local: si NO es super, solo ve sus propias tareas (Responsable)
         if not _is_super_alert_editor() and "Responsable" in df_all.columns:
@@ -281,23 +368,12 @@ def render(user: dict | None = None):
                 )
                 c_resp = None  # placeholder
 
-            fases_all = sorted(
-                [
-                    x
-                    for x in df_all.get("Fase", pd.Series([], dtype=str)).astype(str).unique()
-                    if x and x != "nan"
-                ]
-            )
-            na_fase = c_fase.selectbox("Fase", ["Todas"] + fases_all, index=0)
-
-            tipos_all = sorted(
-                [
-                    x
-                    for x in df_all.get("Tipo de tarea", pd.Series([], dtype=str)).astype(str).unique()
-                    if x and x != "nan"
-                ]
+            fx = get_facet_index(
+                df_all, ["Responsable", "Fase", "Tipo de tarea", "_ESTADO_ALERTA_"],
+                key=f"nueva_alerta:{is_super}:{_display_name().strip()}",
             )
-            na_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + tipos_all, index=0)
+            na_fase = c_fase.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0)
+            na_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + fx.options("Tipo de tarea"), index=0)
 
             # Estado actual (labels con emoji, valor interno sin emoji)
             estado_labels = {
@@ -317,20 +393,7 @@ def render(user: dict | None = None):
             )
 
             if is_super:
-                df_resp_src = df_all.copy()
-                if na_fase != "Todas" and "Fase" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[df_resp_src["Fase"].astype(str) == na_fase]
-                if na_tipo != "Todos" and "Tipo de tarea" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[df_resp_src["Tipo de tarea"].astype(str) == na_tipo]
-                responsables_all = sorted(
-                    [
-                        x
-                        for x in df_resp_src.get("Responsable", pd.Series([], dtype=str))
-                        .astype(str)
-                        .unique()
-                        if x and x != "nan"
-                    ]
-                )
+                responsables_all = fx.options("Responsable", {"Fase": na_fase, "Tipo de tarea": na_tipo})
                 na_resp = c_resp.selectbox("Responsable", ["Todos"] + responsables_all, index=0)
             else:
                 na_resp = "Todos"
@@ -348,31 +411,19 @@ def render(user: dict | None = None):
 
         df_tasks = df_all.copy()
         if na_do_buscar:
-            if is_super and na_resp != "Todos" and "Responsable" in df_tasks.columns:
-                df_tasks = df_tasks[df_tasks["Responsable"].astype(str) == na_resp]
-            if na_fase != "Todas" and "Fase" in df_tasks.columns:
-                df_tasks = df_tasks[df_tasks["Fase"].astype(str) == na_fase]
-            if na_tipo != "Todos" and "Tipo de tarea" in df_tasks.columns:
-                df_tasks = df_tasks[df_tasks["Tipo de tarea"].astype(str) == na_tipo]
-            if na_estado != "Todos" and "_ESTADO_ALERTA_" in df_tasks.columns:
-                df_tasks = df_tasks[df_tasks["_ESTADO_ALERTA_"].astype(str) == na_estado]
-
-            if "Fecha inicio" in df_tasks.columns:
-                fcol = pd.to_datetime(df_tasks["Fecha inicio"], errors="coerce")
-            elif "Fecha Registro" in df_tasks.columns:
-                fcol = pd.to_datetime(df_tasks["Fecha Registro"], errors="coerce")
-            else:
-                fcol = pd.to_datetime(
-                    df_tasks.get("Fecha", pd.Series([], dtype=str)), errors="coerce"
-                )
-
-            if na_desde:
-                mask_desde = fcol.isna() | (fcol >= pd.to_datetime(na_desde))
-                df_tasks = df_tasks[mask_desde]
-            if na_hasta:
-                limite = pd.to_datetime(na_hasta) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-                mask_hasta = fcol.isna() | (fcol <= limite)
-                df_tasks = df_tasks[mask_hasta]
+            df_tasks = fx.filter(df_all, {
+                "Responsable": na_resp if is_super else "Todos",
+                "Fase": na_fase,
+                "Tipo de tarea": na_tipo,
+                "_ESTADO_ALERTA_": na_estado,
+            }).copy()
+
+            fcol_name = next(
+                (c for c in ["Fecha inicio", "Fecha Registro"] if c in df_tasks.columns), "Fecha"
+            )
+            df_tasks = df_tasks[
+                date_range_mask(df_tasks, fcol_name, na_desde or None, na_hasta or None, include_nat=True)
+            ]
 
         st.markdown("**Resultados**")
 
@@ -442,7 +493,7 @@ def render(user: dict | None = None):
         }"""
         )
 
-        // 🎨 Colores suaves: sin grises ni rojos
+        # 🎨 Colores suaves: sin grises ni rojos
         si_no_style_genero = JsCode(
             """
         function(p){
@@ -590,24 +641,40 @@ def render(user: dict | None = None):
         grid_opts["onGridReady"] = on_ready_size.js_code
         grid_opts["onFirstDataRendered"] = on_first_data.js_code
 
+        df_view, grid_opts = track_edits(df_view, grid_opts)
         grid = AgGrid(
             df_view,
             gridOptions=grid_opts,
             data_return_mode=DataReturnMode.FILTERED_AND_SORTED,
-            update_mode=GridUpdateMode.VALUE_CHANGED,
+            update_mode=COMMIT_UPDATE_MODE,  # sesión de edición: sin rerun por celda
             fit_columns_on_grid_load=False,
             enable_enterprise_modules=False,
             reload_data=False,
             height=420,
             allow_unsafe_jscode=True,
             theme="balham",
+            custom_css=commit_button_css("💾 Guardar"),
+            key=grid_key("grid_nueva_alerta"),
         )
 
+        # El botón del grid envía y guarda en un solo clic
         _sp, _btn = st.columns([A + Fw + T_width + D + R, C], gap="medium")
+        with _sp:
+            render_pending(grid, "💾 Guardar")
         with _btn:
-            if st.button("💾 Guardar", use_container_width=True):
+            if commit_requested(grid, "grid_nueva_alerta"):
                 try:
-                    df_edit = pd.DataFrame(grid.get("data", []))
+                    # Filas con celdas editadas en el cliente + (como antes) toda fila de la
+                    # grilla con fecha y sin hora, para sellar la hora aunque no se haya tocado.
+                    # Estas últimas salen del df_view del servidor (sin reconstruir la grilla).
+                    df_edit = edited_rows(grid)
+                    df_stamp = _stamp_candidates(df_view.drop(columns=[DIRTY_FIELD], errors="ignore"))
+                    if not df_stamp.empty and not df_edit.empty and "Id" in df_edit.columns:
+                        # La versión editada de una fila manda sobre la del servidor
+                        ya = df_edit["Id"].astype(str).str.strip()
+                        df_stamp = df_stamp[~df_stamp["Id"].astype(str).str.strip().isin(ya)]
+                    if not df_stamp.empty:
+                        df_edit = pd.concat([df_edit, df_stamp], ignore_index=True)
                     df_base = st.session_state.get("df_main", pd.DataFrame()).copy()
 
                     if (
@@ -632,61 +699,16 @@ def render(user: dict | None = None):
                             if c not in df_base.columns:
                                 df_base[c] = ""
 
-                        cambios = 0
-                        changed_ids: set[str] = set()
                         _now = _now_lima_trimmed_local()
                         h_now = _now.strftime("%H:%M")
 
-                        for _, row in df_edit.iterrows():
-                            id_row = str(row.get("Id", "")).strip()
-                            if not id_row:
-                                continue
-                            m = df_base["Id"].astype(str).str.strip() == id_row
-                            if not m.any():
-                                continue
-
-                            def _set(col_base, val):
-                                nonlocal cambios
-                                v = "" if val is None else str(val).strip()
-                                if v != "":
-                                    prev = str(df_base.loc[m, col_base].iloc[0]).strip() if m.any() else ""
-                                    if v != prev:
-                                        df_base.loc[m, col_base] = v
-                                        cambios += 1
-                                        changed_ids.add(id_row)
-
-                            # Set básicos (incluye Tipo de alerta)
-                            _set("¿Generó alerta?", row.get("¿Generó alerta?"))
-                            _set("N° alerta", row.get("N° alerta"))
-                            _set("Fecha de detección", row.get("Fecha de detección"))
-                            _set("Hora de detección", row.get("Hora de detección"))
-                            _set("¿Se corrigió?", row.get("¿Se corrigió?"))
-                            _set("Fecha de corrección", row.get("Fecha de corrección"))
-                            _set("Hora de corrección", row.get("Hora de corrección"))
-                            _set("Tipo de alerta", row.get("Tipo de alerta"))
-
-                            # Si hay fecha y falta hora -> sellamos con hora Lima
-                            if (
-                                str(df_base.loc[m, "Fecha de detección"].iloc[0]).strip()
-                                and str(df_base.loc[m, "Hora de detección"].iloc[0]).strip()
-                                in {"", "nan", "NaN", "00:00"}
-                            ):
-                                df_base.loc[m, "Hora de detección"] = h_now
-                                cambios += 1
-                                changed_ids.add(id_row)
-
-                            if (
-                                str(df_base.loc[m, "Fecha de corrección"].iloc[0]).strip()
-                                and str(df_base.loc[m, "Hora de corrección"].iloc[0]).strip()
-                                in {"", "nan", "NaN", "00:00"}
-                            ):
-                                df_base.loc[m, "Hora de corrección"] = h_now
-                                cambios += 1
-                                changed_ids.add(id_row)
+                        df_base, cell_map, cambios = _apply_alert_edits(
+                            df_base, df_edit, alert_cols, h_now
+                        )
+                        changed_ids: set[str] = set(cell_map)
 
                         if cambios > 0:
-                            # Persistir en sesión
-                            df_base = _dedup_keep_last_with_id(df_base)
+                            # Persistir en sesión (Ids ya únicos: invariante de df_main)
                             st.session_state["df_main"] = df_base.copy()
 
                             # Guardado local (si hay maybe_save lo respeta)
@@ -724,6 +746,7 @@ def render(user: dict | None = None):
 
                             if res_local.get("ok", False):
                                 st.success(f"✔ Cambios guardados: {cambios} actualización(es).")
+                                reset_grid("grid_nueva_alerta")
                                 st.rerun()
                             else:
                                 st.info(res_local.get("msg", "Guardado deshabilitado."))
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import os
 import re
-import base64
 from io import BytesIO
 from datetime import date, datetime
 import time
@@ -12,6 +11,11 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode, JsCode
+from utils.css_registry import inject_css
+from utils.fingerprints import RowSnapshot, derived_cache, row_hashes
+from utils.grid_pages import page_window
+from utils.pages import go_home
+from utils.static_assets import first_asset_url
 
 # 👇 ACL: para filtrar vista (Vivi/Enrique ven todo, resto solo lo suyo)
 try:
@@ -20,6 +24,14 @@ except Exception:
     def apply_scope(df, user=None):  # fallback no-op
         return df
 
+# 👇 Invariante de Id único en df_main (upsert por Id)
+try:
+    from shared import ensure_unique_ids, upsert_tasks, apply_cell_edits  # type: ignore
+except Exception:
+    ensure_unique_ids = None
+    upsert_tasks = None
+    apply_cell_edits = None
+
 # 👇 Upsert centralizado (utils/gsheets) — usado en distintas secciones
 try:
     from utils.gsheets import upsert_rows_by_id, open_sheet_by_url  # type: ignore
@@ -320,6 +332,10 @@ def pull_user_slice_from_sheet(replace_df_main: bool = True):
         for c in alerta_cols[1:]:
             df.drop(columns=c, inplace=True, errors="ignore")
 
+    # Duplicados de la hoja: se reportan y resuelven aquí, una sola vez
+    if ensure_unique_ids is not None:
+        df = ensure_unique_ids(df, "Google Sheets")
+
     if "Id" in df.columns and isinstance(st.session_state.get("df_main"), pd.DataFrame) and "Id" in st.session_state["df_main"].columns:
         base = st.session_state["df_main"].copy()
         base["Id"] = base["Id"].astype(str)
@@ -328,17 +344,20 @@ def pull_user_slice_from_sheet(replace_df_main: bool = True):
         all_cols = list(dict.fromkeys(list(base.columns) + list(df.columns)))
         base = base.reindex(columns=all_cols)
         df = df.reindex(columns=all_cols)
-        base_idx = base.set_index("Id")
-        upd_idx = df.set_index("Id")
-        base_idx.update(upd_idx)
-        merged = base_idx.combine_first(upd_idx).reset_index()
+        if upsert_tasks is not None:
+            merged = upsert_tasks(base, df, keep_existing_on_na=True)
+        else:
+            base_idx = base.set_index("Id")
+            upd_idx = df.set_index("Id")
+            base_idx.update(upd_idx)
+            merged = base_idx.combine_first(upd_idx).reset_index()
         st.session_state["df_main"] = merged
     else:
         if replace_df_main:
             st.session_state["df_main"] = df
-    # *** NUEVO: baseline para reconstruir difs si se pierde el snapshot
+    # *** NUEVO: baseline (huellas) para reconstruir difs si se pierde el snapshot
     try:
-        st.session_state["_hist_baseline"] = st.session_state["df_main"].copy()
+        _set_hist_baseline(st.session_state["df_main"])
     except Exception:
         pass
     return df
@@ -579,6 +598,13 @@ def _add_business_days(start_dates: pd.Series, days: pd.Series) -> pd.Series:
     return out
 
 
+# Entradas y derivados que forman la huella de una fila
+_DEADLINE_COLS = [
+    "Duración", "Fecha inicio", "Fecha Terminado",
+    "Fecha Vencimiento", "Hora Vencimiento", "Cumplimiento",
+]
+
+
 # *** NUEVO: asegurar cálculo de Fecha límite/Hora límite y Cumplimiento en un df dado
 def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
@@ -590,6 +616,33 @@ def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
         return _canonicalize_link_column(df)
 
     df = df.copy()
+    if "Hora Vencimiento" not in df.columns:
+        df["Hora Vencimiento"] = ""
+    if "Cumplimiento" not in df.columns:
+        df["Cumplimiento"] = ""
+
+    # Solo se recalculan filas cuya huella (entradas + derivados) no está ya materializada
+    cache = derived_cache("_nt_derived_cache")
+    dirty = cache.dirty(row_hashes(df, _DEADLINE_COLS))
+    if dirty.any():
+        sub = _compute_deadline_and_compliance(df.loc[dirty].copy())
+        for c in ("Fecha Vencimiento", "Hora Vencimiento", "Cumplimiento"):
+            if c in sub.columns:
+                if c not in df.columns:
+                    df[c] = pd.NaT
+                df.loc[dirty, c] = sub[c].to_numpy()
+        done = df.loc[dirty]
+        # sin Fecha Terminado → Cumplimiento depende de hoy (refresco diario)
+        if "Fecha Terminado" in done.columns:
+            daily = to_naive_local_series(done["Fecha Terminado"]).isna().to_numpy()
+        else:
+            daily = np.ones(len(done), dtype=bool)
+        cache.remember(row_hashes(done, _DEADLINE_COLS), daily)
+    return _canonicalize_link_column(df)
+
+
+def _compute_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
+    """Cálculo completo de Fecha/Hora límite y Cumplimiento sobre `df` (ya copiado)."""
     # Fecha límite (solo con Duración + Fecha inicio)
     if ("Duración" in df.columns) and ("Fecha inicio" in df.columns):
         dur_num = pd.to_numeric(df["Duración"], errors="coerce")
@@ -632,61 +685,32 @@ def _ensure_deadline_and_compliance(df: pd.DataFrame) -> pd.DataFrame:
     out[no_delivered] = "❌ No entregado"
     out[risk] = "⚠️ En riesgo de retrasos"
     df["Cumplimiento"] = out
-    return _canonicalize_link_column(df)
+    return df
+
+
+# *** NUEVO: baseline como huellas por fila/celda (sin copia completa de df_main)
+def _set_hist_baseline(df: pd.DataFrame):
+    st.session_state["_hist_baseline"] = RowSnapshot(
+        _ensure_deadline_and_compliance(df)
+    )
 
 
 # *** NUEVO: baseline diff (reconstrucción si no hay snapshot por edición)
 def _derive_pending_from_baseline(
     curr: pd.DataFrame,
-    base: pd.DataFrame,
+    base: RowSnapshot | None,
     allowed_cols: set[str] | None = None,
 ):
-    pend_ids, cell_diff, new_ids = set(), {}, set()
     if curr is None or curr.empty or "Id" not in curr.columns:
-        return pend_ids, cell_diff, new_ids
-    if base is None or base.empty or "Id" not in base.columns:
+        return set(), {}, set()
+    if not isinstance(base, RowSnapshot) or base.empty:
         # todo es nuevo
         new_ids = set(curr["Id"].astype(str).tolist())
-        pend_ids = set(new_ids)
-        return pend_ids, cell_diff, new_ids
-
-    c = _canonicalize_link_column(curr.copy())
-    b = _canonicalize_link_column(base.copy())
-    c["Id"] = c["Id"].astype(str)
-    b["Id"] = b["Id"].astype(str)
-    c_idx = c.set_index("Id", drop=False)
-    b_idx = b.set_index("Id", drop=False)
-
-    cols = list(dict.fromkeys([x for x in c.columns if x in b.columns]))
-    if allowed_cols:
-        cols = [x for x in cols if x in allowed_cols or x == "Id"]
+        return set(new_ids), {}, new_ids
 
     # garantizar cálculo de derivados antes de comparar
-    c_idx = _ensure_deadline_and_compliance(c_idx)
-    b_idx = _ensure_deadline_and_compliance(b_idx)
-
-    # nuevos
-    for iid in c_idx.index:
-        if iid not in b_idx.index:
-            new_ids.add(iid)
-            pend_ids.add(iid)
-
-    common = c_idx.index.intersection(b_idx.index)
-    if len(common):
-        a = b_idx.loc[common, cols].fillna("").astype(str)
-        d = c_idx.loc[common, cols].fillna("").astype(str)
-        neq = a.ne(d)
-        changed_any = neq.any(axis=1)
-        ids_changed = changed_any[changed_any].index
-        for rid in ids_changed:
-            pend_ids.add(rid)
-            diff_mask = neq.loc[rid].to_numpy()
-            cols_changed = set(neq.columns[diff_mask].tolist())
-            if allowed_cols:
-                cols_changed = {x for x in cols_changed if x in allowed_cols}
-            if cols_changed:
-                cell_diff[str(rid)] = cols_changed
-    return pend_ids, cell_diff, new_ids
+    c = _ensure_deadline_and_compliance(curr)
+    return base.diff(c, allowed_cols=allowed_cols)
 
 
 # --- Bootstrap fuerte de df_main (garantiza que "pegue" en todas las pestañas) ---
@@ -698,20 +722,23 @@ def _bootstrap_df_main_hist():
     )
     if not need:
         # baseline si aún no existe
-        st.session_state.setdefault("_hist_baseline", st.session_state["df_main"].copy())
+        if not isinstance(st.session_state.get("_hist_baseline"), RowSnapshot):
+            _set_hist_baseline(st.session_state["df_main"])
         return
 
     df_local = _load_local_if_exists()
     if isinstance(df_local, pd.DataFrame) and not df_local.empty:
-        st.session_state["df_main"] = df_local.copy()
-        st.session_state["_hist_baseline"] = df_local.copy()
+        st.session_state["df_main"] = (
+            ensure_unique_ids(df_local, "el archivo local") if ensure_unique_ids is not None else df_local.copy()
+        )
+        _set_hist_baseline(df_local)
         return
 
     try:
         pull_user_slice_from_sheet(replace_df_main=True)
     except Exception:
         st.session_state["df_main"] = pd.DataFrame(columns=DEFAULT_COLS)
-        st.session_state["_hist_baseline"] = st.session_state["df_main"].copy()
+        _set_hist_baseline(st.session_state["df_main"])
 
 
 # =========================================================
@@ -720,8 +747,7 @@ def _bootstrap_df_main_hist():
 def render_historial(user: dict | None = None):
 
     # ====== CSS (AJUSTES pedidos) ======
-    st.markdown(
-        """
+    inject_css("nueva_tarea_recientes", """
     <style>
       :root{
         --pill-salmon:#F28B85;
@@ -892,9 +918,7 @@ def render_historial(user: dict | None = None):
         .hist-hero-text{ margin-top: 6px; }
       }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """)
 
     # ====== DATA BASE (bootstrap fuerte) ======
     _bootstrap_df_main_hist()
@@ -922,16 +946,16 @@ def render_historial(user: dict | None = None):
 
     # ===== Imagen + texto "Ahora revisa tus tareas" (AL INICIO, sobre pasos) =====
     try:
-        _img_b64 = _hist_img_base64()
+        _img_url = _hist_img_url()
     except Exception:
-        _img_b64 = ""
+        _img_url = ""
 
-    if _img_b64:
+    if _img_url:
         st.markdown(
             f"""
             <div class="hist-hero">
               <div class="hist-hero-img">
-                <img src="data:image/png;base64,{_img_b64}" alt="Tareas recientes" />
+                <img src="{_img_url}" alt="Tareas recientes" />
               </div>
               <div class="hist-hero-text">
                 Ahora revisa tus tareas
@@ -1652,9 +1676,17 @@ def render_historial(user: dict | None = None):
     grid_opts["rememberSelection"] = True
     grid_opts["floatingFilter"] = False
 
-    grid_resp = AgGrid(
+    # ⚡ Paginación del lado del servidor: orden + ventana en pandas, al grid solo va la página
+    df_page, page_sig = page_window(
         df_grid,
-        key="grid_historial",
+        key="hist_grid",
+        labels=header_map,
+        sort_cols=[c for c in df_grid.columns if c != _LINK_CANON],
+    )
+
+    grid_resp = AgGrid(
+        df_page,
+        key=f"grid_historial_{page_sig}",
         gridOptions=grid_opts,
         theme="balham",
         height=500,
@@ -1707,8 +1739,19 @@ def render_historial(user: dict | None = None):
             prev_map = a.set_index("Id", drop=False)
             curr_map = b.set_index("Id", drop=False)
 
-            for iid, row in curr_map.iterrows():
-                if iid and iid != "nan" and iid not in prev_map.index:
+            # Nuevo = Id que no existe en df_main (con paginación, prev es solo la página anterior)
+            main_ids = set(
+                st.session_state.get("df_main", pd.DataFrame())
+                .get("Id", pd.Series(dtype=str))
+                .astype(str)
+            )
+            for iid in curr_map.index:
+                if (
+                    iid
+                    and iid != "nan"
+                    and iid not in prev_map.index
+                    and iid not in main_ids
+                ):
                     new_only_ids_run.add(iid)
                     changed_ids_run.add(iid)
 
@@ -1753,25 +1796,18 @@ def render_historial(user: dict | None = None):
         }
         st.session_state["_hist_new_ids"] = sorted(pend_new)
 
-        if new_df is not None:
+        # La grilla devuelve solo la página: se escriben en df_main únicamente las celdas editadas
+        if new_df is not None and cell_diff_run and apply_cell_edits is not None:
             base = st.session_state.get("df_main", pd.DataFrame()).copy()
             base = _canonicalize_link_column(base)
             new_df = _canonicalize_link_column(new_df)
-            if ("Id" in base.columns) and ("Id" in new_df.columns):
-                base["Id"] = base["Id"].astype(str)
-                new_df["Id"] = new_df["Id"].astype(str)
-                base_idx = base.set_index("Id")
-                new_idx = new_df.set_index("Id")
-                cols_to_update = [c for c in new_idx.columns if c in base_idx.columns]
-                base_idx.update(new_df[cols_to_update])
-                st.session_state["df_main"] = base_idx.reset_index()
-            else:
-                st.session_state["df_main"] = new_df
+            st.session_state["df_main"] = apply_cell_edits(base, new_df, cell_diff_run)
             try:
                 _save_local(st.session_state["df_main"].copy())
             except Exception:
                 pass
 
+        if new_df is not None:
             try:
                 st.session_state["_hist_prev"] = new_df.reindex(
                     columns=snap_cols
@@ -1969,28 +2005,11 @@ def render_historial(user: dict | None = None):
                             base_line = st.session_state.get(
                                 "_hist_baseline"
                             )
-                            if isinstance(base_line, pd.DataFrame):
-                                cur = base_full.set_index("Id")
-                                old = _ensure_deadline_and_compliance(
-                                    base_line
-                                ).set_index("Id")
-                                common = cur.index.intersection(
-                                    old.index
+                            if isinstance(base_line, RowSnapshot):
+                                _, c_diff, _ = base_line.diff(
+                                    base_full, allowed_cols={"Cumplimiento"}
                                 )
-                                if (
-                                    len(common)
-                                    and "Cumplimiento" in cur.columns
-                                    and "Cumplimiento" in old.columns
-                                ):
-                                    ch = (
-                                        old.loc[
-                                            common, "Cumplimiento"
-                                        ].astype(str)
-                                        != cur.loc[
-                                            common, "Cumplimiento"
-                                        ].astype(str)
-                                    )
-                                    ids_cumpl = set(common[ch])
+                                ids_cumpl = set(c_diff)
 
                         if ids_cumpl:
                             try:
@@ -2031,9 +2050,7 @@ def render_historial(user: dict | None = None):
                             st.session_state["_hist_new_ids"] = []
                             # baseline = estado actual tras subir
                             try:
-                                st.session_state["_hist_baseline"] = (
-                                    base_full.copy()
-                                )
+                                _set_hist_baseline(base_full)
                             except Exception:
                                 pass
                             try:
@@ -2096,11 +2113,11 @@ except Exception:
         return (a3 or "GEN") + (r3 or "")
 
     def next_id_by_person(df: pd.DataFrame, area: str, resp: str) -> str:
+        # Sin shared: máximo sufijo existente + 1 (no reutiliza números tras eliminar)
         prefix = make_id_prefix(area, resp)
         if "Id" in df.columns:
-            ids = df["Id"].astype(str)
-            mask = ids.str.startswith(prefix + "_")
-            n = int(mask.sum()) + 1
+            suf = df["Id"].astype(str).str.strip().str.extract(rf"^{re.escape(prefix)}_(\d+)$")[0]
+            n = int(pd.to_numeric(suf, errors="coerce").max() or 0) + 1 if suf.notna().any() else 1
         else:
             n = len(df.index) + 1
         return f"{prefix}_{n}"
@@ -2139,16 +2156,11 @@ def log_reciente_safe(*args, **kwargs):
 # ============================================================
 #   HELPER: imagen del banner "Nueva tarea"
 # ============================================================
-@st.cache_data
-def _hero_img_base64() -> str:
+def _hero_img_url() -> str:
     """
-    Devuelve el PNG del banner en base64.
+    URL estática (con hash) del banner "Nueva tarea".
     Busca en la carpeta 'assets' con varios nombres posibles.
     """
-    import base64
-    from pathlib import Path
-
-    assets_dir = Path("assets")
     candidatos = [
         "NUEVA_TAREA.png",   # <- tu archivo principal de Nueva tarea
         "nueva_tarea.png",
@@ -2157,38 +2169,25 @@ def _hero_img_base64() -> str:
         "TAREA NUEVA.png",
         "tarea_nueva.png",
     ]
-    for nombre in candidatos:
-        ruta = assets_dir / nombre
-        if ruta.exists():
-            return base64.b64encode(ruta.read_bytes()).decode("utf-8")
-    return ""
+    return first_asset_url([os.path.join("assets", n) for n in candidatos], width=480)
 
 
 # ============================================================
 #   HELPER: imagen del separador "Tareas recientes"
 #   (ENI2025/assets/TAREAS_RECIENTES.png)
 # ============================================================
-@st.cache_data
-def _hist_img_base64() -> str:
+def _hist_img_url() -> str:
     """
-    Devuelve el PNG del banner de 'Tareas recientes' en base64.
+    URL estática (con hash) del banner de 'Tareas recientes'.
     Espera encontrarlo en la carpeta 'assets'.
     """
-    import base64
-    from pathlib import Path
-
-    assets_dir = Path("assets")
     candidatos = [
         "TAREAS_RECIENTES.png",   # <- archivo que mencionaste
         "tareas_recientes.png",
         "TAREAS-RECIENTES.png",
         "TAREAS RECIENTES.png",
     ]
-    for nombre in candidatos:
-        ruta = assets_dir / nombre
-        if ruta.exists():
-            return base64.b64encode(ruta.read_bytes()).decode("utf-8")
-    return ""
+    return first_asset_url([os.path.join("assets", n) for n in candidatos], width=480)
 
 
 # ============================================================
@@ -2226,8 +2225,7 @@ def render_nueva_tarea(user: dict | None = None):
     """Vista: ➕ Nueva tarea (parte superior)"""
 
     # ===== CSS =====
-    st.markdown(
-        """
+    inject_css("nueva_tarea", """
     <style>
     /* ===== Quitar la “hoja” blanca gigante del centro ===== */
     section.main{
@@ -2450,9 +2448,7 @@ def render_nueva_tarea(user: dict | None = None):
       .nt-step-label{ white-space: normal; }
     }
     </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """)
 
 
     # ===== Datos =====
@@ -2480,10 +2476,10 @@ def render_nueva_tarea(user: dict | None = None):
     st.markdown("<div style='height:4px'></div>", unsafe_allow_html=True)
 
     # ===== Banner superior “Nueva tarea” =====
-    hero_b64 = _hero_img_base64()
+    hero_url = _hero_img_url()
     hero_img_html = (
-        f'<img src="data:image/png;base64,{hero_b64}" alt="Nueva tarea" class="nt-hero-img">'
-        if hero_b64 else ""
+        f'<img src="{hero_url}" alt="Nueva tarea" class="nt-hero-img">'
+        if hero_url else ""
     )
     st.markdown(
         f"""
@@ -2619,11 +2615,10 @@ def render_nueva_tarea(user: dict | None = None):
             _t = st.session_state.get("fi_t")
             st.session_state["fi_t_view"] = _t.strftime("%H:%M") if _t else ""
 
-            # ID preview
-            _df_tmp = (
-                st.session_state.get("df_main", pd.DataFrame()).copy()
-                if "df_main" in st.session_state else pd.DataFrame()
-            )
+            # ID preview (secuencia persistente por prefijo; df_main solo para sembrar, sin copiar)
+            _df_tmp = st.session_state.get("df_main", pd.DataFrame())
+            if not isinstance(_df_tmp, pd.DataFrame):
+                _df_tmp = pd.DataFrame()
             prefix = make_id_prefix(
                 st.session_state.get("nt_area", area_fixed),
                 st.session_state.get("nt_resp", ""),
@@ -2712,7 +2707,7 @@ def render_nueva_tarea(user: dict | None = None):
             st.experimental_set_query_params(auth="1", u=display_name)
         except Exception:
             pass
-        st.rerun()
+        go_home()
 
     if submitted and not volver_clicked:
         try:
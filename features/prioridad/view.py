@@ -7,6 +7,13 @@ import pandas as pd
 import streamlit as st
 from st_aggrid import AgGrid, GridUpdateMode, DataReturnMode, JsCode
 
+from utils.css_registry import inject_css
+from utils.grid_edits import (
+    COMMIT_UPDATE_MODE, commit_button_css, commit_requested, edited_cells, grid_key, render_pending,
+    reset_grid, track_edits,
+)
+from utils.indices import get_facet_index, date_range_mask
+
 # 👇 Helpers de Google Sheets
 try:
     from utils.gsheets import upsert_rows_by_id, open_sheet_by_url, read_df_from_worksheet  # type: ignore
@@ -14,6 +21,10 @@ except Exception:
     upsert_rows_by_id = None
     open_sheet_by_url = None
     read_df_from_worksheet = None
+try:
+    from utils.gsheets import update_cells_by_id  # type: ignore
+except Exception:
+    update_cells_by_id = None
 
 # ===== ACL helpers (solo visibilidad/alcance) =====
 try:
@@ -22,6 +33,13 @@ except Exception:
     def apply_scope(df, user=None):
         return df  # fallback no-op
 
+# Invariante de Id único: duplicados de la hoja se resuelven al ingerir
+try:
+    from shared import ensure_unique_ids  # type: ignore
+except Exception:
+    def ensure_unique_ids(df, source="", id_col="Id"):
+        return df
+
 
 def _get_display_name() -> str:
     """Nombre visible del usuario (para match con 'Responsable')."""
@@ -155,20 +173,28 @@ def _strip_emoji(txt: str) -> str:
     return re.sub(r"^[^\wÁÉÍÓÚáéíóúÜüÑñ]*", "", txt).strip()
 
 
+# Tabla etiqueta (sin emoji, minúsculas) → canónico
+_PRI_LOOKUP = {
+    **{k: "Sin asignar" for k in ["", "sin asignar", "sin asignar prioridad", "sin prioridad", "ninguna",
+                                  "none", "nan", "na", "null", "-", "—"]},
+    "urgente": "Urgente",
+    "alto": "Alto", "alta": "Alto",
+    "media": "Medio", "medio": "Medio",
+    "baja": "Bajo", "bajo": "Bajo",
+}
+_EMOJI_PREFIX_RE = r"^[^\wÁÉÍÓÚáéíóúÜüÑñ]*"
+
+
 def _norm_pri(txt: str) -> str:
     """Canónico sin emoji: Sin asignar, Urgente, Alto, Medio, Baja."""
     t = (_strip_emoji(txt) or "").strip().lower()
-    if t in {"", "sin asignar", "sin asignar prioridad", "sin prioridad", "ninguna", "none","nan","na","null","-","—"}:
-        return "Sin asignar"
-    if t == "urgente":
-        return "Urgente"
-    if t in {"alto", "alta"}:
-        return "Alto"
-    if t in {"media", "medio"}:
-        return "Medio"
-    if t in {"baja", "bajo"}:
-        return "Bajo"
-    return t.title()
+    return _PRI_LOOKUP.get(t) or t.title()
+
+
+def _norm_pri_series(s: pd.Series) -> pd.Series:
+    """_norm_pri vectorizado (quitar emoji + tabla de lookup)."""
+    t = s.astype(str).str.replace(_EMOJI_PREFIX_RE, "", regex=True).str.strip().str.lower()
+    return t.map(_PRI_LOOKUP).fillna(t.str.title())
 
 
 def _display_with_emoji(label: str) -> str:
@@ -238,8 +264,7 @@ def render(user: dict | None = None):
 
         # --- contenedor + css ---
         st.markdown('<div id="pri-section">', unsafe_allow_html=True)
-        st.markdown(
-            """
+        inject_css("prioridad", """
         <style>
           #pri-section .stButton > button { width: 100% !important; }
           #pri-section .ag-body-horizontal-scroll,
@@ -267,14 +292,12 @@ def render(user: dict | None = None):
             color: var(--pri-help-text); border-radius: 10px; padding: 8px 12px; margin: 8px 0 12px 0;
           }
         </style>
-        """,
-            unsafe_allow_html=True,
-        )
+        """)
 
         # ====== DATA BASE (solo Sheets). Si no hay df_main, lo cargo de Sheets. ======
         df_main = st.session_state.get("df_main")
         if df_main is None or not isinstance(df_main, pd.DataFrame) or df_main.empty:
-            st.session_state["df_main"] = _load_from_sheets()
+            st.session_state["df_main"] = ensure_unique_ids(_load_from_sheets(), "Google Sheets")
 
         df_all = st.session_state.get("df_main", pd.DataFrame()).copy()
 
@@ -293,6 +316,7 @@ def render(user: dict | None = None):
 
         # 🔒 VISIBILIDAD por usuario
         me = _get_display_name().strip()
+        ver_todas = False
         if not IS_SUPER_VIEWER:
             df_all = apply_scope(df_all, user=st.session_state.get("acl_user"))
             if "Responsable" in df_all.columns and me:
@@ -338,11 +362,12 @@ def render(user: dict | None = None):
                 c_fase, c_tipo, c_estado, c_desde, c_hasta, c_buscar = st.columns([Fw, T_width, D, D, R, C], gap="medium")
                 c_resp = None
 
-            fases_all = sorted([x for x in df_all.get("Fase", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"])
-            pri_fase = c_fase.selectbox("Fase", ["Todas"] + fases_all, index=0)
-
-            tipos_all = sorted([x for x in df_all.get("Tipo de tarea", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"])
-            pri_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + tipos_all, index=0)
+            fx = get_facet_index(
+                df_all, ["Responsable", "Fase", "Tipo de tarea", "_ESTADO_PRI_"],
+                key=f"prioridad:{IS_SUPER_VIEWER}:{ver_todas}:{me}",
+            )
+            pri_fase = c_fase.selectbox("Fase", ["Todas"] + fx.options("Fase"), index=0)
+            pri_tipo = c_tipo.selectbox("Tipo de tarea", ["Todos"] + fx.options("Tipo de tarea"), index=0)
 
             estado_labels = {
                 "No iniciado": "⏳ No iniciado",
@@ -357,12 +382,7 @@ def render(user: dict | None = None):
             pri_estado = "Todos" if sel_label == "Todos" else [k for k, v in estado_labels.items() if v == sel_label][0]
 
             if IS_SUPER_VIEWER:
-                df_resp_src = df_all.copy()
-                if pri_fase != "Todas" and "Fase" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[df_resp_src["Fase"].astype(str) == pri_fase]
-                if pri_tipo != "Todos" and "Tipo de tarea" in df_resp_src.columns:
-                    df_resp_src = df_resp_src[df_resp_src["Tipo de tarea"].astype(str) == pri_tipo]
-                responsables_all = sorted([x for x in df_resp_src.get("Responsable", pd.Series([], dtype=str)).astype(str).unique() if x and x != "nan"])
+                responsables_all = fx.options("Responsable", {"Fase": pri_fase, "Tipo de tarea": pri_tipo})
                 pri_resp = c_resp.selectbox("Responsable", ["Todos"] + responsables_all, index=0)
             else:
                 pri_resp = "Todos"
@@ -376,29 +396,21 @@ def render(user: dict | None = None):
 
         df_filtrado = df_all.copy()
         if pri_do_buscar:
-            if IS_SUPER_VIEWER and pri_resp != "Todos" and "Responsable" in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado["Responsable"].astype(str) == pri_resp]
-            if pri_fase != "Todas" and "Fase" in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado["Fase"].astype(str) == pri_fase]
-            if pri_tipo != "Todos" and "Tipo de tarea" in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado["Tipo de tarea"].astype(str) == pri_tipo]
-            if pri_estado != "Todos" and "_ESTADO_PRI_" in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado["_ESTADO_PRI_"].astype(str) == pri_estado]
-
-            if "Fecha inicio" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha inicio"], errors="coerce")
-            elif "Fecha Vencimiento" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha Vencimiento"], errors="coerce")
-            elif "Fecha Registro" in df_filtrado.columns:
-                fcol = pd.to_datetime(df_filtrado["Fecha Registro"], errors="coerce")
-            else:
-                fcol = pd.to_datetime(df_filtrado.get("Fecha", pd.Series([], dtype=str)), errors="coerce")
-
-            if pri_desde is not None:
-                df_filtrado = df_filtrado[fcol.isna() | (fcol >= pd.to_datetime(pri_desde))]
-            if pri_hasta is not None:
-                limite = pd.to_datetime(pri_hasta) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-                df_filtrado = df_filtrado[fcol.isna() | (fcol <= limite)]
+            df_filtrado = fx.filter(df_all, {
+                "Responsable": pri_resp if IS_SUPER_VIEWER else "Todos",
+                "Fase": pri_fase,
+                "Tipo de tarea": pri_tipo,
+                "_ESTADO_PRI_": pri_estado,
+            }).copy()
+
+            # Rango Desde/Hasta vía índice ordenado compartido (sin fecha = se conserva)
+            fcol_name = next(
+                (c for c in ["Fecha inicio", "Fecha Vencimiento", "Fecha Registro"] if c in df_filtrado.columns),
+                "Fecha",
+            )
+            df_filtrado = df_filtrado[
+                date_range_mask(df_filtrado, fcol_name, pri_desde, pri_hasta, include_nat=True)
+            ]
 
         # ---- Vista con DOS columnas de prioridad ----
         base = df_filtrado.copy()
@@ -406,7 +418,7 @@ def render(user: dict | None = None):
             if c not in base.columns:
                 base[c] = ""
 
-        cur_norm = base["Prioridad"].astype(str).map(_norm_pri)
+        cur_norm = _norm_pri_series(base["Prioridad"].astype(str))
         # Por pedido: mostrar "Alto" por defecto si está sin asignar (solo en la vista)
         cur_norm_display = cur_norm.replace("Sin asignar", "Alto")
         cur_disp_actual = cur_norm_display.map(_display_with_emoji)
@@ -421,8 +433,9 @@ def render(user: dict | None = None):
             "Prioridad a modificar": [""] * len(base),  # editable
         })
 
-        # baseline canónico REAL (sin el “Alto por defecto” de la vista)
-        st.session_state["_pri_base_norm"] = dict(zip(view["Id"].astype(str), cur_norm.astype(str)))
+        # baseline canónico REAL (sin el “Alto por defecto” de la vista), indexado por Id
+        _base_norm = pd.Series(cur_norm.astype(str).to_numpy(), index=view["Id"].to_numpy())
+        st.session_state["_pri_base_norm"] = _base_norm[~_base_norm.index.duplicated(keep="last")]
 
         # ===== Estilo de celdas =====
         priority_cell_style = JsCode(
@@ -478,55 +491,62 @@ def render(user: dict | None = None):
             "suppressHorizontalScroll": False,
         }
 
+        # Solo Vivi/Enrique persisten en Sheets: para ellos el botón del grid es «Dar prioridad»
+        display_name_lc = (_get_display_name() or "").strip().lower()
+        SHOW_BUTTON = display_name_lc.startswith("vivi") or display_name_lc.startswith("enrique")
+
+        view, grid_options = track_edits(view, grid_options)
         grid_resp = AgGrid(
             view,
-            key="grid_prioridad",
+            key=grid_key("grid_prioridad"),
             gridOptions=grid_options,
             theme="balham",
             height=420,
             data_return_mode=DataReturnMode.FILTERED_AND_SORTED,
-            update_mode=(GridUpdateMode.MODEL_CHANGED | GridUpdateMode.FILTERING_CHANGED | GridUpdateMode.SORTING_CHANGED | GridUpdateMode.VALUE_CHANGED),
+            # Sesión de edición: los cambios viajan juntos (botón del grid), sin rerun por celda
+            update_mode=COMMIT_UPDATE_MODE if IS_EDITOR_FLAG else GridUpdateMode.NO_UPDATE,
             allow_unsafe_jscode=True,
+            custom_css=commit_button_css("🏷️ Dar prioridad") if SHOW_BUTTON else None,
         )
 
-        # ===== Detectar cambios (comparar canónico REAL vs 'Prioridad a modificar') =====
+        # ===== Detectar cambios: solo celdas editadas en el cliente ({Id: {col: valor}}) =====
         changed_ids: list[str] = []
-        edits = grid_resp.get("data", [])
-        new_df = (pd.DataFrame(edits) if isinstance(edits, list) else pd.DataFrame(grid_resp.data)).copy()
-
-        if IS_EDITOR_FLAG and not new_df.empty:
-            base_map = st.session_state.get("_pri_base_norm", {}) or {}  # canónico real
-            new_df["Id"] = new_df["Id"].astype(str)
-            new_df["__nuevo_norm"] = new_df.get("Prioridad a modificar", "").astype(str).map(_norm_pri)
+        deltas = edited_cells(grid_resp, cols={"Prioridad a modificar"})
 
-            def _is_changed(row):
-                rid = row["Id"]
-                nuevo = row["__nuevo_norm"]
-                prev = _norm_pri(base_map.get(rid, ""))
-                return (nuevo not in {"", "Sin asignar"}) and (nuevo.lower() != prev.lower())
+        if IS_EDITOR_FLAG and deltas:
+            base_norm = st.session_state.get("_pri_base_norm")  # canónico real (Series por Id)
+            if not isinstance(base_norm, pd.Series):
+                base_norm = pd.Series(dtype=str)
+            nuevo = _norm_pri_series(
+                pd.Series({rid: d.get("Prioridad a modificar", "") for rid, d in deltas.items()}, dtype=object).astype(str)
+            )
+            prev = pd.Series(nuevo.index, index=nuevo.index).map(base_norm).fillna("Sin asignar")
 
-            mask_changed = new_df.apply(_is_changed, axis=1)
-            changed_ids = new_df.loc[mask_changed, "Id"].astype(str).tolist()
+            mask_changed = (~nuevo.isin({"", "Sin asignar"})) & (nuevo.str.lower() != prev.str.lower())
+            changed_ids = nuevo.index[mask_changed].tolist()
 
             if changed_ids:
-                upd_map = new_df.loc[mask_changed, ["Id", "__nuevo_norm"]].set_index("Id")["__nuevo_norm"]
+                upd_map = nuevo[mask_changed]
                 base_full = st.session_state.get("df_main", pd.DataFrame()).copy()
                 if "Id" in base_full.columns:
                     base_full["Id"] = base_full["Id"].astype(str)
-                    base_full.loc[base_full["Id"].isin(upd_map.index), "Prioridad"] = base_full["Id"].map(upd_map).fillna(base_full.get("Prioridad"))
+                    m_upd = base_full["Id"].isin(upd_map.index)
+                    base_full.loc[m_upd, "Prioridad"] = base_full.loc[m_upd, "Id"].map(upd_map).to_numpy()
                     st.session_state["df_main"] = base_full  # Solo memoria; persistimos más abajo en Sheets
 
-        st.session_state["_pri_changed_ids"] = changed_ids
-
-        # ===== BOTÓN GUARDAR (solo Vivi/Enrique) — persiste SOLO en Google Sheets =====
-        display_name_lc = (_get_display_name() or "").strip().lower()
-        SHOW_BUTTON = display_name_lc.startswith("vivi") or display_name_lc.startswith("enrique")
+        # Pendientes acumulados hasta "Dar prioridad" (df_main ya refleja los cambios de corridas previas)
+        pend = list(dict.fromkeys(list(st.session_state.get("_pri_changed_ids", []) or []) + changed_ids))
+        st.session_state["_pri_changed_ids"] = pend
 
+        # ===== GUARDAR (solo Vivi/Enrique) — el envío del grid persiste SOLO en Google Sheets =====
         if SHOW_BUTTON:
             st.markdown('<div style="padding:0 16px; margin-top:8px;">', unsafe_allow_html=True)
             _spacer, b_action = st.columns([6.6, 1.8], gap="medium")
+            if IS_EDITOR_FLAG:
+                with _spacer:
+                    render_pending(grid_resp, "🏷️ Dar prioridad")
             with b_action:
-                click = st.button("🏷️ Dar prioridad", use_container_width=True, disabled=not IS_EDITOR_FLAG, key="btn_dar_prioridad")
+                click = IS_EDITOR_FLAG and commit_requested(grid_resp, "grid_prioridad")
 
             if click and IS_EDITOR_FLAG:
                 try:
@@ -534,7 +554,7 @@ def render(user: dict | None = None):
                     if not ids:
                         st.info("No hay cambios de prioridad para guardar.")
                     else:
-                        if upsert_rows_by_id is None:
+                        if update_cells_by_id is None and upsert_rows_by_id is None:
                             st.warning("No se encontró utils.gsheets.upsert_rows_by_id. Configura utils/gsheets para persistir en Sheets.")
                         else:
                             ss_url, ws_name = _get_sheet_conf()
@@ -542,19 +562,38 @@ def render(user: dict | None = None):
                             base_full["Id"] = base_full.get("Id", "").astype(str)
                             df_rows = base_full[base_full["Id"].isin(ids)].copy()
 
-                            res = upsert_rows_by_id(
-                                ss_url=ss_url,
-                                ws_name=ws_name,
-                                df=df_rows,
-                                ids=[str(x) for x in ids],
-                            )
+                            # Solo la celda Prioridad de cada Id cambiado, en una llamada batch
+                            if update_cells_by_id is not None:
+                                res = update_cells_by_id(
+                                    ss_url=ss_url,
+                                    ws_name=ws_name,
+                                    df=df_rows,
+                                    cols=["Prioridad"],
+                                    ids=[str(x) for x in ids],
+                                )
+                            else:
+                                res = upsert_rows_by_id(
+                                    ss_url=ss_url,
+                                    ws_name=ws_name,
+                                    df=df_rows,
+                                    ids=[str(x) for x in ids],
+                                )
                             if res.get("ok"):
-                                st.success(res.get("msg", "Actualizado."))
+                                # Pendientes y grilla se limpian juntos; el rerun vuelve a pintar
+                                # la grilla desde df_main (el aviso se muestra tras el rerun)
+                                st.session_state["_pri_changed_ids"] = []
+                                st.session_state["_pri_saved_msg"] = res.get("msg", "Actualizado.")
+                                reset_grid("grid_prioridad")
+                                st.rerun()
                             else:
                                 st.warning(res.get("msg", "No se pudo actualizar."))
                 except Exception as e:
                     st.warning(f"No se pudo guardar prioridad: {e}")
 
+            _saved_msg = st.session_state.pop("_pri_saved_msg", None)
+            if _saved_msg:
+                st.success(_saved_msg)
+
             st.markdown("</div>", unsafe_allow_html=True)
 
         # Espacio final de sección
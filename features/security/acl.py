@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import lru_cache
 import os
+import threading
 import unicodedata
 
 import pandas as pd
@@ -48,9 +50,9 @@ def _empty_roles_df() -> pd.DataFrame:
     return df
 
 
-def load_roles(path: str = ROLES_PATH) -> pd.DataFrame:
+def _parse_roles(path: str) -> pd.DataFrame:
     """
-    Carga el Excel de roles aceptando:
+    Lee el Excel de roles aceptando:
       - Hoja 'acl_users' (preferida)
       - Hoja 'users' (compatibilidad)
       - En su defecto, la primera hoja del libro
@@ -122,37 +124,84 @@ _FULL_ACCESS_USERS = {
 }
 
 
+# ===== ACL compilado (caché de proceso, se recarga si cambia el Excel) =====
+_ACL_LOCK = threading.Lock()
+_ACL_CACHE: dict[str, tuple[tuple | None, "CompiledACL"]] = {}
+
+
+class CompiledACL:
+    """
+    Roles ya parseados + índices para búsquedas O(1):
+    nombre normalizado → fila y email → fila (gana la primera aparición, como antes).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.by_name: dict[str, dict] = {}
+        self.by_email: dict[str, dict] = {}
+        if not isinstance(df, pd.DataFrame) or df.empty:
+            return
+        for rec in df.to_dict("records"):
+            k = _name_key(str(rec.get("display_name", "") or ""))
+            if k:
+                self.by_name.setdefault(k, rec)
+            em = str(rec.get("email", "") or "").strip().lower()
+            if em:
+                self.by_email.setdefault(em, rec)
+            # Pre-calcula los sets de pestañas / columnas de solo lectura
+            _split_tabs(str(rec.get("allowed_tabs", "") or ""))
+            _split_list(str(rec.get("read_only_cols", "") or ""))
+
+    def find(self, identifier: str) -> dict:
+        ident = (identifier or "").strip()
+        if not ident:
+            return {}
+        rec = self.by_name.get(_name_key(ident)) or self.by_email.get(ident.lower())
+        return dict(rec) if rec else {}
+
+
+def _file_sig(path: str) -> tuple | None:
+    try:
+        st_ = os.stat(path)
+        return (st_.st_mtime_ns, st_.st_size)
+    except OSError:
+        return None
+
+
+def get_acl(path: str = ROLES_PATH) -> CompiledACL:
+    """ACL compilado de `path`; se re-parsea solo cuando cambia mtime/tamaño del archivo."""
+    sig = _file_sig(path)
+    hit = _ACL_CACHE.get(path)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    with _ACL_LOCK:
+        hit = _ACL_CACHE.get(path)
+        if hit is None or hit[0] != sig:
+            hit = (sig, CompiledACL(_parse_roles(path)))
+            _ACL_CACHE[path] = hit
+    return hit[1]
+
+
+def load_roles(path: str = ROLES_PATH) -> pd.DataFrame:
+    """
+    DataFrame de roles (ver _parse_roles). Compartido entre sesiones: tratarlo como solo lectura.
+    """
+    return get_acl(path).df
+
+
 def find_user(df: pd.DataFrame, identifier: str) -> dict:
     """
     Busca al usuario principalmente por NOMBRE (display_name).
     Mantiene un fallback por email solo por compatibilidad, pero ya
     no se depende de correos para los horarios.
     """
-    ident = (identifier or "").strip()
-    if not ident or not isinstance(df, pd.DataFrame) or df.empty:
+    if not isinstance(df, pd.DataFrame) or df.empty:
         return {}
-
-    # --- 1) Buscar por display_name (solo nombres) ---
-    try:
-        key = _name_key(ident)
-        if key:
-            col = df["display_name"].astype(str).map(_name_key)
-            m = df[col == key]
-            if not m.empty:
-                return m.iloc[0].to_dict()
-    except Exception:
-        pass
-
-    # --- 2) Fallback por email (solo por compatibilidad antigua) ---
-    try:
-        em = ident.lower()
-        m = df[df["email"].astype(str).str.strip().str.lower() == em]
-        if not m.empty:
-            return m.iloc[0].to_dict()
-    except Exception:
-        pass
-
-    return {}
+    for _sig, comp in list(_ACL_CACHE.values()):
+        if comp.df is df:
+            return comp.find(identifier)
+    # DataFrame ajeno a la caché (p.ej. armado a mano): índice al vuelo
+    return CompiledACL(df).find(identifier)
 
 
 def _now_lima() -> datetime:
@@ -224,14 +273,15 @@ def can_access_now(user_row: dict) -> tuple[bool, str]:
         return (True, "")
 
 
-def _split_tabs(s: str) -> set[str]:
-    # soporta 'ALL' y lista separada por comas
+@lru_cache(maxsize=1024)
+def _split_tabs(s: str) -> frozenset[str]:
+    # soporta 'ALL' y lista separada por comas (memoizado: se repite en cada check)
     t = (s or "").strip()
     if not t:
-        return set()
+        return frozenset()
     if t.upper() == "ALL":
-        return {"ALL"}
-    return {x.strip() for x in t.split(",") if x.strip()}
+        return frozenset({"ALL"})
+    return frozenset(x.strip() for x in t.split(",") if x.strip())
 
 
 def can_see_tab(user_row: dict, tab_key: str) -> bool:
@@ -266,9 +316,10 @@ def maybe_save(user_row: dict, fn, *args, **kwargs):
 
 
 # ===== Soporte a columnas de solo lectura por usuario =====
-def _split_list(s: str) -> set[str]:
+@lru_cache(maxsize=1024)
+def _split_list(s: str) -> frozenset[str]:
     """Convierte 'a, b, c' -> {'a','b','c'} (sin espacios vacíos)."""
-    return {x.strip() for x in str(s or "").split(",") if x and x.strip()}
+    return frozenset(x.strip() for x in str(s or "").split(",") if x and x.strip())
 
 
 def get_readonly_cols(user_row: dict) -> set[str]:
@@ -276,7 +327,7 @@ def get_readonly_cols(user_row: dict) -> set[str]:
     Devuelve el conjunto de columnas que deben ser solo-lectura para este usuario.
     Se alimenta desde la columna 'read_only_cols' del Excel de roles.
     """
-    return _split_list(user_row.get("read_only_cols", ""))
+    return set(_split_list(str(user_row.get("read_only_cols", "") or "")))
 
 
 # === Helper: hidratar st.session_state['acl_user'] desde el Excel de roles ===
@@ -3,15 +3,19 @@
 # Gestión — ENI2025 (App única)
 # ============================
 import streamlit as st
-import pandas as pd
 from pathlib import Path
 import importlib
-import base64  # para incrustar el video como base64
-from urllib.parse import quote  # para codificar el nombre en la URL
 
-# ===== Import robusto de shared con fallbacks =====
+# Antes del login solo se cargan módulos ligeros (streamlit + CSS/assets).
+# pandas, shared, ACL, aggrid y Google se importan tras check_app_password()
+# — presupuesto y reporte por módulo: python -m utils.import_budget
+from utils.css_registry import register_css, use_css
+from utils.static_assets import banner_url, warm_assets
+
+# ===== Fallback de ensure_df_main (si shared no se puede importar) =====
 def _fallback_ensure_df_main():
     import os
+    import pandas as pd
     path = os.path.join("data", "tareas.csv")
     os.makedirs("data", exist_ok=True)
 
@@ -37,20 +41,6 @@ def _fallback_ensure_df_main():
 
     st.session_state["df_main"] = df
 
-try:
-    _shared = importlib.import_module("shared")
-    patch_streamlit_aggrid = getattr(_shared, "patch_streamlit_aggrid")
-    inject_global_css      = getattr(_shared, "inject_global_css")
-    ensure_df_main         = getattr(_shared, "ensure_df_main")
-except Exception:
-    patch_streamlit_aggrid = lambda: None
-    inject_global_css      = lambda: None
-    ensure_df_main         = _fallback_ensure_df_main
-
-# 🔐 ACL / Roles
-from features.security import acl
-from utils.avatar import show_user_avatar_from_session  # por si luego lo usamos
-
 LOGO_PATH = Path("assets/branding/eni2025_logo.png")
 HEADER_IMG_PATH = Path("assets/ENCABEZADO.png")  # 👈 nuevo banner horizontal
 ROLES_XLSX = "data/security/roles.xlsx"
@@ -63,13 +53,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ============ Parches/estilos globales ============
-patch_streamlit_aggrid()
-inject_global_css()
-
 # 👉 Estilos específicos (sidebar + layout + topbar + tarjetas)
-st.markdown(
-    """
+register_css("app", """
 <style>
   /* =========================================================
      NUEVO LOOK (como tu imagen):
@@ -101,6 +86,12 @@ st.markdown(
     z-index:1;
   }
 
+  /* Cargadores de CSS (iframes de alto 0, utils/css_registry) sin hueco en el layout */
+  .element-container:has(> iframe[height="0"]),
+  [data-testid="stElementContainer"]:has(> iframe[height="0"]){
+    display:none !important;
+  }
+
   .eni-banner{
     margin:6px 0 14px;
     font-weight:400;
@@ -616,10 +607,7 @@ st.markdown(
   }
 
 </style>
-""",
-    unsafe_allow_html=True,
-)
-
+""")
 
 
 
@@ -689,8 +677,7 @@ def check_app_password() -> bool:
         return True
 
     # ---- Pantalla de login ----
-    st.markdown(
-        """
+    register_css("login", """
     <style>
       /* Fondo BLANCO solo para el LOGIN */
       html, body, [data-testid="stAppViewContainer"]{
@@ -736,20 +723,17 @@ def check_app_password() -> bool:
         margin-top:-0.45rem !important;
       }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """)
 
-    st.markdown(
-        """
+    register_css("login_fit", """
     <style>
       html, body, [data-testid="stAppViewContainer"], .main{
         overflow: hidden !important;
       }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """)
+    use_css("app", "login", "login_fit")
+
 
     st.markdown("<div style='margin-top:7vh;'></div>", unsafe_allow_html=True)
 
@@ -820,15 +804,14 @@ def check_app_password() -> bool:
         hero_video = Path("assets/hero.mp4")
         logo_img   = Path("assets/branding/eni2025_logo.png")
         if hero_video.exists():
-            with open(hero_video, "rb") as f:
-                data = f.read()
-            b64 = base64.b64encode(data).decode("utf-8")
+            # URL estática con hash (el navegador la cachea; ya no viaja en cada rerun)
+            video_url = banner_url("hero_video")
             video_html = f"""
             <div style="margin-left:-280px; margin-top:-120px;">
               <video autoplay loop muted playsinline
                      style="width:100%;max-width:460px;
                             display:block;margin:0;">
-                <source src="data:video/mp4;base64,{b64}" type="video/mp4">
+                <source src="{video_url}" type="video/mp4">
               </video>
             </div>
             """
@@ -843,13 +826,40 @@ def check_app_password() -> bool:
 if not check_app_password():
     st.stop()
 
+# ============ Dependencias pesadas (solo con sesión iniciada) ============
+import pandas as pd
+
+try:
+    _shared = importlib.import_module("shared")
+    patch_streamlit_aggrid = getattr(_shared, "patch_streamlit_aggrid")
+    inject_global_css      = getattr(_shared, "inject_global_css")
+    ensure_df_main         = getattr(_shared, "ensure_df_main")
+except Exception:
+    patch_streamlit_aggrid = lambda: None
+    inject_global_css      = lambda *keys: use_css(*keys)
+    ensure_df_main         = _fallback_ensure_df_main
+
+# 🔐 ACL / Roles
+from features.security import acl
+from utils.avatar import show_user_avatar_from_session  # por si luego lo usamos
+from utils.fragments import view_fragment
+from utils.pages import HAS_NAVIGATION, PageSpec, page_href, run_page, select_page, switch_to
+
+# ============ Parches/estilos globales ============
+patch_streamlit_aggrid()
+# Un solo bundle minificado (global + app)
+inject_global_css("app")
+
+# ============ Assets estáticos (hash + WebP/redimensionado, una vez por proceso) ============
+warm_assets()
+
 # ============ AUTENTICACIÓN (usuario genérico) ============
 email = st.session_state.get("user_email") or (st.session_state.get("user") or {}).get("email", "eni2025@app")
 
 # ============ Carga de ROLES / ACL ============
 try:
-    if "roles_df" not in st.session_state:
-        st.session_state["roles_df"] = acl.load_roles(ROLES_XLSX)
+    # ACL compilado y cacheado por proceso (se recarga solo si cambia roles.xlsx)
+    st.session_state["roles_df"] = acl.load_roles(ROLES_XLSX)
     user_acl = acl.find_user(st.session_state["roles_df"], email)
 except Exception as _e:
     st.error("No pude cargar el archivo de roles. Verifica data/security/roles.xlsx.")
@@ -878,6 +888,8 @@ try:
     if isinstance(_roles_df, pd.DataFrame):
         mask_me = _roles_df["email"].astype(str).str.lower() == (email or "").lower()
         if mask_me.any():
+            # load_roles comparte el frame entre sesiones: escribir sobre una copia propia
+            _roles_df = _roles_df.copy()
             _roles_df.loc[mask_me, "is_active"] = True
             _roles_df.loc[mask_me, "can_edit_all_tabs"] = True
             st.session_state["roles_df"] = _roles_df
@@ -901,11 +913,8 @@ def _push_gsheets(df: pd.DataFrame):
     if "gsheets" not in st.secrets or "gcp_service_account" not in st.secrets:
         raise KeyError("Faltan 'gsheets' o 'gcp_service_account' en secrets.")
     import gspread
-    from google.oauth2.service_account import Credentials
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scopes)
-    gc = gspread.authorize(creds)
-    ss = gc.open_by_url(st.secrets["gsheets"]["spreadsheet_url"])
+    from utils.gsheets import open_sheet_by_url  # cliente cacheado (st.cache_resource)
+    ss = open_sheet_by_url(st.secrets["gsheets"]["spreadsheet_url"])
     ws_name = st.secrets["gsheets"].get("worksheet", "TareasRecientes")
     try:
         ws = ss.worksheet(ws_name)
@@ -990,27 +999,6 @@ def _on_sidebar_nav_change():
 
     st.rerun()
 
-with st.sidebar:
-    if LOGO_PATH.exists():
-        st.markdown("<div class='eni-logo-wrap'>", unsafe_allow_html=True)
-        st.image(str(LOGO_PATH), width=120)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    nav_labels = ["Gestión de tareas", "Kanban", "Gantt", "Dashboard"]
-    current_section = st.session_state.get("nav_section", DEFAULT_SECTION)
-    if current_section not in nav_labels:
-        current_section = DEFAULT_SECTION
-    default_idx = nav_labels.index(current_section)
-
-    st.radio(
-        "Navegación",
-        nav_labels,
-        index=default_idx,
-        label_visibility="collapsed",
-        key="nav_section",
-        horizontal=False,
-        on_change=_on_sidebar_nav_change,  # ✅ AQUÍ
-    )
 
 # ============ Datos ============
 ensure_df_main()
@@ -1018,10 +1006,10 @@ ensure_df_main()
 # ===== Tarjetas rápidas (HTML con <a>, como antes) =====
 def _quick_card_link(title: str, subtitle: str, icon: str, tile_key: str) -> str:
     display_name = st.session_state.get("user_display_name", "Usuario")
-    u_param = quote(display_name, safe="")
+    href = page_href(PAGE_BY_KEY[tile_key], auth="1", u=display_name)
     card_class = f"eni-quick-card eni-quick-card--{tile_key}"
     return f"""
-    <a href="?auth=1&u={u_param}&tile={tile_key}" target="_self" class="eni-quick-card-link">
+    <a href="{href}" target="_self" class="eni-quick-card-link">
       <div class="{card_class}">
         <div class="eni-quick-card-text">
           <div class="eni-quick-card-title">{title}</div>
@@ -1032,32 +1020,8 @@ def _quick_card_link(title: str, subtitle: str, icon: str, tile_key: str) -> str
     </a>
     """
 
-# ===== leer parámetro de tarjeta seleccionada (tile) =====
-tile_param = ""
-try:
-    params = st.query_params
-    raw = params.get("tile", "")
-    if isinstance(raw, list):
-        tile_param = raw[0] if raw else ""
-    else:
-        tile_param = raw
-except Exception:
-    try:
-        params = st.experimental_get_query_params()
-        raw = params.get("tile", [""])
-        tile_param = raw[0] if raw else ""
-    except Exception:
-        tile_param = ""
-
-# 👇 El "estado" de qué vista mostrar SIEMPRE viene de la URL
-st.session_state["home_tile"] = tile_param or ""
-tile = st.session_state["home_tile"]
-
-section = st.session_state.get("nav_section", DEFAULT_SECTION)
-tab_key = TAB_KEY_BY_SECTION.get(section, "tareas_recientes")
-
-# ============ Contenido principal ============
-if section == "Gestión de tareas":
+# ===== Topbar (avatar + logout; «Volver» en las páginas de tarjeta) =====
+def _display_name_clean() -> str:
     dn = st.session_state.get("user_display_name", "Usuario")
 
     # Nombre “limpio” sin emoji final
@@ -1065,11 +1029,11 @@ if section == "Gestión de tareas":
     if parts:
         last = parts[-1]
         if not any(ch.isalnum() for ch in last):
-            dn_clean = " ".join(parts[:-1]) or dn
-        else:
-            dn_clean = dn
-    else:
-        dn_clean = dn
+            return " ".join(parts[:-1]) or dn
+    return dn
+
+def _topbar(tile: bool) -> str:
+    dn_clean = _display_name_clean()
 
     # Iniciales para el círculo (VS, EO, etc.)
     name_parts_clean = dn_clean.split()
@@ -1079,179 +1043,159 @@ if section == "Gestión de tareas":
             initials += p[0].upper()
     initials = initials or "VS"
 
-    u_param = quote(st.session_state.get("user_display_name", "Usuario"), safe="")
-
-    # ---- Topbar con avatar + logout ----
     if tile:
-        st.markdown(
-            f"""
-            <div class="eni-main-topbar">
-              <div class="eni-main-topbar-title">
-                <a class="eni-home-link" href="?auth=1&u={u_param}" target="_self">🏠 Volver</a>
-              </div>
-              <div class="eni-main-topbar-user">
-                <div class="eni-main-topbar-avatar">{initials}</div>
-                <a href="?logout=1" class="eni-main-topbar-logout">Cerrar sesión</a>
-              </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        home_href = page_href(PAGE_BY_KEY["inicio"], auth="1",
+                              u=st.session_state.get("user_display_name", "Usuario"))
+        title_html = f'<a class="eni-home-link" href="{home_href}" target="_self">🏠 Volver</a>'
     else:
-        st.markdown(
-            f"""
-            <div class="eni-main-topbar">
-              <div class="eni-main-topbar-title">📋 Gestión de tareas</div>
-              <div class="eni-main-topbar-user">
-                <div class="eni-main-topbar-avatar">{initials}</div>
-                <a href="?logout=1" class="eni-main-topbar-logout">Cerrar sesión</a>
-              </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        title_html = "📋 Gestión de tareas"
+    st.markdown(
+        f"""
+        <div class="eni-main-topbar">
+          <div class="eni-main-topbar-title">
+            {title_html}
+          </div>
+          <div class="eni-main-topbar-user">
+            <div class="eni-main-topbar-avatar">{initials}</div>
+            <a href="?logout=1" class="eni-main-topbar-logout">Cerrar sesión</a>
+          </div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    return dn_clean
 
-    if tile:
-        module_path = TILE_TO_VIEW_MODULE.get(tile)
-        if module_path:
-            try:
-                view_module = importlib.import_module(module_path)
-                render_fn = getattr(view_module, "render", None)
-                if render_fn is None:
-                    render_fn = getattr(view_module, "render_all", None)
-
-                if callable(render_fn):
-                    st.markdown('<div class="eni-view-wrapper">', unsafe_allow_html=True)
-                    view_module_fn_user = st.session_state.get("user")
-                    render_fn(view_module_fn_user)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.info(
-                        "Vista pendiente para esta tarjeta "
-                        "(no se encontró función 'render' ni 'render_all')."
-                    )
-            except Exception as e:
-                st.info("No se pudo cargar la vista para esta tarjeta.")
-                st.exception(e)
-        else:
-            st.info("Todavía no hay una vista vinculada a esta tarjeta.")
+# ============ Páginas (cada una importa su vista recién al abrirse) ============
+def _page_inicio():
+    dn_clean = _topbar(tile=False)
 
-    else:
-        first_name = dn_clean.split()[0] if dn_clean else "Usuario"
-        first_name_l = first_name.lower()
+    first_name = dn_clean.split()[0] if dn_clean else "Usuario"
+    first_name_l = first_name.lower()
 
-        female_names = {"elizabet", "lucy", "tiffany", "vivian"}
+    female_names = {"elizabet", "lucy", "tiffany", "vivian"}
 
-        if first_name_l.endswith("a") or first_name_l in female_names:
-            welcome_word = "Bienvenida"
-        else:
-            welcome_word = "Bienvenido"
+    if first_name_l.endswith("a") or first_name_l in female_names:
+        welcome_word = "Bienvenida"
+    else:
+        welcome_word = "Bienvenido"
 
-        welcome_line1 = welcome_word
-        welcome_line2 = dn_clean
+    welcome_line1 = welcome_word
+    welcome_line2 = dn_clean
 
-        # ===== HERO HTML (siempre se crea) =====
-        hero_html = ""
-        if HEADER_IMG_PATH.exists():
-            try:
-                with open(HEADER_IMG_PATH, "rb") as f:
-                    data = f.read()
-                b64_header = base64.b64encode(data).decode("utf-8")
-                hero_html = f"""
-                <div class="eni-main-hero eni-main-hero--home">
-                  <div class="eni-main-hero-text">
-                    <div class="eni-main-hero-welcome">{welcome_line1}</div>
-                    <div class="eni-main-hero-name">{welcome_line2}</div>
-                  </div>
-                  <img src="data:image/png;base64,{b64_header}"
-                       alt="ENI 2025 encabezado"
-                       class="eni-main-hero-img" />
-                </div>
-                """
-            except Exception:
-                hero_html = f"""
-                <div class="eni-main-hero eni-main-hero--home">
-                  <div class="eni-main-hero-text">
-                    <div class="eni-main-hero-welcome">{welcome_line1}</div>
-                    <div class="eni-main-hero-name">{welcome_line2}</div>
-                  </div>
-                </div>
-                """
-        else:
+    # ===== HERO HTML (siempre se crea) =====
+    hero_html = ""
+    if HEADER_IMG_PATH.exists():
+        try:
+            header_url = banner_url("encabezado")
             hero_html = f"""
             <div class="eni-main-hero eni-main-hero--home">
               <div class="eni-main-hero-text">
                 <div class="eni-main-hero-welcome">{welcome_line1}</div>
                 <div class="eni-main-hero-name">{welcome_line2}</div>
               </div>
+              <img src="{header_url}"
+                   alt="ENI 2025 encabezado"
+                   class="eni-main-hero-img" />
             </div>
             """
-
-        # ===== izquierda: tarjetas en vertical (con aire) =====
-        left_cards_html = f"""
-        <div class="eni-quick-grid-wrapper eni-quick-grid-wrapper--stack">
-          <div class="eni-quick-grid eni-quick-grid--stack">
-            {_quick_card_link(
-                "1. Nueva tarea",
-                "Registra una nueva tarea y revísala",
-                "➕",
-                "nueva_tarea",
-            )}
-            {_quick_card_link(
-                "2. Editar estado",
-                "Actualiza fases y fechas",
-                "✏️",
-                "editar_estado",
-            )}
-            {_quick_card_link(
-                "3. Nueva alerta",
-                "Registra alertas y riesgos prioritarios",
-                "⚠️",
-                "nueva_alerta",
-            )}
-            {_quick_card_link(
-                "4. Prioridad",
-                "Revisa los niveles de prioridad",
-                "⭐",
-                "prioridad_evaluacion",
-            )}
-            {_quick_card_link(
-                "5. Evaluación",
-                "Revisa las evaluaciones y cumplimiento",
-                "📝",
-                "nueva_tarea",
-            )}
+        except Exception:
+            hero_html = f"""
+            <div class="eni-main-hero eni-main-hero--home">
+              <div class="eni-main-hero-text">
+                <div class="eni-main-hero-welcome">{welcome_line1}</div>
+                <div class="eni-main-hero-name">{welcome_line2}</div>
+              </div>
+            </div>
+            """
+    else:
+        hero_html = f"""
+        <div class="eni-main-hero eni-main-hero--home">
+          <div class="eni-main-hero-text">
+            <div class="eni-main-hero-welcome">{welcome_line1}</div>
+            <div class="eni-main-hero-name">{welcome_line2}</div>
           </div>
         </div>
         """
 
-        # ===== derecha: nuevos bloques vacíos (3 tarjetas) =====
-        kpi_html = """
-        <div class="eni-kpi-grid">
-          <div class="eni-box eni-box--big"></div>
-          <div class="eni-kpi-right">
-            <div class="eni-box eni-box--small"></div>
-            <div class="eni-box eni-box--small"></div>
-          </div>
-        </div>
-        """
+    # ===== izquierda: tarjetas en vertical (con aire) =====
+    left_cards_html = f"""
+    <div class="eni-quick-grid-wrapper eni-quick-grid-wrapper--stack">
+      <div class="eni-quick-grid eni-quick-grid--stack">
+        {_quick_card_link(
+            "1. Nueva tarea",
+            "Registra una nueva tarea y revísala",
+            "➕",
+            "nueva_tarea",
+        )}
+        {_quick_card_link(
+            "2. Editar estado",
+            "Actualiza fases y fechas",
+            "✏️",
+            "editar_estado",
+        )}
+        {_quick_card_link(
+            "3. Nueva alerta",
+            "Registra alertas y riesgos prioritarios",
+            "⚠️",
+            "nueva_alerta",
+        )}
+        {_quick_card_link(
+            "4. Prioridad",
+            "Revisa los niveles de prioridad",
+            "⭐",
+            "prioridad_evaluacion",
+        )}
+        {_quick_card_link(
+            "5. Evaluación",
+            "Revisa las evaluaciones y cumplimiento",
+            "📝",
+            "nueva_tarea",
+        )}
+      </div>
+    </div>
+    """
+
+    # ===== derecha: nuevos bloques vacíos (3 tarjetas) =====
+    kpi_html = """
+    <div class="eni-kpi-grid">
+      <div class="eni-box eni-box--big"></div>
+      <div class="eni-kpi-right">
+        <div class="eni-box eni-box--small"></div>
+        <div class="eni-box eni-box--small"></div>
+      </div>
+    </div>
+    """
 
-        # ✅ HOME: tarjetas angostas a la izquierda, banner ARRIBA a la derecha, y 3 bloques ABAJO
-        col_left, col_right = st.columns([0.28, 0.72], gap="large")  # ✅ izquierda más angosta
-        with col_left:
-            st.markdown(left_cards_html, unsafe_allow_html=True)
+    # ✅ HOME: tarjetas angostas a la izquierda, banner ARRIBA a la derecha, y 3 bloques ABAJO
+    col_left, col_right = st.columns([0.28, 0.72], gap="large")  # ✅ izquierda más angosta
+    with col_left:
+        st.markdown(left_cards_html, unsafe_allow_html=True)
 
-        with col_right:
-            # ✅ 1) Banner lila/azul ARRIBA
-            st.markdown(hero_html, unsafe_allow_html=True)
+    with col_right:
+        # ✅ 1) Banner lila/azul ARRIBA
+        st.markdown(hero_html, unsafe_allow_html=True)
 
-            # espacio entre banner y bloques
-            st.markdown("<div style='height:16px;'></div>", unsafe_allow_html=True)
+        # espacio entre banner y bloques
+        st.markdown("<div style='height:16px;'></div>", unsafe_allow_html=True)
 
-            # ✅ 2) Los 3 bloques nuevos ABAJO
-            st.markdown(kpi_html, unsafe_allow_html=True)
+        # ✅ 2) Los 3 bloques nuevos ABAJO
+        st.markdown(kpi_html, unsafe_allow_html=True)
 
-elif section == "Kanban":
+def _tile_page(tile_key: str):
+    def _render():
+        _topbar(tile=True)
+        module_path = TILE_TO_VIEW_MODULE.get(tile_key)
+        if module_path:
+            # ⚡ La vista corre como fragmento: grid/filtros/guardar re-ejecutan solo este bloque
+            st.markdown('<div class="eni-view-wrapper">', unsafe_allow_html=True)
+            view_fragment(module_path)
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.info("Todavía no hay una vista vinculada a esta tarjeta.")
+    _render.__name__ = f"_page_{tile_key}"
+    return _render
+
+def _page_kanban():
     st.title("🗂️ Kanban")
     def _render_kanban():
         try:
@@ -1260,9 +1204,9 @@ elif section == "Kanban":
         except Exception as e:
             st.info("Vista Kanban pendiente (features/kanban/view.py).")
             st.exception(e)
-    render_if_allowed(tab_key, _render_kanban)
+    render_if_allowed(TAB_KEY_BY_SECTION["Kanban"], _render_kanban)
 
-elif section == "Gantt":
+def _page_gantt():
     st.title("📅 Gantt")
     def _render_gantt():
         try:
@@ -1271,11 +1215,63 @@ elif section == "Gantt":
         except Exception as e:
             st.info("Vista Gantt pendiente (features/gantt/view.py).")
             st.exception(e)
-    render_if_allowed(tab_key, _render_gantt)
+    render_if_allowed(TAB_KEY_BY_SECTION["Gantt"], _render_gantt)
 
-else:
+def _page_dashboard():
     st.title("📊 Dashboard")
     def _render_dashboard():
         st.caption("Próximamente: visualizaciones y KPIs del dashboard.")
         st.write("")
-    render_if_allowed(tab_key, _render_dashboard)
+    render_if_allowed(TAB_KEY_BY_SECTION["Dashboard"], _render_dashboard)
+
+# 📑 Registro de páginas: key = ruta (/key) y valor legado de ?tile=
+PAGES = [
+    PageSpec("inicio", "Gestión de tareas", "📋", _page_inicio, "Gestión de tareas", default=True),
+    PageSpec("nueva_tarea", "Nueva tarea", "➕", _tile_page("nueva_tarea"), "Gestión de tareas", tile=True),
+    PageSpec("editar_estado", "Editar estado", "✏️", _tile_page("editar_estado"), "Gestión de tareas", tile=True),
+    PageSpec("nueva_alerta", "Nueva alerta", "⚠️", _tile_page("nueva_alerta"), "Gestión de tareas", tile=True),
+    PageSpec("prioridad_evaluacion", "Prioridad", "⭐", _tile_page("prioridad_evaluacion"), "Gestión de tareas", tile=True),
+    PageSpec("kanban", "Kanban", "🗂️", _page_kanban, "Kanban"),
+    PageSpec("gantt", "Gantt", "📅", _page_gantt, "Gantt"),
+    PageSpec("dashboard", "Dashboard", "📊", _page_dashboard, "Dashboard"),
+]
+PAGE_BY_KEY = {p.key: p for p in PAGES}
+
+# ============ Página actual ============
+page = select_page(PAGES, st.session_state.get("nav_section", DEFAULT_SECTION))
+st.session_state["home_tile"] = page.key if page.tile else ""
+
+# Si la página cambió por la URL (tarjeta, enlace, recarga), el sidebar la refleja
+if st.session_state.get("_nav_last_page") != page.key:
+    st.session_state["_nav_last_page"] = page.key
+    st.session_state["nav_section"] = page.section
+
+with st.sidebar:
+    if LOGO_PATH.exists():
+        st.markdown("<div class='eni-logo-wrap'>", unsafe_allow_html=True)
+        st.image(str(LOGO_PATH), width=120)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    nav_labels = ["Gestión de tareas", "Kanban", "Gantt", "Dashboard"]
+    current_section = st.session_state.get("nav_section", DEFAULT_SECTION)
+    if current_section not in nav_labels:
+        current_section = DEFAULT_SECTION
+    default_idx = nav_labels.index(current_section)
+
+    st.radio(
+        "Navegación",
+        nav_labels,
+        index=default_idx,
+        label_visibility="collapsed",
+        key="nav_section",
+        horizontal=False,
+        on_change=_on_sidebar_nav_change,  # ✅ AQUÍ
+    )
+
+# Sidebar → página de la sección elegida (con st.navigation cada sección es su ruta)
+section = st.session_state.get("nav_section", DEFAULT_SECTION)
+if HAS_NAVIGATION and section != page.section:
+    switch_to(next(p.key for p in PAGES if p.section == section and not p.tile))
+
+# ============ Contenido principal (solo la página elegida) ============
+run_page(page)
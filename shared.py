@@ -2,12 +2,17 @@
 # Utilidades compartidas (ENI2025)
 # ============================
 from __future__ import annotations
+import json
 import os
+import threading
 from io import BytesIO
 from datetime import datetime, date, time, timezone
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from utils.css_registry import register_css, use_css
+
 # -------- Patch Streamlit + st-aggrid ----------
 def patch_streamlit_aggrid():
     try:
@@ -293,8 +298,15 @@ def ensure_df_main():
 
     # Normalizaciones + defaults sin perder columnas adicionales
     base = base.loc[:, ~pd.Index(base.columns).duplicated()].copy()
+    base = ensure_unique_ids(base, "la carga inicial")
     base = _ensure_defaults(base)
 
+    # Secuencias de Id: siembra única desde los Ids cargados
+    try:
+        seed_id_sequences(base)
+    except Exception:
+        pass
+
     # Mantener orden: columnas base conocidas primero, luego el resto
     keep_first = [c for c in COLS if c in base.columns]
     others = [c for c in base.columns if c not in keep_first]
@@ -319,6 +331,172 @@ def blank_row():
     except Exception:
         return {"Área":None,"Id":None,"Tarea":None,"Tipo":None,"Responsable":None,"Fase":None,"Estado":None,"Fecha inicio":None,"Ciclo de mejora":None,"Detalle":None}
 
+# --------- Invariante: Id único en df_main ----------
+_BLANK_IDS = {"", "-", "nan", "none", "null"}
+
+def _clean_ids(s: pd.Series) -> pd.Series:
+    """Ids sin espacios; los nulos se quedan nulos (no se vuelven 'nan'/'None')."""
+    return s.where(s.isna(), s.astype(str).str.strip())
+
+def _blank_ids(s: pd.Series) -> pd.Series:
+    return s.isna() | s.astype(str).str.strip().str.lower().isin(_BLANK_IDS)
+
+def valid_id_mask(df: pd.DataFrame, id_col: str = "Id") -> pd.Series:
+    """Filas con Id no vacío (no hace pasada de duplicados: df_main ya los tiene resueltos)."""
+    if not isinstance(df, pd.DataFrame) or id_col not in df.columns:
+        return pd.Series(False, index=getattr(df, "index", None), dtype=bool)
+    return ~_blank_ids(df[id_col])
+
+def ensure_unique_ids(df: pd.DataFrame, source: str = "", id_col: str = "Id") -> pd.DataFrame:
+    """
+    Invariante de df_main: cada Id no vacío aparece una sola vez (gana la última fila).
+    Se aplica al ingerir (CSV local / Sheets); los duplicados se reportan y se resuelven aquí,
+    para que las vistas no tengan que volver a deduplicar.
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty or id_col not in df.columns:
+        return df
+    ids = _clean_ids(df[id_col])
+    dup = ids.duplicated(keep="last") & ~_blank_ids(ids)
+    out = df.copy()
+    out[id_col] = ids
+    n = int(dup.sum())
+    if n:
+        out = out[~dup.to_numpy()]
+        where = source or "df_main"
+        rep = st.session_state.setdefault("_id_dup_report", {})
+        rep[where] = int(rep.get(where, 0)) + n
+        st.warning(f"Se encontraron {n} fila(s) con Id repetido en {where}; se conservó la última de cada Id.")
+    return out
+
+def upsert_tasks(base: pd.DataFrame, rows: pd.DataFrame, id_col: str = "Id",
+                 keep_existing_on_na: bool = False) -> pd.DataFrame:
+    """
+    Escritura con semántica upsert por Id (mantiene el invariante):
+    Ids existentes se reemplazan en su posición, Ids nuevos se agregan al final.
+    keep_existing_on_na=True: un nulo entrante no pisa el valor existente (como DataFrame.update).
+    """
+    if not isinstance(rows, pd.DataFrame) or rows.empty:
+        return base
+    if not isinstance(base, pd.DataFrame) or base.empty or id_col not in base.columns:
+        out = ensure_unique_ids(rows, id_col=id_col)
+        _bump_id_sequences(out)
+        return out
+
+    r = rows.copy()
+    r[id_col] = _clean_ids(r[id_col])
+    r = r[~(r[id_col].duplicated(keep="last") & valid_id_mask(r, id_col)).to_numpy()]
+
+    out = base.copy()
+    out[id_col] = _clean_ids(out[id_col])
+    for c in r.columns:
+        if c not in out.columns:
+            out[c] = None
+
+    valid_b = valid_id_mask(out, id_col).to_numpy()
+    pos_by_id = pd.Series(np.flatnonzero(valid_b), index=out[id_col].to_numpy()[valid_b])
+    pos = r[id_col].map(pos_by_id)
+    hit = pos.notna().to_numpy() & valid_id_mask(r, id_col).to_numpy()
+
+    if hit.any():
+        tgt = pos[hit].astype(int).to_numpy()
+        for c in r.columns:
+            j = out.columns.get_loc(c)
+            vals = r[c].to_numpy()[hit]
+            if keep_existing_on_na:
+                vals = np.where(pd.isna(vals), out.iloc[tgt, j].to_numpy(), vals)
+            out.iloc[tgt, j] = vals
+    if (~hit).any():
+        out = pd.concat([out, r[~hit]], ignore_index=True)
+        _bump_id_sequences(r[~hit])
+    return out
+
+def apply_cell_edits(base: pd.DataFrame, edited: pd.DataFrame, cell_diff: dict,
+                     id_col: str = "Id") -> pd.DataFrame:
+    """
+    Escribe en `base` solo las celdas editadas: cell_diff = {Id: {columnas}}, valores tomados de `edited`.
+    `edited` puede ser una página o un subconjunto de la grilla; Ids ausentes en base se ignoran.
+    """
+    if not cell_diff or not isinstance(edited, pd.DataFrame) or edited.empty or id_col not in edited.columns:
+        return base
+    if not isinstance(base, pd.DataFrame) or id_col not in base.columns:
+        return base
+
+    e = edited.copy()
+    e[id_col] = e[id_col].astype(str).str.strip()
+    e = e.drop_duplicates(subset=[id_col], keep="last").set_index(id_col)
+
+    out = base.copy()
+    ids_base = out[id_col].astype(str).str.strip()
+    by_col: dict[str, list[str]] = {}
+    for rid, cols in cell_diff.items():
+        for c in cols:
+            if c != id_col and c in e.columns:
+                by_col.setdefault(c, []).append(str(rid))
+    for c, rids in by_col.items():
+        if c not in out.columns:
+            out[c] = None
+        m = ids_base.isin(rids).to_numpy() & ids_base.isin(e.index).to_numpy()
+        if m.any():
+            out.loc[m, c] = ids_base[m].map(e[c]).to_numpy()
+    return out
+
+# --------- Semillas para tareas nuevas (columnar) ----------
+def _blank_mask(s: pd.Series) -> pd.Series:
+    t = s.astype(str).str.strip()
+    return s.isna() | (t == "") | (t.str.lower() == "nan")
+
+def seed_new_tasks(df: pd.DataFrame, new_mask=None, ts=None) -> pd.DataFrame:
+    """
+    Aplica los defaults de alta SOLO a las filas de new_mask (todas si es None) y devuelve un df nuevo.
+    Sirve para 'Nueva tarea' y para cualquier alta masiva (pegado/importación):
+    - Estado = "No iniciado"; Prioridad = "Media"; Evaluación = "Sin evaluar"; Calificación entera (0 si no es número)
+    - Fase: si es "Otros" y hay texto en Detalle / Detalle de tarea / Detalle tarea, usa ese texto
+    - Fecha/Hora Registro = ts (hora Lima) si faltan; Fecha inicio vacía = Fecha Registro
+    """
+    out = df.copy()
+    m = np.ones(len(out), dtype=bool) if new_mask is None else np.asarray(new_mask, dtype=bool)
+    if not m.any():
+        return out
+
+    ts = ts or now_lima_trimmed()
+    defaults = {
+        "Estado": "No iniciado", "Prioridad": "Media", "Evaluación": "Sin evaluar",
+        "Fase": "", "Fecha Registro": "", "Hora Registro": "", "Fecha inicio": "",
+    }
+    for c, v in defaults.items():
+        if c not in out.columns:
+            out[c] = v
+    if "Calificación" not in out.columns:
+        out["Calificación"] = 0
+
+    cols = list(defaults) + ["Calificación"]
+    sub = out.loc[m, cols].copy()
+
+    for c in ("Estado", "Prioridad", "Evaluación"):
+        sub[c] = sub[c].mask(_blank_mask(sub[c]), defaults[c])
+
+    # Fase "Otros" → primer detalle no vacío
+    detalle_cols = [c for c in ("Detalle", "Detalle de tarea", "Detalle tarea") if c in out.columns]
+    if detalle_cols:
+        det = pd.Series("", index=sub.index, dtype=object)
+        for dc in reversed(detalle_cols):
+            v = out.loc[m, dc]
+            det = det.mask(~_blank_mask(v), v.astype(str).str.strip())
+        es_otros = sub["Fase"].astype(str).str.strip().str.lower() == "otros"
+        sub["Fase"] = sub["Fase"].mask(es_otros & (det != ""), det)
+
+    # Huella de creación
+    sub["Fecha Registro"] = sub["Fecha Registro"].mask(_blank_mask(sub["Fecha Registro"]), ts.date())
+    sub["Hora Registro"] = sub["Hora Registro"].mask(_blank_mask(sub["Hora Registro"]), ts.strftime("%H:%M"))
+    sub["Fecha inicio"] = sub["Fecha inicio"].mask(_blank_mask(sub["Fecha inicio"]), sub["Fecha Registro"])
+
+    sub["Calificación"] = pd.to_numeric(sub["Calificación"], errors="coerce").fillna(0).astype(int)
+
+    for c in cols:
+        out.loc[m, c] = sub[c].to_numpy()
+    _bump_id_sequences(out.loc[m])
+    return out
+
 # --------- Exportar a Excel ----------
 def export_excel(df: pd.DataFrame, filename: str = "ENI2025_tareas.xlsx", sheet_name: str = "Tareas", **kwargs) -> BytesIO:
     if "sheet" in kwargs and not sheet_name:
@@ -395,20 +573,106 @@ def _person_initials(nombre: str) -> str:
 def make_id_prefix(area: str, responsable: str) -> str:
     return f"{_area_initial(area)}{_person_initials(responsable)}"
 
-def next_id_by_person(df: pd.DataFrame, area: str, responsable: str) -> str:
-    prefix = make_id_prefix(area, responsable)
+# --------- Secuencias de Id por prefijo (persistentes) ----------
+# data/id_seq.json guarda {prefijo: último n° asignado}. Se siembra una vez desde los Ids existentes
+# (máximo sufijo, no conteo) y se sube cada vez que df_main gana Ids (upsert_tasks / seed_new_tasks);
+# la vista previa solo lee. Los números no se reutilizan tras eliminar.
+_ID_SEQ_LOCK = threading.Lock()
+_ID_SEQ_CACHE: dict = {"mtime": None, "data": {}}
+_ID_SUFFIX_RE = r"^(?P<prefix>.+)_(?P<n>\d+)$"
+
+def _id_seq_path() -> str:
+    return os.path.join(DATA_DIR, "id_seq.json")
+
+def _id_seq_load() -> dict[str, int]:
+    """Lee id_seq.json (cacheado por mtime)."""
+    path = _id_seq_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return dict(_ID_SEQ_CACHE["data"])
+    if mtime != _ID_SEQ_CACHE["mtime"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = {str(k): int(v) for k, v in (json.load(f) or {}).items()}
+        except Exception:
+            data = dict(_ID_SEQ_CACHE["data"])
+        _ID_SEQ_CACHE.update(mtime=mtime, data=data)
+    return dict(_ID_SEQ_CACHE["data"])
+
+def _id_seq_save(data: dict[str, int]):
+    """Escritura atómica (tmp + replace)."""
+    path = _id_seq_path()
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp, path)
+        _ID_SEQ_CACHE.update(mtime=os.path.getmtime(path), data=dict(data))
+    except Exception:
+        _ID_SEQ_CACHE.update(data=dict(data))
+
+def _max_suffix_by_prefix(df: pd.DataFrame | None) -> dict[str, int]:
+    """{prefijo: máximo sufijo numérico} de los Ids 'PREFIJO_N' del df."""
+    if not isinstance(df, pd.DataFrame) or df.empty or "Id" not in df.columns:
+        return {}
+    parts = df["Id"].astype(str).str.strip().str.extract(_ID_SUFFIX_RE).dropna()
+    if parts.empty:
+        return {}
+    return parts.assign(n=parts["n"].astype(int)).groupby("prefix")["n"].max().astype(int).to_dict()
+
+def seed_id_sequences(df: pd.DataFrame | None) -> dict[str, int]:
+    """Sube cada secuencia al máximo sufijo visto en df (nunca baja). Idempotente."""
+    seen = _max_suffix_by_prefix(df)
+    with _ID_SEQ_LOCK:
+        data = _id_seq_load()
+        bumped = {k: v for k, v in seen.items() if v > data.get(k, 0)}
+        if bumped:
+            data.update(bumped)
+            _id_seq_save(data)
+    return data
+
+def reserve_ids(prefix: str, k: int = 1, df: pd.DataFrame | None = None) -> list[str]:
+    """
+    Reserva atómicamente k Ids consecutivos 'PREFIJO_N' (altas masivas incluidas).
+    Si el prefijo aún no tiene secuencia, se siembra desde df.
+    """
+    if not prefix or k <= 0:
+        return []
+    with _ID_SEQ_LOCK:
+        data = _id_seq_load()
+        last = data.get(prefix)
+        if last is None:
+            last = _max_suffix_by_prefix(df).get(prefix, 0) if isinstance(df, pd.DataFrame) else 0
+        data[prefix] = last + k
+        _id_seq_save(data)
+    return [f"{prefix}_{n}" for n in range(last + 1, last + k + 1)]
+
+def peek_next_id(prefix: str, df: pd.DataFrame | None = None) -> str:
+    """Siguiente Id del prefijo SIN reservarlo (vista previa: solo lectura, no escribe id_seq.json)."""
     if not prefix:
         return ""
-    if "Id" not in df.columns or df.empty:
-        seq = 1
-    else:
-        serie = df["Id"].astype(str).fillna("")
-        seq = 1 + serie.str.startswith(prefix + "_").sum()
-    return f"{prefix}_{seq}"
+    last = _id_seq_load().get(prefix)
+    if last is None:
+        last = _max_suffix_by_prefix(df).get(prefix, 0) if isinstance(df, pd.DataFrame) else 0
+    return f"{prefix}_{last + 1}"
+
+def _bump_id_sequences(rows: pd.DataFrame | None):
+    """Sube las secuencias con los Ids que acaban de entrar a df_main (solo esas filas)."""
+    try:
+        if isinstance(rows, pd.DataFrame) and not rows.empty:
+            seed_id_sequences(rows)
+    except Exception:
+        pass
+
+def next_id_by_person(df: pd.DataFrame, area: str, responsable: str) -> str:
+    """Próximo Id (vista previa) de área/persona; las altas en lote reservan con reserve_ids."""
+    return peek_next_id(make_id_prefix(area, responsable), df)
 
 # --------- CSS global ----------
-def inject_global_css():
-    st.markdown("""
+def inject_global_css(*extra_keys: str):
+    """Estilos globales + los `extra_keys` ya registrados, en un solo bundle (ver utils.css_registry)."""
+    register_css("global", """
 <style>
 :root{
   --lilac:#B38BE3; --lilac-50:#F6EEFF; --lilac-600:#8B5CF6;
@@ -449,7 +713,8 @@ topbar .stButton>button, .topbar-ux .stButton>button, .topbar-na .stButton>butto
   height:var(--pill-h) !important; padding:0 16px !important; border-radius:10px !important; display:inline-flex !important; align-items:center !important;
 }
 </style>
-""", unsafe_allow_html=True)
+""")
+    use_css("global", *extra_keys)
 
 # === ACL helper (Vivi/Enrique ven todo; el resto solo sus tareas) ===============
 import re as _re, unicodedata as _ud
@@ -642,7 +907,7 @@ def hydrate_acl_flags(user: dict | None = None):
                 st.session_state.setdefault("acl_user", {})
                 st.session_state["acl_user"]["allowed_tabs_raw"] = raw_tabs
                 try:
-                    st.session_state["acl_user"]["allowed_tabs_set"] = _acl._split_tabs(raw_tabs)
+                    st.session_state["acl_user"]["allowed_tabs_set"] = set(_acl._split_tabs(raw_tabs))
                 except Exception:
                     st.session_state["acl_user"]["allowed_tabs_set"] = {t.strip() for t in raw_tabs.split(",") if t.strip()}
             except Exception:
@@ -3,6 +3,8 @@ from __future__ import annotations
 from pathlib import Path
 import streamlit as st
 
+from utils.css_registry import inject_css
+
 # -------------------------------------------------------------------
 # Utilidades para resolver y renderizar avatares:
 # - Acepta URL http(s), ruta relativa/absoluta o nombre simple
@@ -97,26 +99,21 @@ def show_avatar_above_greeting(
     - size: tamaño en px del lado del círculo.
     - name_for_fallback: se usa para iniciales si no hay imagen.
     """
-    # CSS solo una vez por sesión
-    if "_avatar_css" not in st.session_state:
-        st.session_state["_avatar_css"] = True
-        st.markdown(
-            """
-            <style>
-              .avatar-wrap{ display:flex; justify-content:center; margin-bottom:8px; }
-              /* Forzamos tamaño por variable CSS, para que no lo limite ningún estilo de Streamlit */
-              .avatar-wrap img{
-                width:var(--avatar-size) !important;
-                height:var(--avatar-size) !important;
-                border-radius:9999px !important;   /* círculo */
-                box-shadow:none !important;        /* sin borde */
-                background:transparent !important; /* respeta PNG transparente */
-                object-fit:cover !important;
-              }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+    # CSS registrado una vez; en cada rerun solo viaja el cargador
+    inject_css("avatar", """
+        <style>
+          .avatar-wrap{ display:flex; justify-content:center; margin-bottom:8px; }
+          /* Forzamos tamaño por variable CSS, para que no lo limite ningún estilo de Streamlit */
+          .avatar-wrap img{
+            width:var(--avatar-size) !important;
+            height:var(--avatar-size) !important;
+            border-radius:9999px !important;   /* círculo */
+            box-shadow:none !important;        /* sin borde */
+            background:transparent !important; /* respeta PNG transparente */
+            object-fit:cover !important;
+          }
+        </style>
+        """)
 
     src = _resolve_avatar(link)
     if src:
@@ -0,0 +1,142 @@
+# utils/css_registry.py
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from utils.static_assets import STATIC_ROOT, _static_enabled, _write_atomic
+
+# Bundles CSS con hash en el nombre (generados al arrancar / primer uso; ignorados en git)
+_CSS_DIR = STATIC_ROOT / "css"
+_URL_PREFIX = "app/static/css/"
+
+# key -> (texto original, css minificado); caché de proceso, compartida por sesiones
+_LOCK = threading.Lock()
+_REGISTRY: dict[str, tuple[str, str]] = {}
+# keys -> (digest, css, url del bundle o None)
+_BUNDLES: dict[tuple, tuple[str, str, str | None]] = {}
+
+# Digests ya enviados completos a este navegador (la sesión vive lo que vive la pestaña)
+_SENT_KEY = "_css_bundles_sent"
+
+_RE_TAGS = re.compile(r"</?style[^>]*>", re.I)
+_RE_COMMENTS = re.compile(r"/\*.*?\*/", re.S)
+_RE_SPACES = re.compile(r"\s+")
+_RE_PUNCT = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(css: str) -> str:
+    """Quita <style>, comentarios y espacios sobrantes (sin tocar selectores como 'a :hover')."""
+    css = _RE_TAGS.sub("", css or "")
+    css = _RE_COMMENTS.sub("", css)
+    css = _RE_SPACES.sub(" ", css)
+    css = _RE_PUNCT.sub(r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def register_css(key: str, css: str) -> str:
+    """
+    Registra (o actualiza) los estilos de `key`. Acepta el bloque con o sin <style>.
+    Idempotente: si el texto es el mismo objeto/valor ya registrado no se vuelve a minificar.
+    """
+    hit = _REGISTRY.get(key)
+    if hit is not None and (hit[0] is css or hit[0] == css):
+        return key
+    mini = minify_css(css)
+    with _LOCK:
+        _REGISTRY[key] = (css, mini)
+        for ks in [ks for ks in _BUNDLES if key in ks]:
+            _BUNDLES.pop(ks, None)
+    return key
+
+
+def _bundle(keys: tuple) -> tuple[str, str, str | None]:
+    """(digest, css concatenado, url) del bundle `keys`; escribe static/css/<keys>.<hash>.css una vez."""
+    hit = _BUNDLES.get(keys)
+    if hit is not None:
+        return hit
+    with _LOCK:
+        hit = _BUNDLES.get(keys)
+        if hit is not None:
+            return hit
+        css = "\n".join(_REGISTRY[k][1] for k in keys if k in _REGISTRY)
+        digest = hashlib.sha1(css.encode("utf-8")).hexdigest()[:12]
+        url = None
+        if _static_enabled():
+            try:
+                name = re.sub(r"[^A-Za-z0-9_-]+", "-", "+".join(keys))[:60]
+                out = _CSS_DIR / f"{name}.{digest}.css"
+                if not out.exists():
+                    _CSS_DIR.mkdir(parents=True, exist_ok=True)
+                    _write_atomic(out, css.encode("utf-8"))
+                url = _URL_PREFIX + out.name
+            except Exception:
+                url = None
+        _BUNDLES[keys] = (digest, css, url)
+    return _BUNDLES[keys]
+
+
+# Cargador: mantiene un <style> por bundle en el documento principal (sobrevive a los reruns).
+# Cuenta referencias: al desaparecer la vista (iframe descargado) se desactiva, como antes
+# desaparecía el <style> del st.markdown; al volver se reactiva sin descargar nada.
+_LOADER = """<script>
+(function(){
+  var P = window.parent, doc = P.document, id = "eni-css-" + %(digest)s;
+  var el = doc.getElementById(id);
+  if (!el) {
+    el = doc.createElement("style"); el.id = id; el.setAttribute("data-refs", "0");
+    doc.body.appendChild(el);
+  }
+  var css = %(css)s, url = %(url)s;
+  if (css !== null && !el.textContent) el.textContent = css;
+  if (!el.textContent && url && !el.getAttribute("data-loading")) {
+    el.setAttribute("data-loading", "1");
+    fetch(new URL(url, P.location.href).href).then(function(r){ return r.ok ? r.text() : ""; })
+      .then(function(t){ if (!el.textContent) el.textContent = t; })
+      .catch(function(){}).then(function(){ el.removeAttribute("data-loading"); });
+  }
+  el.setAttribute("data-refs", String((+el.getAttribute("data-refs") || 0) + 1));
+  el.media = "all";
+  window.addEventListener("pagehide", function(){
+    el.setAttribute("data-refs", String(Math.max(0, (+el.getAttribute("data-refs") || 0) - 1)));
+    P.setTimeout(function(){ if (!(+el.getAttribute("data-refs"))) el.media = "not all"; }, 300);
+  });
+})();
+</script>"""
+
+
+def use_css(*keys: str):
+    """
+    Aplica los estilos registrados en `keys` (concatenados en ese orden).
+    La primera vez en la sesión viaja el CSS completo; en los reruns siguientes solo el
+    cargador (~1 KB) con el hash — el navegador ya lo tiene. Sin static serving, el
+    CSS minificado va siempre en línea.
+    """
+    keys = tuple(k for k in keys if k in _REGISTRY)
+    if not keys:
+        return
+    digest, css, url = _bundle(keys)
+    sent = st.session_state.setdefault(_SENT_KEY, set())
+    inline = url is None or digest not in sent
+    try:
+        components.html(
+            _LOADER % {
+                "digest": json.dumps(digest),
+                "css": json.dumps(css).replace("</", "<\\/") if inline else "null",
+                "url": json.dumps(url),
+            },
+            height=0,
+        )
+        sent.add(digest)
+    except Exception:
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+
+
+def inject_css(key: str, css: str):
+    """Atajo para vistas: registra `css` bajo `key` y lo aplica."""
+    use_css(register_css(key, css))
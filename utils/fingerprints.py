@@ -0,0 +1,150 @@
+# utils/fingerprints.py
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Tope de huellas recordadas por caché (se reinicia al superarlo)
+_MAX_KNOWN = 200_000
+
+
+# ===================== Huellas por fila =====================
+def row_hashes(df: pd.DataFrame, cols: Iterable[str]) -> np.ndarray:
+    """
+    Hash de 64 bits por fila sobre `cols` (las que existan), independiente del índice.
+    Dos filas con el mismo contenido en esas columnas comparten huella.
+    """
+    cols = [c for c in cols if c in df.columns]
+    if not cols or not len(df):
+        return np.zeros(len(df), dtype=np.uint64)
+    sub = df[cols].reset_index(drop=True)
+    return pd.util.hash_pandas_object(sub, index=False).to_numpy(dtype=np.uint64)
+
+
+# ===================== Caché de columnas derivadas =====================
+class DerivedRowCache:
+    """
+    Recuerda huellas de filas cuyas columnas derivadas ya están materializadas y al día.
+    - estables: su resultado no depende de la fecha de hoy.
+    - diarias: dependen de hoy (p.ej. 'en riesgo' / 'no entregado'); caducan al cambiar el día.
+    """
+
+    def __init__(self):
+        self.day = date.today()
+        self._stable = np.empty(0, dtype=np.uint64)
+        self._daily = np.empty(0, dtype=np.uint64)
+
+    def _roll_day(self):
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self._daily = np.empty(0, dtype=np.uint64)
+
+    def dirty(self, hashes: np.ndarray) -> np.ndarray:
+        """Máscara de filas que hay que recalcular."""
+        self._roll_day()
+        known = np.isin(hashes, self._stable) | np.isin(hashes, self._daily)
+        return ~known
+
+    def remember(self, hashes: np.ndarray, daily: np.ndarray | None = None):
+        """Registra huellas ya recalculadas; `daily` marca las que dependen de hoy."""
+        if not len(hashes):
+            return
+        daily = np.zeros(len(hashes), dtype=bool) if daily is None else np.asarray(daily, dtype=bool)
+        self._stable = np.union1d(self._stable, hashes[~daily])
+        self._daily = np.union1d(self._daily, hashes[daily])
+        if len(self._stable) + len(self._daily) > _MAX_KNOWN:
+            self.__init__()
+
+
+def derived_cache(key: str) -> DerivedRowCache:
+    """DerivedRowCache por sesión (uno por tipo de derivado)."""
+    cache = st.session_state.get(key)
+    if not isinstance(cache, DerivedRowCache):
+        cache = DerivedRowCache()
+        st.session_state[key] = cache
+    return cache
+
+
+# ===================== Seguimiento de cambios =====================
+def cell_hashes(df: pd.DataFrame, cols: Iterable[str]) -> np.ndarray:
+    """Matriz (filas × columnas) de hashes de 64 bits del texto de cada celda ('' para nulos)."""
+    cols = list(cols)
+    out = np.zeros((len(df), len(cols)), dtype=np.uint64)
+    for j, c in enumerate(cols):
+        vals = df[c].fillna("").astype(str).to_numpy(dtype=object)
+        out[:, j] = pd.util.hash_array(vals, categorize=True)
+    return out
+
+
+def _combine(h: np.ndarray) -> np.ndarray:
+    """Hash por fila a partir de los hashes de celda (mezcla dependiente de la posición)."""
+    if not h.shape[1]:
+        return np.zeros(h.shape[0], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        mult = (np.arange(1, h.shape[1] + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+        return np.bitwise_xor.reduce(h * mult, axis=1)
+
+
+class RowSnapshot:
+    """
+    Huellas de df_main tomadas en la carga/subida: un hash por fila y uno por celda, indexados por Id.
+    Sustituye a la copia completa del baseline; el diff se reduce a comparar enteros.
+    """
+
+    def __init__(self, df: pd.DataFrame, id_col: str = "Id"):
+        if df is None or id_col not in getattr(df, "columns", []):
+            df = pd.DataFrame(columns=[id_col])
+        df = df.drop_duplicates(subset=[id_col], keep="last")
+        self.id_col = id_col
+        self.cols = [c for c in df.columns if c != id_col]
+        self.ids = pd.Index(df[id_col].astype(str).to_numpy())
+        self.cells = cell_hashes(df, self.cols)
+        self.rows = _combine(self.cells)
+
+    @property
+    def empty(self) -> bool:
+        return not len(self.ids)
+
+    def diff(self, curr: pd.DataFrame, allowed_cols: set[str] | None = None):
+        """
+        (pend_ids, cell_diff, new_ids) de `curr` respecto de la huella.
+        Solo se comparan columnas presentes en ambos lados (y en `allowed_cols` si se indica).
+        """
+        pend_ids, cell_diff, new_ids = set(), {}, set()
+        if curr is None or curr.empty or self.id_col not in curr.columns:
+            return pend_ids, cell_diff, new_ids
+        cur_ids = curr[self.id_col].astype(str).to_numpy()
+        if self.empty:
+            new_ids = set(cur_ids.tolist())
+            return set(new_ids), cell_diff, new_ids
+
+        pos = self.ids.get_indexer(cur_ids)
+        is_new = pos < 0
+        new_ids = set(cur_ids[is_new].tolist())
+        pend_ids |= new_ids
+
+        sel = [j for j, c in enumerate(self.cols)
+               if c in curr.columns and (not allowed_cols or c in allowed_cols)]
+        if not sel or is_new.all():
+            return pend_ids, cell_diff, new_ids
+        cols = [self.cols[j] for j in sel]
+        old = self.cells[pos[~is_new]][:, sel]
+        now = cell_hashes(curr.loc[~is_new], cols)
+
+        if len(sel) == len(self.cols):
+            changed = _combine(now) != self.rows[pos[~is_new]]
+        else:
+            changed = (now != old).any(axis=1)
+        ids_common = cur_ids[~is_new]
+        for i in np.flatnonzero(changed):
+            rid = ids_common[i]
+            pend_ids.add(rid)
+            cols_changed = {cols[j] for j in np.flatnonzero(now[i] != old[i])}
+            if cols_changed:
+                cell_diff[str(rid)] = cell_diff.get(str(rid), set()) | cols_changed
+        return pend_ids, cell_diff, new_ids
@@ -0,0 +1,69 @@
+# utils/fragments.py
+from __future__ import annotations
+
+import importlib
+from typing import Callable, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from utils.indices import df_main_version
+
+# st.fragment (>=1.37) / experimental_fragment (>=1.33); si no existe, render normal
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+HAS_FRAGMENTS = _st_fragment is not None
+
+
+def fragment(fn: Callable) -> Callable:
+    """
+    Envuelve `fn` como fragmento: las interacciones con sus widgets (grid, filtros, guardar)
+    re-ejecutan solo ese bloque y no el script completo (roles, CSS, sidebar, ensure_df_main).
+    """
+    return _st_fragment(fn) if HAS_FRAGMENTS else fn
+
+
+# ===================== Accesores versionados =====================
+# Dentro de un fragmento NO se capturan df_main/usuario como argumentos (se repiten tal cual
+# en cada rerun del fragmento); se leen aquí, de sesión, junto con su versión.
+def df_main_snapshot() -> Tuple[int, pd.DataFrame]:
+    """(versión, df_main) actuales; df_main vacío si aún no se cargó."""
+    df = st.session_state.get("df_main")
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame()
+    return df_main_version(), df
+
+
+def session_user():
+    """Usuario logueado tal como lo dejó el login (puede ser None)."""
+    return st.session_state.get("user")
+
+
+def _view_fn(module_path: str, candidates: Tuple[str, ...]) -> Callable | None:
+    mod = importlib.import_module(module_path)
+    for name in candidates:
+        fn = getattr(mod, name, None)
+        if callable(fn):
+            return fn
+    return None
+
+
+@fragment
+def view_fragment(module_path: str, candidates: Tuple[str, ...] = ("render", "render_all")):
+    """
+    Ejecuta la vista `module_path` como fragmento. Solo recibe cadenas (estables entre reruns);
+    el usuario y df_main se leen de sesión en cada ejecución.
+    """
+    try:
+        fn = _view_fn(module_path, candidates)
+        if fn is None:
+            st.info(
+                "Vista pendiente para esta tarjeta "
+                "(no se encontró función 'render' ni 'render_all')."
+            )
+            return
+        fn(session_user())
+    except Exception as e:
+        st.info("No se pudo cargar la vista para esta tarjeta.")
+        st.exception(e)
+    # Si la vista reemplazó df_main, se avanza la versión ya (cachés de índices/facetas)
+    df_main_version()
@@ -0,0 +1,198 @@
+# utils/grid_edits.py
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Dict, Iterable, Tuple
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import GridUpdateMode, JsCode
+
+# Columna oculta donde el navegador anota qué campos se editaron en cada fila ("Tarea|Estado")
+DIRTY_FIELD = "__dirty__"
+_SEP = "|"
+
+# Sesión de edición: el grid no vuelve al servidor en cada celda/filtro/orden;
+# los cambios se acumulan en el navegador y viajan juntos con el botón del grid
+# (el "Update" de st_aggrid, rotulado con commit_button_css). Ese envío ES el guardado.
+COMMIT_UPDATE_MODE = GridUpdateMode.MANUAL
+
+_JS_MARK = "--x_x--0_0--"  # delimitador con que JsCode envuelve su código
+
+
+def commit_button_css(label: str = "💾 Guardar") -> dict:
+    """custom_css del AgGrid: rotula el botón de envío manual del grid (la única acción de guardado)."""
+    btn = "#gridToolBar button"
+    return {
+        "#gridToolBar": {"padding-bottom": "8px !important"},
+        btn: {
+            "font-size": "0 !important", "padding": "6px 14px", "border-radius": "8px",
+            "border": "1px solid #C7D2FE", "background": "#EEF2FF", "cursor": "pointer",
+        },
+        f"{btn}::after": {"content": json.dumps(label), "font-size": "14px", "font-weight": "600"},
+    }
+
+
+def _dirty_setter(label_field: str) -> JsCode:
+    """
+    valueSetter: escribe el valor, marca el campo como sucio (también para setDataValue desde JS)
+    y muestra el contador de celdas pendientes en una fila fija al pie del grid.
+    """
+    lf = json.dumps(label_field)
+    return JsCode(r"""
+function(p){
+  if (p.node && p.node.rowPinned) return false;
+  const f = p.colDef.field;
+  const oldV = p.data[f];
+  const a = (oldV === null || oldV === undefined) ? '' : String(oldV);
+  const b = (p.newValue === null || p.newValue === undefined) ? '' : String(p.newValue);
+  if (a === b) return false;
+  p.data[f] = p.newValue;
+  const d = p.data['__dirty__'] ? String(p.data['__dirty__']).split('|') : [];
+  if (d.indexOf(f) < 0) d.push(f);
+  p.data['__dirty__'] = d.join('|');
+  let n = 0;
+  p.api.forEachNode(function(nd){
+    const v = nd.data && nd.data['__dirty__'];
+    if (v) n += String(v).split('|').filter(Boolean).length;
+  });
+  const row = {}; row[""" + lf + r"""] = '✏️ ' + n + ' celda(s) sin guardar';
+  const rows = n ? [row] : [];
+  if (p.api.setGridOption) p.api.setGridOption('pinnedBottomRowData', rows);
+  else if (p.api.setPinnedBottomRowData) p.api.setPinnedBottomRowData(rows);
+  return true;
+}""")
+
+
+def _not_pinned(editable):
+    """`editable` que además excluye la fila fija del contador (no se edita ni pasa por el valueSetter)."""
+    if editable is True:
+        return JsCode("function(p){ return !p.node.rowPinned; }")
+    if isinstance(editable, JsCode):
+        body = editable.js_code.replace(_JS_MARK, "")
+        return JsCode(f"function(p){{ return !p.node.rowPinned && !!({body})(p); }}")
+    return editable
+
+
+def _col_defs(grid_options: dict) -> list:
+    defs = grid_options.get("columnDefs", [])
+    return list(defs.values()) if isinstance(defs, dict) else list(defs)
+
+
+def track_edits(df: pd.DataFrame, grid_options: dict,
+                label_field: str = "Id") -> Tuple[pd.DataFrame, dict]:
+    """
+    Prepara (df, gridOptions) para seguir ediciones en el cliente: agrega la columna oculta
+    DIRTY_FIELD y un valueSetter que la marca en cada columna con `field`.
+    El contador de pendientes se pinta en `label_field` de la fila fija inferior (no editable).
+    """
+    if DIRTY_FIELD not in df.columns:
+        df = df.assign(**{DIRTY_FIELD: ""})
+
+    setter = _dirty_setter(label_field)
+    defs = _col_defs(grid_options)
+    has_dirty_def = False
+    for cd in defs:
+        field = cd.get("field")
+        if field == DIRTY_FIELD:
+            cd["hide"] = True
+            cd["editable"] = False
+            has_dirty_def = True
+            continue
+        if field and "valueSetter" not in cd and "valueGetter" not in cd:
+            cd["valueSetter"] = setter
+        if "editable" in cd:
+            cd["editable"] = _not_pinned(cd["editable"])
+    if not has_dirty_def:
+        defs.append({"field": DIRTY_FIELD, "hide": True, "editable": False})
+    grid_options["columnDefs"] = defs
+    default = grid_options.get("defaultColDef")
+    if isinstance(default, dict) and "editable" in default:
+        default["editable"] = _not_pinned(default["editable"])
+    return df, grid_options
+
+
+def _dirty_records(grid_resp) -> list[dict]:
+    """Filas marcadas como sucias en la respuesta del grid (lista de dicts)."""
+    try:
+        data = grid_resp["data"]
+    except Exception:
+        data = getattr(grid_resp, "data", None)
+    if isinstance(data, pd.DataFrame):
+        if data.empty or DIRTY_FIELD not in data.columns:
+            return []
+        dirty = data[DIRTY_FIELD].fillna("").astype(str).str.strip() != ""
+        return data[dirty].to_dict("records")
+    if isinstance(data, list):
+        return [r for r in data if isinstance(r, dict) and str(r.get(DIRTY_FIELD) or "").strip()]
+    return []
+
+
+def edited_cells(grid_resp, id_col: str = "Id",
+                 cols: Iterable[str] | None = None) -> Dict[str, Dict[str, object]]:
+    """Deltas del grid: {Id: {columna: valor nuevo}}, solo celdas editadas (opcionalmente en `cols`)."""
+    keep = set(cols) if cols is not None else None
+    out: Dict[str, Dict[str, object]] = {}
+    for r in _dirty_records(grid_resp):
+        rid = str(r.get(id_col, "") or "").strip()
+        if not rid:
+            continue
+        fields = [f for f in str(r[DIRTY_FIELD]).split(_SEP)
+                  if f and f != id_col and (keep is None or f in keep)]
+        if fields:
+            out.setdefault(rid, {}).update({f: r.get(f) for f in fields})
+    return out
+
+
+def edited_rows(grid_resp) -> pd.DataFrame:
+    """Filas completas que tienen al menos una celda editada (sin la columna de marcas)."""
+    recs = _dirty_records(grid_resp)
+    if not recs:
+        return pd.DataFrame()
+    return pd.DataFrame(recs).drop(columns=[DIRTY_FIELD], errors="ignore")
+
+
+def pending_cells(grid_resp) -> int:
+    """N° de celdas editadas que el grid envió y aún no se guardaron (envío ya intentado)."""
+    return sum(len([f for f in str(r[DIRTY_FIELD]).split(_SEP) if f]) for r in _dirty_records(grid_resp))
+
+
+def render_pending(grid_resp, label: str = "💾 Guardar") -> int:
+    """Recordatorio junto a la grilla: el botón del grid guarda; avisa si quedó un envío sin guardar."""
+    n = pending_cells(grid_resp)
+    if n:
+        st.caption(f"⚠️ {n} celda(s) enviadas sin guardar.")
+    else:
+        st.caption(f"✏️ Edita en la grilla y pulsa «{label}» (arriba de la grilla) para guardar.")
+    return n
+
+
+def commit_requested(grid_resp, name: str) -> bool:
+    """
+    True cuando toca guardar: el grid acaba de enviar celdas editadas (un solo clic en su botón).
+    Cada envío se procesa una vez; si su guardado falló (el grid no se reinició), se ofrece
+    «Reintentar» sobre el mismo envío en vez de repetirlo en cada rerun.
+    """
+    recs = _dirty_records(grid_resp)
+    if not recs:
+        return False
+    sig = hashlib.sha1(json.dumps(recs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    k = f"_grid_sent_{name}"
+    if st.session_state.get(k) != sig:
+        st.session_state[k] = sig
+        return True
+    return st.button("🔁 Reintentar guardado", use_container_width=True, key=f"{grid_key(name)}_retry")
+
+
+# ===================== Key del grid por sesión de edición =====================
+def grid_key(name: str) -> str:
+    """Key del AgGrid; cambia tras cada guardado para descartar las marcas del navegador."""
+    return f"{name}_{int(st.session_state.get(f'_grid_nonce_{name}', 0))}"
+
+
+def reset_grid(name: str):
+    """Cierra la sesión de edición (llamar tras guardar con éxito)."""
+    k = f"_grid_nonce_{name}"
+    st.session_state[k] = int(st.session_state.get(k, 0)) + 1
+    st.session_state.pop(f"_grid_sent_{name}", None)
@@ -0,0 +1,81 @@
+# utils/grid_pages.py
+from __future__ import annotations
+
+import math
+from typing import Iterable, List, Tuple
+
+import pandas as pd
+import streamlit as st
+
+# Filas por página ofrecidas en las grillas paginadas
+PAGE_SIZES = [25, 50, 100, 200]
+_NO_SORT = "(sin orden)"
+
+
+def _sort_key(s: pd.Series) -> pd.Series:
+    """Clave de orden: fechas/números si la columna lo es, texto normalizado si no."""
+    name = str(s.name or "")
+    if name.lower().startswith(("fecha", "hora")):
+        return pd.to_datetime(s, errors="coerce")
+    num = pd.to_numeric(s, errors="coerce")
+    if num.notna().sum() >= max(1, int(s.notna().sum() * 0.9)):
+        return num
+    return s.astype(str).str.strip().str.lower()
+
+
+def sort_frame(df: pd.DataFrame, col: str | None, ascending: bool = True) -> pd.DataFrame:
+    """Orden del lado del servidor (estable; vacíos al final)."""
+    if not col or col not in df.columns or df.empty:
+        return df
+    return df.sort_values(col, ascending=ascending, kind="stable", na_position="last", key=_sort_key)
+
+
+def page_window(df: pd.DataFrame, key: str, sort_cols: Iterable[str] | None = None,
+                labels: dict | None = None) -> Tuple[pd.DataFrame, str]:
+    """
+    Controles de paginación (orden, filas por página, anterior/siguiente) y la ventana pedida.
+    Devuelve (filas de la página, firma de la página) — la firma sirve para el `key` del AgGrid,
+    así la grilla recibe solo la página y se reinicia al cambiarla.
+    """
+    labels = labels or {}
+    sort_cols: List[str] = [c for c in (sort_cols or df.columns) if c in df.columns]
+    k_page, k_size, k_sort, k_desc = f"{key}_page", f"{key}_page_size", f"{key}_sort", f"{key}_sort_desc"
+    st.session_state.setdefault(k_page, 0)
+    st.session_state.setdefault(k_size, PAGE_SIZES[1])
+
+    c_sort, c_dir, c_size, c_prev, c_info, c_next = st.columns([2.2, 1.0, 1.2, 0.6, 1.4, 0.6], gap="small")
+    with c_sort:
+        sort_col = st.selectbox(
+            "Ordenar por", [_NO_SORT] + sort_cols, key=k_sort,
+            format_func=lambda c: labels.get(c, c),
+        )
+    with c_dir:
+        desc = st.toggle("Descendente", key=k_desc)
+    with c_size:
+        size = st.selectbox("Filas por página", PAGE_SIZES, key=k_size)
+
+    n = len(df)
+    n_pages = max(1, math.ceil(n / size))
+    page = min(max(int(st.session_state[k_page]), 0), n_pages - 1)
+    st.session_state[k_page] = page
+
+    def _go(delta: int):
+        st.session_state[k_page] = min(max(int(st.session_state.get(k_page, 0)) + delta, 0), n_pages - 1)
+
+    with c_prev:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        st.button("◀", key=f"{key}_prev", on_click=_go, args=(-1,), disabled=page <= 0, use_container_width=True)
+    with c_info:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        st.caption(f"Página {page + 1} de {n_pages} · {n} filas")
+    with c_next:
+        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+        st.button("▶", key=f"{key}_next", on_click=_go, args=(1,), disabled=page >= n_pages - 1, use_container_width=True)
+
+    if sort_col != _NO_SORT:
+        df = sort_frame(df, sort_col, ascending=not desc)
+    lo = page * size
+    window = df.iloc[lo:lo + size]
+    sig = f"{page}_{size}_{sort_col}_{int(bool(desc))}_{n}"
+    return window, sig
+
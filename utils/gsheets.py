@@ -1,20 +1,37 @@
 # utils/gsheets.py
+import importlib
+import importlib.util
 import re
 import pandas as pd
-import gspread
-from gspread_dataframe import set_with_dataframe
-from google.oauth2.service_account import Credentials
 import streamlit as st
 
+# gspread / google-auth se importan al primer uso (no al cargar las vistas).
+# Si no están instalados, importar este módulo sigue fallando como antes (las vistas usan su fallback).
+for _dep in ("gspread", "gspread_dataframe", "google.oauth2"):
+    if importlib.util.find_spec(_dep) is None:
+        raise ImportError(f"utils.gsheets requiere {_dep}")
+
+
+def _gspread():
+    return importlib.import_module("gspread")
+
+
+def set_with_dataframe(ws, df, **kwargs):
+    from gspread_dataframe import set_with_dataframe as _set_with_dataframe
+    return _set_with_dataframe(ws, df, **kwargs)
+
 _SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
+# Cliente compartido por sesiones y páginas (se autoriza una vez por proceso)
+@st.cache_resource(show_spinner=False)
 def _get_client():
     info = st.secrets["gcp_service_account"]
+    from google.oauth2.service_account import Credentials
     creds = Credentials.from_service_account_info(info, scopes=_SCOPES)
-    return gspread.authorize(creds)
+    return _gspread().authorize(creds)
 
 def open_sheet_by_url(url: str):
     gc = _get_client()
@@ -23,7 +40,7 @@ def open_sheet_by_url(url: str):
 def read_df_from_worksheet(sh, ws_name: str) -> pd.DataFrame:
     try:
         ws = sh.worksheet(ws_name)
-    except gspread.WorksheetNotFound:
+    except _gspread().WorksheetNotFound:
         return pd.DataFrame()
     recs = ws.get_all_records(numericise_ignore=["all"])
     return pd.DataFrame.from_records(recs) if recs else pd.DataFrame()
@@ -33,7 +50,7 @@ def write_df_full(sh, ws_name: str, df: pd.DataFrame):
     try:
         try:
             ws = sh.worksheet(ws_name)
-        except gspread.WorksheetNotFound:
+        except _gspread().WorksheetNotFound:
             ws = sh.add_worksheet(title=ws_name, rows="100", cols="26")
         ws.clear()
         set_with_dataframe(ws, df if df is not None else pd.DataFrame())
@@ -137,7 +154,7 @@ def _ensure_worksheet(ss, ws_name: str, rows: int = 1000, cols: int = 26):
     """Abre o crea la pestaña."""
     try:
         ws = ss.worksheet(ws_name)
-    except gspread.WorksheetNotFound:
+    except _gspread().WorksheetNotFound:
         ws = ss.add_worksheet(title=ws_name, rows=str(rows), cols=str(cols))
     return ws
 
@@ -257,3 +274,74 @@ def upsert_rows_by_id(
 
     except Exception as e:
         return {"ok": False, "updated": 0, "inserted": 0, "msg": f"Error en upsert_rows_by_id: {e}"}
+
+# ============================================================
+#   Actualización por celdas (solo columnas indicadas) en lote
+# ============================================================
+
+def update_cells_by_id(
+    ss_url: str,
+    ws_name: str,
+    df: pd.DataFrame,
+    cols: list[str],
+    ids: list[str] | set[str] | None = None,
+    id_col: str = "Id",
+) -> dict:
+    """
+    Escribe SOLO las celdas `cols` de las filas con Id ∈ ids en una única llamada batch.
+    Ids que no existen en la hoja se insertan como fila completa (igual que upsert_rows_by_id).
+
+    Retorna: {"ok": True/False, "updated": n_celdas, "inserted": m, "msg": str}
+    """
+    try:
+        if df is None or df.empty or id_col not in df.columns:
+            return {"ok": False, "updated": 0, "inserted": 0, "msg": "DataFrame vacío o sin Id."}
+
+        df2 = df.copy()
+        df2[id_col] = df2[id_col].astype(str).str.strip()
+        if ids is not None:
+            ids_norm = {str(x).strip() for x in ids if str(x).strip()}
+            df2 = df2[df2[id_col].isin(ids_norm)]
+        df2 = df2[df2[id_col] != ""].drop_duplicates(subset=[id_col], keep="last")
+        if df2.empty:
+            return {"ok": True, "updated": 0, "inserted": 0, "msg": "No hay Ids para actualizar."}
+
+        ss = open_sheet_by_url(ss_url)
+        ws = _ensure_worksheet(ss, ws_name)
+        desired = [id_col] + [c for c in df2.columns if c != id_col]
+        headers = _ensure_headers(ws, desired)
+        id_col_idx = headers.index(id_col) + 1
+
+        id_to_row = {}
+        for i, v in enumerate(ws.col_values(id_col_idx)[1:], start=2):
+            if v:
+                id_to_row[str(v).strip()] = i
+
+        cols = [c for c in cols if c in headers and c in df2.columns]
+        col_letters = {c: _a1_col(headers.index(c) + 1) for c in cols}
+
+        data, appends = [], []
+        for _, row in df2.iterrows():
+            rid = row[id_col]
+            r = id_to_row.get(rid)
+            if r is None:
+                appends.append(_format_row_for_headers(row, headers))
+                continue
+            vals = _format_row_for_headers(row, cols)
+            for c, v in zip(cols, vals):
+                data.append({"range": f"{ws_name}!{col_letters[c]}{r}", "values": [[v]]})
+
+        if data:
+            ss.values_batch_update({"valueInputOption": "USER_ENTERED", "data": data})
+        if appends:
+            ws.append_rows(appends, value_input_option="USER_ENTERED")
+
+        return {
+            "ok": True,
+            "updated": len(data),
+            "inserted": len(appends),
+            "msg": f"Actualización completada: {len(data)} celda(s), {len(appends)} fila(s) insertada(s).",
+        }
+
+    except Exception as e:
+        return {"ok": False, "updated": 0, "inserted": 0, "msg": f"Error en update_cells_by_id: {e}"}
@@ -0,0 +1,117 @@
+# utils/import_budget.py
+"""
+Presupuesto de importación del arranque en frío y reporte por módulo.
+
+    python -m utils.import_budget            # reporte de todas las fases
+    python -m utils.import_budget login -n 5 # una fase, top 5
+
+Cada fase se mide en un intérprete nuevo con `python -X importtime`, descontando lo que
+ya trae su base (p.ej. streamlit). Sale con código 1 si alguna fase excede su presupuesto
+o si la página de login arrastra una dependencia pesada.
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+# Dependencias que NO deben cargarse antes de check_app_password()
+HEAVY = ("pandas", "numpy", "pytz", "openpyxl", "st_aggrid", "gspread", "gspread_dataframe", "google", "PIL")
+
+# fase -> (base ya cargada, módulos de la fase, presupuesto en ms o None)
+PHASES = {
+    # Lo que gestion_app importa antes del login
+    "login": (("streamlit",), ("utils.css_registry", "utils.static_assets"), 150),
+    # Tras el login: datos, ACL y helpers de las vistas
+    "app": (
+        ("streamlit", "utils.css_registry", "utils.static_assets"),
+        ("pandas", "shared", "features.security.acl", "utils.avatar", "utils.fragments", "utils.pages"),
+        2500,
+    ),
+    # Primera apertura de cada vista (se importan bajo demanda)
+    "views": (
+        ("streamlit", "pandas", "shared", "utils.fragments"),
+        (
+            "features.nueva_tarea.view", "features.nueva_alerta.view", "features.editar_estado.view",
+            "features.prioridad.view", "features.evaluacion.view", "features.historial.view",
+            "features.kanban.view", "features.gantt.view", "features.dashboard.view",
+        ),
+        None,
+    ),
+}
+
+# "import time:      self [us] |   cumulative | imported package"
+_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+def _importtime(modules: tuple[str, ...]) -> list[tuple[int, int, str]]:
+    """(nivel, acumulado en µs, módulo) de cada import en un intérprete nuevo, en orden."""
+    code = "\n".join(f"try:\n    import {m}\nexcept Exception as e:\n    print({m!r}, e)" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=_ROOT, capture_output=True, text=True,
+    )
+    out = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            level = max(0, (len(m.group(3)) - 1) // 2)
+            out.append((level, int(m.group(2)), m.group(4)))
+    for line in proc.stdout.splitlines():
+        print(f"  ⚠️ no se pudo importar {line}", file=sys.stderr)
+    return out
+
+
+def measure(phase: str) -> tuple[float, dict[str, float], set[str]]:
+    """(total ms, ms por paquete de primer nivel, módulos cargados) de la fase, sin su base."""
+    base, modules, _ = PHASES[phase]
+    seen_base = {name for _, _, name in _importtime(base)}
+    rows = _importtime(base + modules)
+    per_pkg: dict[str, float] = {}
+    loaded: set[str] = set()
+    for level, cum_us, name in rows:
+        if name in seen_base:
+            continue
+        loaded.add(name)
+        if level == 0:
+            pkg = name.split(".")[0] if name.split(".")[0] not in ("features", "utils") else name
+            per_pkg[pkg] = per_pkg.get(pkg, 0.0) + cum_us / 1000.0
+    return sum(per_pkg.values()), per_pkg, loaded
+
+
+def report(phases: list[str] | None = None, top: int = 12) -> bool:
+    """Imprime el reporte; True si todas las fases cumplen su presupuesto."""
+    ok = True
+    for phase in phases or list(PHASES):
+        total, per_pkg, loaded = measure(phase)
+        budget = PHASES[phase][2]
+        over = budget is not None and total > budget
+        heavy = sorted({n.split(".")[0] for n in loaded} & set(HEAVY)) if phase == "login" else []
+        ok = ok and not over and not heavy
+        flag = "❌" if (over or heavy) else "✅"
+        lim = f" / presupuesto {budget} ms" if budget is not None else ""
+        print(f"{flag} {phase}: {total:.0f} ms{lim} · {len(loaded)} módulos nuevos")
+        for pkg, ms in sorted(per_pkg.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"     {ms:8.1f} ms  {pkg}")
+        if heavy:
+            print(f"     ⚠️ dependencias pesadas antes del login: {', '.join(heavy)}")
+    return ok
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Costo de importación por fase del arranque.")
+    ap.add_argument("phases", nargs="*", help=f"fases a medir: {', '.join(PHASES)} (todas por defecto)")
+    ap.add_argument("-n", "--top", type=int, default=12, help="módulos a listar por fase")
+    args = ap.parse_args(argv)
+    unknown = [p for p in args.phases if p not in PHASES]
+    if unknown:
+        ap.error(f"fase desconocida: {', '.join(unknown)}")
+    return 0 if report(args.phases or None, args.top) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
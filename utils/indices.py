@@ -0,0 +1,327 @@
+# utils/indices.py
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Valores de selectbox que significan "sin filtro"
+_ALL_TOKENS = {"Todas", "Todos", "", None}
+
+
+# ===================== Versión de df_main =====================
+def df_main_version() -> int:
+    """
+    Número de versión de st.session_state['df_main'].
+    Todas las vistas reemplazan df_main con un objeto nuevo al guardar,
+    así que basta comparar identidad para saber si cambió.
+    """
+    cur = st.session_state.get("df_main")
+    if cur is not st.session_state.get("_df_main_ref"):
+        st.session_state["_df_main_ref"] = cur
+        st.session_state["_df_main_ver"] = int(st.session_state.get("_df_main_ver", 0)) + 1
+    return int(st.session_state.get("_df_main_ver", 0))
+
+
+def _frame_sig(df: pd.DataFrame) -> Tuple:
+    """Firma barata del frame derivado (tamaño + extremos del índice)."""
+    n = len(df)
+    if not n:
+        return (0,)
+    return (n, df.index[0], df.index[-1])
+
+
+# ===================== Índice de facetas =====================
+class FacetIndex:
+    """
+    Índice columna → valor → bitmap de filas (np.bool_), alineado por posición con el frame.
+    Responde opciones de dropdowns dependientes y máscaras de filtro por intersección.
+    """
+
+    def __init__(self, df: pd.DataFrame, cols: Iterable[str]):
+        self.size = len(df)
+        self._codes: Dict[str, np.ndarray] = {}
+        self._values: Dict[str, List[str]] = {}
+        self._lookup: Dict[str, Dict[str, int]] = {}
+        self._bitmaps: Dict[Tuple[str, str], np.ndarray] = {}
+        self._opts: Dict[str, List[str]] = {}
+        for c in cols:
+            if c not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[c].astype(str), sort=False)
+            self._codes[c] = codes
+            self._values[c] = list(uniques)
+            self._lookup[c] = {v: i for i, v in enumerate(uniques)}
+
+    def bitmap(self, col: str, value) -> np.ndarray:
+        key = (col, str(value))
+        bm = self._bitmaps.get(key)
+        if bm is None:
+            k = self._lookup.get(col, {}).get(str(value))
+            bm = (self._codes[col] == k) if k is not None else np.zeros(self.size, dtype=bool)
+            self._bitmaps[key] = bm
+        return bm
+
+    def mask(self, where: Dict[str, object] | None = None) -> np.ndarray:
+        """AND de los bitmaps seleccionados; 'Todas'/'Todos' no filtran."""
+        m = np.ones(self.size, dtype=bool)
+        for col, val in (where or {}).items():
+            if val in _ALL_TOKENS or col not in self._codes:
+                continue
+            m &= self.bitmap(col, val)
+        return m
+
+    def options(self, col: str, where: Dict[str, object] | None = None) -> List[str]:
+        """Valores ordenados de `col` presentes en las filas que cumplen `where` (sin vacíos ni 'nan')."""
+        if col not in self._codes:
+            return []
+        where = {k: v for k, v in (where or {}).items() if k != col and v not in _ALL_TOKENS}
+        if not where and col in self._opts:
+            return self._opts[col]
+        codes = self._codes[col]
+        if where:
+            codes = codes[self.mask(where)]
+        vals = self._values[col]
+        out = sorted(v for v in (vals[i] for i in np.unique(codes) if i >= 0) if v and v != "nan")
+        if not where:
+            self._opts[col] = out
+        return out
+
+    def filter(self, df: pd.DataFrame, where: Dict[str, object] | None = None) -> pd.DataFrame:
+        """Aplica mask(where) al mismo frame con el que se construyó el índice."""
+        return df[self.mask(where)]
+
+
+def get_facet_index(df: pd.DataFrame, cols: Iterable[str], key: str) -> FacetIndex:
+    """
+    FacetIndex memoizado en sesión por (vista/alcance, versión de df_main, firma del frame).
+    `key` debe distinguir el alcance de la vista (p.ej. ACL o toggle "ver todas").
+    """
+    cols = tuple(cols)
+    sig = (df_main_version(), _frame_sig(df), cols)
+    cache = st.session_state.setdefault("_facet_cache", {})
+    hit = cache.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    fx = FacetIndex(df, cols)
+    cache[key] = (sig, fx)
+    return fx
+
+
+# ===================== Índice de fechas ordenado =====================
+def _canon_ids(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.strip()
+
+
+try:
+    from zoneinfo import ZoneInfo
+    _TZ = ZoneInfo(st.secrets.get("local_tz", "America/Lima"))
+except Exception:
+    _TZ = None
+
+_BLANK_DATES = {"", "nan", "NaN", "NaT", "None", "none", "null"}
+
+
+def _naive_local(ser: pd.Series) -> pd.Series:
+    """Quita la zona horaria (convirtiendo a la hora local si se conoce)."""
+    try:
+        if getattr(ser.dt, "tz", None) is not None:
+            ser = (ser.dt.tz_convert(_TZ) if _TZ else ser).dt.tz_localize(None)
+    except Exception:
+        try:
+            ser = ser.dt.tz_localize(None)
+        except Exception:
+            pass
+    return ser
+
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    """
+    Parser único de fechas para índices y filtros (mismo criterio que to_naive_local_series).
+    Cada valor se interpreta por sí solo (format="mixed"): el resultado de una fila no depende
+    del resto del lote, así el índice incremental y el filtro directo coinciden.
+    Acepta epoch ms/seg, serial Excel y reintenta con dayfirst. Devuelve datetime naive local.
+    """
+    s = pd.Series(s, copy=False)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return _naive_local(s)
+
+    raw = s.astype(str).str.strip()
+    raw = raw.where(~raw.isin(_BLANK_DATES), None)
+    ser = pd.to_datetime(raw, errors="coerce", format="mixed")
+    if not pd.api.types.is_datetime64_any_dtype(ser):
+        # Offsets distintos en el mismo lote: normalizar vía UTC
+        ser = pd.to_datetime(raw, errors="coerce", format="mixed", utc=True)
+    ser = _naive_local(ser)
+    try:
+        txt = raw.fillna("")
+        # Epoch en milisegundos (12–13 dígitos) / segundos (10 dígitos)
+        for pat, unit in ((r"\d{12,13}", "ms"), (r"\d{10}", "s")):
+            m = txt.str.fullmatch(pat)
+            if m.any():
+                ser.loc[m] = _naive_local(pd.to_datetime(txt.loc[m].astype("int64"), unit=unit, utc=True))
+        # Serial Excel (días desde 1899-12-30) — rango razonable 1982–2064 aprox.
+        num = pd.to_numeric(raw, errors="coerce")
+        m = ser.isna() & num.between(30000, 60000)
+        if m.any():
+            ser.loc[m] = pd.Timestamp("1899-12-30") + pd.to_timedelta(num.loc[m].astype(float), unit="D")
+        # Reintento con dayfirst si aún queda NaT y hay separadores
+        m = ser.isna() & txt.str.contains(r"[/-]", regex=True)
+        if m.any():
+            ser.loc[m] = _naive_local(pd.to_datetime(txt.loc[m], errors="coerce", dayfirst=True, format="mixed"))
+    except Exception:
+        pass
+    return ser
+
+
+def _bounds(desde, hasta) -> Tuple[pd.Timestamp | None, pd.Timestamp | None]:
+    """[desde 00:00, hasta 23:59:59] como Timestamps (None = abierto)."""
+    lo = pd.Timestamp(desde).normalize() if desde is not None else None
+    hi = (pd.Timestamp(hasta).normalize() + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+          if hasta is not None else None)
+    return lo, hi
+
+
+class DateIndex:
+    """
+    Índice ordenado de una columna de fecha de df_main: fechas (datetime64) ordenadas + Id de cada posición.
+    Lo que ahorra es el parseo: las fechas se parsean una vez por versión de df_main (y de forma
+    incremental: solo las filas cuyo texto cambió), no en cada rerun.
+    - range_ids: Ids en el rango, O(log n + k) con searchsorted.
+    - range_mask: máscara sobre el frame de la vista; sigue siendo O(n) en las filas del frame
+      (Ids, get_indexer y comparación del texto), pero sin parsear fechas.
+    """
+
+    def __init__(self, raw: pd.Series):
+        # raw: texto original indexado por Id (sin duplicados)
+        self._raw = raw
+        parsed = parse_dates(raw)
+        valid = parsed.dropna().sort_values(kind="stable")
+        self._keys = valid.to_numpy(dtype="datetime64[ns]")
+        self._ids = valid.index.to_numpy(dtype=object)
+        self._reindex_ranks()
+
+    def _reindex_ranks(self):
+        """_rank[i] = posición en _keys de la fila i de _raw (-1 = sin fecha)."""
+        self._raw_txt = self._raw.to_numpy(dtype=object)
+        self._rank = np.full(len(self._raw), -1, dtype=np.int64)
+        if len(self._ids):
+            self._rank[self._raw.index.get_indexer(self._ids)] = np.arange(len(self._ids))
+
+    @property
+    def known_ids(self) -> pd.Index:
+        return self._raw.index
+
+    def update(self, raw: pd.Series) -> "DateIndex":
+        """Aplica un nuevo snapshot (texto por Id) re-parseando solo altas y cambios."""
+        old = self._raw
+        common = raw.index.intersection(old.index)
+        diff = raw.loc[common].to_numpy() != old.loc[common].to_numpy()
+        changed = common[diff]
+        added = raw.index.difference(old.index)
+        removed = old.index.difference(raw.index)
+        touched = changed.union(added).union(removed)
+
+        if not len(touched):
+            self._raw = raw
+            self._reindex_ranks()
+            return self
+        # Muchos cambios: reconstruir es más barato que insertar uno a uno
+        if len(touched) * 4 > max(len(raw), 1):
+            self.__init__(raw)
+            return self
+
+        keep = ~pd.Index(self._ids).isin(touched)
+        keys, ids = self._keys[keep], self._ids[keep]
+        ok = parse_dates(raw.loc[changed.union(added)]).dropna().sort_values(kind="stable")
+        pos = np.searchsorted(keys, ok.to_numpy(dtype="datetime64[ns]"), side="right")
+        self._keys = np.insert(keys, pos, ok.to_numpy(dtype="datetime64[ns]"))
+        self._ids = np.insert(ids, pos, ok.index.to_numpy(dtype=object))
+        self._raw = raw
+        self._reindex_ranks()
+        return self
+
+    def _span(self, desde=None, hasta=None) -> Tuple[int, int]:
+        """[lo, hi) en _keys para el rango Desde/Hasta."""
+        a, b = _bounds(desde, hasta)
+        lo = int(np.searchsorted(self._keys, a.to_datetime64(), side="left")) if a is not None else 0
+        hi = int(np.searchsorted(self._keys, b.to_datetime64(), side="right")) if b is not None else len(self._keys)
+        return lo, max(lo, hi)
+
+    def range_ids(self, desde=None, hasta=None) -> np.ndarray:
+        """Ids con fecha en [desde 00:00, hasta 23:59:59]."""
+        lo, hi = self._span(desde, hasta)
+        return self._ids[lo:hi]
+
+    def range_mask(self, frame: pd.DataFrame, col: str, desde=None, hasta=None,
+                   include_nat: bool = True) -> np.ndarray:
+        """
+        Máscara booleana (por posición) para `frame`. Costo O(len(frame)) sin parseo: cada fila se
+        ubica por Id (get_indexer) y se compara su rango en el orden con los límites de searchsorted.
+        Solo se responde desde el índice en las filas cuyo valor de `col` es el texto crudo de df_main
+        para ese Id; el resto (Id vacío o duplicado, columna derivada/convertida) pasa por parse_dates.
+        """
+        if desde is None and hasta is None:
+            return np.ones(len(frame), dtype=bool)
+        if col not in frame.columns:
+            return _direct_range_mask(pd.Series(index=frame.index, dtype=object), desde, hasta, include_nat)
+        vals = frame[col]
+        if "Id" not in frame.columns or len(self._raw) == 0:
+            return _direct_range_mask(vals, desde, hasta, include_nat)
+
+        ix = self._raw.index.get_indexer(_canon_ids(frame["Id"]))
+        known = ix >= 0
+        same = np.zeros(len(frame), dtype=bool)
+        same[known] = self._raw_txt[ix[known]] == vals.astype(str).to_numpy(dtype=object)[known]
+
+        lo, hi = self._span(desde, hasta)
+        rank = self._rank[np.where(same, ix, 0)]
+        m = (rank >= lo) & (rank < hi)
+        if include_nat:
+            m |= rank < 0
+        m &= same
+        if not same.all():
+            other = ~same
+            m[other] = _direct_range_mask(vals[other], desde, hasta, include_nat)
+        return m
+
+
+def _direct_range_mask(s: pd.Series, desde, hasta, include_nat: bool) -> np.ndarray:
+    f = parse_dates(s)
+    lo, hi = _bounds(desde, hasta)
+    m = pd.Series(True, index=s.index)
+    if lo is not None:
+        m &= f >= lo
+    if hi is not None:
+        m &= f <= hi
+    if include_nat:
+        m |= f.isna()
+    return m.to_numpy(dtype=bool)
+
+
+def get_date_index(col: str) -> DateIndex:
+    """DateIndex de df_main[col], compartido por todas las vistas y actualizado por versión."""
+    ver = df_main_version()
+    cache = st.session_state.setdefault("_date_index_cache", {})
+    hit = cache.get(col)
+    if hit is not None and hit[0] == ver:
+        return hit[1]
+
+    df = st.session_state.get("df_main")
+    if isinstance(df, pd.DataFrame) and "Id" in df.columns and col in df.columns:
+        raw = pd.Series(df[col].astype(str).to_numpy(), index=_canon_ids(df["Id"]).to_numpy())
+        raw = raw[~raw.index.duplicated(keep=False) & (raw.index != "")]
+    else:
+        raw = pd.Series(dtype=object)
+
+    idx = hit[1].update(raw) if hit is not None else DateIndex(raw)
+    cache[col] = (ver, idx)
+    return idx
+
+
+def date_range_mask(frame: pd.DataFrame, col: str, desde=None, hasta=None,
+                    include_nat: bool = True) -> np.ndarray:
+    """Atajo para los filtros Desde/Hasta de las vistas."""
+    return get_date_index(col).range_mask(frame, col, desde, hasta, include_nat=include_nat)
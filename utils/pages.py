@@ -0,0 +1,98 @@
+# utils/pages.py
+from __future__ import annotations
+
+from typing import Callable, Dict, List, NamedTuple
+from urllib.parse import quote, urlencode
+
+import streamlit as st
+
+# st.navigation / st.Page (>=1.36): cada página es su propia ruta y solo se ejecuta la elegida.
+# En versiones previas se enruta como antes (?tile= + sección del sidebar).
+HAS_NAVIGATION = hasattr(st, "navigation") and hasattr(st, "Page")
+
+# key -> StreamlitPage de la ejecución actual (para switch_page desde vistas/sidebar)
+_NAV_KEY = "_nav_pages"
+_HOME_KEY = "_nav_home"
+
+
+class PageSpec(NamedTuple):
+    """Página registrada: `key` es la ruta (/key) y el valor legado de ?tile=."""
+    key: str
+    title: str
+    icon: str
+    render: Callable[[], None]
+    section: str              # opción del sidebar a la que pertenece
+    default: bool = False     # página de inicio (ruta /)
+    tile: bool = False        # se abre desde una tarjeta (no es una sección del sidebar)
+
+
+def _query_param(name: str) -> str:
+    try:
+        raw = st.query_params.get(name, "")
+        return (raw[0] if raw else "") if isinstance(raw, list) else (raw or "")
+    except Exception:
+        try:
+            raw = st.experimental_get_query_params().get(name, [""])
+            return raw[0] if raw else ""
+        except Exception:
+            return ""
+
+
+def select_page(pages: List[PageSpec], section: str) -> PageSpec:
+    """
+    Página a mostrar en esta ejecución (aún no la ejecuta; ver run_page).
+    - Con st.navigation: la ruta de la URL; un ?tile= antiguo redirige a su página.
+    - Sin st.navigation: ?tile= si es de la sección actual; si no, la página de la sección.
+    """
+    by_key: Dict[str, PageSpec] = {p.key: p for p in pages}
+    home = next((p for p in pages if p.default), pages[0])
+    st.session_state[_HOME_KEY] = home.key
+
+    if HAS_NAVIGATION:
+        st_pages = {
+            p.key: st.Page(p.render, title=p.title, icon=p.icon,
+                           url_path=None if p.default else p.key, default=p.default)
+            for p in pages
+        }
+        st.session_state[_NAV_KEY] = st_pages
+        chosen = st.navigation(list(st_pages.values()), position="hidden")
+        spec = next((by_key[k] for k, sp in st_pages.items() if sp is chosen), home)
+        legacy = _query_param("tile")
+        if spec.default and legacy in by_key and by_key[legacy].tile:
+            st.switch_page(st_pages[legacy])
+        return spec
+
+    tile = _query_param("tile")
+    if tile in by_key and by_key[tile].tile and by_key[tile].section == section:
+        return by_key[tile]
+    return next((p for p in pages if p.section == section and not p.tile), home)
+
+
+def run_page(spec: PageSpec):
+    """Ejecuta solo la página elegida."""
+    spec.render()
+
+
+def switch_to(key: str):
+    """Navega a la página `key` (ruta propia o, sin st.navigation, rerun con la sección/tile)."""
+    st_pages = st.session_state.get(_NAV_KEY) or {}
+    if HAS_NAVIGATION and key in st_pages:
+        st.switch_page(st_pages[key])
+    st.rerun()
+
+
+def go_home():
+    """Vuelve a la página de inicio (botones «Volver» de las vistas)."""
+    st.session_state["home_tile"] = ""
+    switch_to(st.session_state.get(_HOME_KEY, ""))
+
+
+def page_href(spec: PageSpec, **params) -> str:
+    """href de un <a> hacia la página (recarga completa; conserva auth/u en la URL)."""
+    qs = urlencode({k: v for k, v in params.items() if v is not None}, quote_via=quote)
+    if HAS_NAVIGATION:
+        path = "./" if spec.default else f"./{spec.key}"
+        return f"{path}?{qs}" if qs else path
+    if spec.tile:
+        qs = f"{qs}&tile={spec.key}" if qs else f"tile={spec.key}"
+    return f"?{qs}" if qs else "?"
@@ -0,0 +1,163 @@
+# utils/static_assets.py
+from __future__ import annotations
+
+import base64
+import hashlib
+import mimetypes
+import os
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable
+
+import streamlit as st
+
+# Streamlit sirve ./static (junto a gestion_app.py) en app/static/ con server.enableStaticServing
+STATIC_ROOT = Path("static")
+_OUT_DIR = STATIC_ROOT / "assets"  # generado al arrancar (ignorado en git)
+_URL_PREFIX = "app/static/assets/"
+
+_IMG_SUFFIXES = {".png", ".jpg", ".jpeg"}
+
+# Banners de las páginas: (ruta, kwargs de asset_url). Mismos kwargs al precalentar y al pintar.
+BANNERS = {
+    "encabezado": ("assets/ENCABEZADO.png", {"width": 1400}),
+    "nueva_tarea": ("assets/NUEVA_TAREA.png", {"width": 480}),
+    "tareas_recientes": ("assets/TAREAS_RECIENTES.png", {"width": 480}),
+    "hero_video": ("assets/hero.mp4", {"webp": False}),
+}
+
+# (ruta, ancho, webp) -> (firma del archivo, url); caché de proceso, compartida por sesiones
+_ASSET_LOCK = threading.Lock()
+_ASSET_CACHE: dict[tuple, tuple[tuple, str]] = {}
+
+
+def _pil_image():
+    """
+    PIL.Image, importado recién al generar la primera variante (no en la página de login).
+    Pillow viene con Streamlit; si faltara, solo se sirven los originales (sin WebP/redimensionado).
+    """
+    try:
+        from PIL import Image
+    except Exception:
+        return None
+    return Image
+
+
+def _file_sig(p: Path) -> tuple | None:
+    try:
+        s = p.stat()
+        return (s.st_mtime_ns, s.st_size)
+    except OSError:
+        return None
+
+
+def _static_enabled() -> bool:
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def _write_atomic(out: Path, data: bytes):
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, out)
+
+
+def _publish(src: Path, width: int | None, webp: bool) -> str | None:
+    """
+    Copia (o genera la variante de) `src` en static/assets con el hash del contenido en el nombre.
+    Devuelve la URL, o None si la variante no se puede generar (sin Pillow / no es imagen).
+    """
+    variant = bool(width) or webp
+    Image = _pil_image() if variant else None
+    if variant and (Image is None or src.suffix.lower() not in _IMG_SUFFIXES):
+        return None
+
+    data = src.read_bytes()
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    tag = f".w{width}" if width else ""
+    suffix = ".webp" if webp else src.suffix.lower()
+    out = _OUT_DIR / f"{src.stem}.{digest}{tag}{suffix}"
+
+    if not out.exists():
+        _OUT_DIR.mkdir(parents=True, exist_ok=True)
+        if not variant:
+            _write_atomic(out, data)
+        else:
+            img = Image.open(BytesIO(data))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            if width and img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            buf = BytesIO()
+            if webp:
+                img.save(buf, format="WEBP", quality=85, method=4)
+            else:
+                img.save(buf, format=(Image.registered_extensions().get(src.suffix.lower()) or "PNG"), optimize=True)
+            _write_atomic(out, buf.getvalue())
+    return _URL_PREFIX + out.name
+
+
+def _data_uri(src: Path) -> str:
+    mime = mimetypes.guess_type(src.name)[0] or "application/octet-stream"
+    return f"data:{mime};base64,{base64.b64encode(src.read_bytes()).decode('utf-8')}"
+
+
+def asset_url(path: str | Path, width: int | None = None, webp: bool = True) -> str:
+    """
+    URL estable y cacheable del asset (nombre con hash → el navegador lo descarga una vez).
+    - Variante WebP/redimensionada si es imagen y hay Pillow; si no, el original.
+    - Si el static serving está apagado, data URI (comportamiento anterior), codificado una sola vez.
+    - '' si el archivo no existe.
+    """
+    p = Path(path)
+    sig = _file_sig(p)
+    if sig is None:
+        return ""
+    key = (str(p), width, webp)
+    hit = _ASSET_CACHE.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+
+    with _ASSET_LOCK:
+        hit = _ASSET_CACHE.get(key)
+        if hit is not None and hit[0] == sig:
+            return hit[1]
+        url = None
+        if _static_enabled():
+            try:
+                url = _publish(p, width, webp) or _publish(p, None, False)
+            except Exception:
+                url = None
+        if not url:
+            try:
+                url = _data_uri(p)
+            except OSError:
+                url = ""
+        _ASSET_CACHE[key] = (sig, url)
+    return url
+
+
+def first_asset_url(candidates: Iterable[str | Path], **kwargs) -> str:
+    """asset_url del primer archivo existente de `candidates` ('' si ninguno)."""
+    for c in candidates:
+        if Path(c).exists():
+            return asset_url(c, **kwargs)
+    return ""
+
+
+def banner_url(name: str) -> str:
+    """URL del banner registrado en BANNERS ('' si no existe)."""
+    path, kwargs = BANNERS[name]
+    return asset_url(path, **kwargs)
+
+
+def warm_assets(specs: Iterable[tuple] | None = None):
+    """Genera al arrancar las variantes usadas por las páginas (por defecto, BANNERS)."""
+    for path, kwargs in (specs if specs is not None else BANNERS.values()):
+        try:
+            asset_url(path, **(kwargs or {}))
+        except Exception:
+            pass